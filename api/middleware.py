@@ -0,0 +1,47 @@
+import time
+
+from utils.metrics import (
+    REQUESTS_IN_FLIGHT,
+    REQUESTS,
+    REQUEST_DURATION,
+    set_request_scope,
+    reset_request_scope,
+    current_route,
+)
+
+
+class MetricsMiddleware:
+    """Records in-flight requests and the duration and status of every HTTP request by route.
+
+    Written as plain ASGI middleware, it neither buffers bodies nor runs the endpoint in another task, streamed
+    responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        token = set_request_scope(scope)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = current_route()
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_DURATION.observe(elapsed, scope['method'], route)
+            REQUESTS.inc(scope['method'], route, str(status_code))
+            reset_request_scope(token)
@@ -1,6 +1,12 @@
 from datetime import datetime
+from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+MAX_BULK_ITEMS = 100000
+MAX_PAGE_SIZE = 10000
+# half the circumference of the earth, a larger radius covers the whole planet anyway
+MAX_SEARCH_RADIUS_KM = 20038
 
 
 class LocationByIPRequestModel(BaseModel):
@@ -11,11 +17,83 @@ class LocationByURLRequestModel(BaseModel):
     url: str
 
 
+class LocationsByIPsRequestModel(BaseModel):
+    ips: list[str] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class LocationsByURLsRequestModel(BaseModel):
+    urls: list[str] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class LocationsForIPsRequestModel(LocationsByIPsRequestModel):
+    latest: int | None = Field(default=None, ge=1)
+
+
+class LocationsForURLsRequestModel(LocationsByURLsRequestModel):
+    latest: int | None = Field(default=None, ge=1)
+
+
 class Location(BaseModel):
     latitude: float
     longitude: float
     timestamp: datetime
 
 
+class LocationPageQueryModel(BaseModel):
+    limit: int | None = Field(default=None, ge=1, le=MAX_PAGE_SIZE)
+    since: datetime | None = None
+    until: datetime | None = None
+    cursor: str | None = None
+    order: Literal['asc', 'desc'] = 'asc'
+
+
 class LocationResponseModel(BaseModel):
     locations: list[Location]
+    next_cursor: str | None = None
+
+
+class IPLocationModel(Location):
+    ip: str
+
+
+class IPLocationsResponseModel(BaseModel):
+    locations: list[IPLocationModel]
+    next_cursor: str | None = None
+
+
+class LocationsByKeyResponseModel(BaseModel):
+    locations: dict[str, list[Location]]
+
+
+class NearbyLocationModel(BaseModel):
+    key: str
+    latitude: float
+    longitude: float
+    timestamp: datetime
+    distance_km: float
+
+
+class NearbyLocationsResponseModel(BaseModel):
+    locations: list[NearbyLocationModel]
+
+
+class BulkItemResultModel(BaseModel):
+    key: str
+    success: bool
+    error: str | None = None
+
+
+class BulkResultResponseModel(BaseModel):
+    results: list[BulkItemResultModel]
+
+
+class ImportErrorModel(BaseModel):
+    line: int
+    error: str
+
+
+class ImportSummaryResponseModel(BaseModel):
+    imported: int
+    failed: int
+    errors: list[ImportErrorModel]
+    aborted: str | None = None
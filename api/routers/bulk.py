@@ -0,0 +1,201 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, status, HTTPException
+from loguru import logger
+
+from api.models.models import (
+    LocationsByIPsRequestModel,
+    LocationsByURLsRequestModel,
+    BulkResultResponseModel,
+    BulkItemResultModel,
+    LocationsForIPsRequestModel,
+    LocationsForURLsRequestModel,
+    LocationsByKeyResponseModel,
+)
+from api.responses import RowsJSONResponse, location_dicts
+from api.routers.dependencies import get_database, get_location_provider, get_dns_resolver, get_refresh_scheduler
+from geolocation.dns_resolver import CachingDNSResolver
+from geolocation.location_provider import LocationProvider
+from geolocation.refresh_scheduler import RefreshScheduler
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.tables import IPLocation, HostnameLocation
+from ipstack_client.rate_limiter import lookup_priority, BULK
+from utils.metrics import stage
+from utils.utils import get_hostname_of_url
+
+DATABASE_CHUNK_SIZE = 5000
+
+router = APIRouter()
+
+
+async def add_locations(
+    database: DatabaseConnector,
+    location_provider: LocationProvider,
+    table,
+    hosts: list[str],
+    timestamp: datetime,
+    resolved_ips: dict[str, str] | None = None,
+) -> dict[str, str]:
+    """Resolves and stores locations of `hosts`, returning an error message for every host that failed.
+
+    Hosts found in `resolved_ips` are located by their IP address, which is stored in their rows.
+    """
+    lookup_keys = {host: resolved_ips.get(host, host) for host in hosts} if resolved_ips is not None else None
+    try:
+        # interactive lookups of the single location endpoints go first when ipstack requests are rate limited
+        with lookup_priority(BULK):
+            if lookup_keys is None:
+                locations = await location_provider.get_locations(hosts)
+            else:
+                locations_by_key = await location_provider.get_locations(list(dict.fromkeys(lookup_keys.values())))
+                locations = {host: locations_by_key[key] for host, key in lookup_keys.items()}
+    except Exception as error:
+        logger.error(f'Error while retrieving {len(hosts)} locations from ipstack: {error}')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while retrieving locations from ipstack'
+        )
+
+    errors = {}
+    rows = []
+    for host, location in locations.items():
+        if isinstance(location, Exception):
+            logger.error(f'Error while retrieving {host} location from ipstack: {location}')
+            errors[host] = 'Error while retrieving location from ipstack'
+        elif resolved_ips is None:
+            rows.append((host, location.latitude, location.longitude, timestamp))
+        else:
+            rows.append((host, location.latitude, location.longitude, timestamp, resolved_ips.get(host)))
+
+    for i in range(0, len(rows), DATABASE_CHUNK_SIZE):
+        chunk = rows[i : i + DATABASE_CHUNK_SIZE]
+        try:
+            await database.insert_many(table, chunk, chunk_size=DATABASE_CHUNK_SIZE)
+        except Exception as error:
+            logger.error(f'Error while inserting {len(chunk)} locations in database: {error}')
+            errors.update({row[0]: 'Error while inserting location in database' for row in chunk})
+
+    return errors
+
+
+@router.post(
+    "/add-locations-for-ips", status_code=status.HTTP_201_CREATED, responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}}
+)
+async def add_locations_for_ips(
+    request: LocationsByIPsRequestModel,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    location_provider: Annotated[LocationProvider, Depends(get_location_provider)],
+) -> BulkResultResponseModel:
+    timestamp = datetime.now(timezone.utc)
+    ips = list(dict.fromkeys(request.ips))
+
+    errors = await add_locations(database, location_provider, IPLocation, ips, timestamp)
+
+    return BulkResultResponseModel(
+        results=[BulkItemResultModel(key=ip, success=ip not in errors, error=errors.get(ip)) for ip in ips]
+    )
+
+
+@router.post(
+    "/add-locations-for-urls",
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def add_locations_for_urls(
+    request: LocationsByURLsRequestModel,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    location_provider: Annotated[LocationProvider, Depends(get_location_provider)],
+    dns_resolver: Annotated[CachingDNSResolver | None, Depends(get_dns_resolver)],
+) -> BulkResultResponseModel:
+    timestamp = datetime.now(timezone.utc)
+    urls = list(dict.fromkeys(request.urls))
+
+    errors = {}
+    urls_by_hostname = defaultdict(list)
+    for url in urls:
+        try:
+            hostname = get_hostname_of_url(url)
+        except Exception as error:
+            logger.error(f'Error while retrieving hostname from url {url} error: {error}')
+            hostname = None
+        if hostname is None:
+            errors[url] = 'Error while retrieving hostname from url'
+        else:
+            urls_by_hostname[hostname].append(url)
+
+    if urls_by_hostname:
+        resolved_ips = None
+        if dns_resolver is not None:
+            with stage('dns'):
+                resolutions = await dns_resolver.resolve_many(list(urls_by_hostname))
+            # hostnames that do not resolve are located by hostname
+            resolved_ips = {hostname: ip for hostname, ip in resolutions.items() if isinstance(ip, str)}
+        hostname_errors = await add_locations(
+            database, location_provider, HostnameLocation, list(urls_by_hostname), timestamp, resolved_ips
+        )
+        for hostname, error in hostname_errors.items():
+            errors.update({url: error for url in urls_by_hostname[hostname]})
+
+    return BulkResultResponseModel(
+        results=[BulkItemResultModel(key=url, success=url not in errors, error=errors.get(url)) for url in urls]
+    )
+
+
+@router.post(
+    "/get-locations-for-ips",
+    response_model=LocationsByKeyResponseModel,
+    responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def get_locations_for_ips(
+    request: LocationsForIPsRequestModel,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+) -> RowsJSONResponse:
+    if refresh_scheduler is not None:
+        for ip in request.ips:
+            refresh_scheduler.record_access(IPLocation, ip)
+    try:
+        results = await database.select_by_ips(request.ips, latest=request.latest)
+    except Exception as error:
+        logger.error(f'Database error: {error}')
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
+
+    return RowsJSONResponse({'locations': {ip: location_dicts(rows) for ip, rows in results.items()}})
+
+
+@router.post(
+    "/get-locations-for-urls",
+    response_model=LocationsByKeyResponseModel,
+    responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def get_locations_for_urls(
+    request: LocationsForURLsRequestModel,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+) -> RowsJSONResponse:
+    hostnames = {}
+    for url in request.urls:
+        try:
+            hostnames[url] = get_hostname_of_url(url)
+        except Exception as error:
+            logger.error(f'Error while retrieving hostname from url {url} error: {error}')
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while retrieving hostname from url'
+            )
+
+    if refresh_scheduler is not None:
+        for hostname in hostnames.values():
+            if hostname is not None:
+                refresh_scheduler.record_access(HostnameLocation, hostname)
+    try:
+        results = await database.select_by_hostnames(
+            [hostname for hostname in hostnames.values() if hostname is not None], latest=request.latest
+        )
+    except Exception as error:
+        logger.error(f'Database error: {error}')
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
+
+    return RowsJSONResponse(
+        {'locations': {url: location_dicts(results.get(hostname, [])) for url, hostname in hostnames.items()}}
+    )
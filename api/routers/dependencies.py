@@ -1,5 +1,16 @@
+from datetime import datetime, timedelta
+from typing import Annotated, Literal
+
+from fastapi import Query
+
+from api.models.models import LocationPageQueryModel, MAX_PAGE_SIZE
+from geolocation.dns_resolver import DNSResolverSingleton
+from geolocation.location_provider import LocationProviderSingleton
+from geolocation.refresh_scheduler import RefreshSchedulerSingleton
 from infrastructure.database.connector import DatabaseSingleton
+from infrastructure.database.ingest_buffer import IngestBufferSingleton
 from ipstack_client.ipstack_client import IPStackAPIClientSingleton
+from utils.utils import get_float_environment_variable
 
 
 async def get_database():
@@ -8,3 +19,33 @@ async def get_database():
 
 async def get_ip_stack_client():
     return IPStackAPIClientSingleton.get_instance()
+
+
+async def get_location_provider():
+    return LocationProviderSingleton.get_instance()
+
+
+async def get_ingest_buffer():
+    return IngestBufferSingleton.get_instance()
+
+
+async def get_dns_resolver():
+    return DNSResolverSingleton.get_instance()
+
+
+async def get_refresh_scheduler():
+    return RefreshSchedulerSingleton.get_instance()
+
+
+async def get_location_freshness_window() -> timedelta:
+    return timedelta(seconds=get_float_environment_variable('LOCATION_FRESHNESS_SECONDS', 0.0))
+
+
+async def get_location_page_query(
+    limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    order: Literal['asc', 'desc'] = 'asc',
+) -> LocationPageQueryModel:
+    return LocationPageQueryModel(limit=limit, since=since, until=until, cursor=cursor, order=order)
@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from api.routers.dependencies import get_database
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.tables import LOCATION_TABLES
+from utils.location_export import encode_locations, MEDIA_TYPES
+from utils.utils import to_utc
+
+router = APIRouter()
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={status.HTTP_200_OK: {'content': {media_type: {} for media_type in MEDIA_TYPES.values()}}},
+)
+async def export_locations(
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    table: Literal['ip', 'url'] = 'ip',
+    format: Literal['ndjson', 'csv'] = 'ndjson',
+    key: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    gzip: bool = False,
+):
+    location_table = LOCATION_TABLES[table]
+
+    async def stream():
+        try:
+            partitions = database.stream_locations(
+                location_table,
+                key=key,
+                since=to_utc(since) if since is not None else None,
+                until=to_utc(until) if until is not None else None,
+            )
+            async for chunk in encode_locations(partitions, location_table.key_field, format, compress=gzip):
+                yield chunk
+        except Exception as error:
+            # the response has already started, the client sees a truncated body
+            logger.error(f'Error while exporting {location_table.__tablename__}: {error}')
+            raise
+
+    headers = {'Content-Disposition': f'attachment; filename="{location_table.__tablename__}.{format}"'}
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(stream(), media_type=MEDIA_TYPES[format], headers=headers)
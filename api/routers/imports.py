@@ -0,0 +1,66 @@
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Depends, status, HTTPException, Request, Response
+from loguru import logger
+
+from api.models.models import ImportSummaryResponseModel, ImportErrorModel
+from api.routers.dependencies import get_database
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.tables import LOCATION_TABLES
+from utils.location_import import import_locations
+
+IMPORT_BATCH_SIZE = 5000
+
+router = APIRouter()
+
+
+@router.post(
+    "/import",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_200_OK: {'model': ImportSummaryResponseModel},
+        status.HTTP_400_BAD_REQUEST: {},
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {},
+    },
+    openapi_extra={
+        'requestBody': {
+            'required': True,
+            'content': {'application/x-ndjson': {}, 'text/csv': {}},
+        }
+    },
+)
+async def import_locations_stream(
+    request: Request,
+    response: Response,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    table: Literal['ip', 'url'] = 'ip',
+    format: Literal['ndjson', 'csv'] = 'ndjson',
+) -> ImportSummaryResponseModel:
+    """Stores pre-resolved locations streamed in the request body, without querying ipstack.
+
+    The body is NDJSON or CSV (with a header line) of `ip` or `hostname`, `latitude`, `longitude` and
+    `timestamp`, optionally gzipped. An import stopped by an invalid body answers 400 when nothing was stored and
+    200 with the summary of the stored rows and the error in `aborted` otherwise.
+    """
+    location_table = LOCATION_TABLES[table]
+    try:
+        summary = await import_locations(
+            database, location_table, request.stream(), format, batch_size=IMPORT_BATCH_SIZE
+        )
+    except Exception as error:
+        logger.error(f'Error while importing {location_table.__tablename__}: {error}')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while importing locations'
+        )
+
+    if summary.aborted is not None:
+        if not summary.imported:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=summary.aborted)
+        response.status_code = status.HTTP_200_OK
+
+    return ImportSummaryResponseModel(
+        imported=summary.imported,
+        failed=summary.failed,
+        errors=[ImportErrorModel(line=line, error=error) for line, error in summary.errors],
+        aborted=summary.aborted,
+    )
@@ -0,0 +1,158 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Response
+
+from api.routers.dependencies import (
+    get_database,
+    get_ip_stack_client,
+    get_ingest_buffer,
+    get_dns_resolver,
+    get_refresh_scheduler,
+)
+from geolocation.dns_resolver import CachingDNSResolver
+from geolocation.refresh_scheduler import RefreshScheduler
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.ingest_buffer import IngestBuffer
+from ipstack_client.cache import CachedLocationClient
+from ipstack_client.ipstack_client import IPStackAPIClient, find_layer
+from ipstack_client.rate_limiter import RateLimiter
+from ipstack_client.resilience import ResilientLocationClient
+from ipstack_client.shared_cache import SharedCacheLocationClient
+from utils.metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, render_metrics
+
+router = APIRouter()
+
+
+def cache_metrics(stats_by_cache: dict) -> list:
+    lookups = Counter('ip_locator_cache_lookups_total', 'Cache lookups by result', ('cache', 'result'))
+    evictions = Counter('ip_locator_cache_evictions_total', 'Entries evicted from a full cache', ('cache',))
+    size = Gauge('ip_locator_cache_entries', 'Entries in a cache', ('cache',))
+    ratio = Gauge('ip_locator_cache_hit_ratio', 'Share of lookups answered from a cache since startup', ('cache',))
+    for cache, stats in stats_by_cache.items():
+        # the shared cache keeps no errors and does not coalesce lookups
+        negative_hits = getattr(stats, 'negative_hits', 0)
+        coalesced = getattr(stats, 'coalesced', 0)
+        lookups.inc(cache, 'hit', amount=stats.hits)
+        lookups.inc(cache, 'negative_hit', amount=negative_hits)
+        lookups.inc(cache, 'coalesced', amount=coalesced)
+        lookups.inc(cache, 'miss', amount=stats.misses)
+        evictions.inc(cache, amount=stats.evictions)
+        size.set(stats.size, cache)
+        # coalesced lookups wait for an upstream call, they do not count as hits
+        answered = stats.hits + negative_hits
+        ratio.set(answered / (answered + stats.misses + coalesced) if answered else 0.0, cache)
+    return [lookups, evictions, size, ratio]
+
+
+def resilience_metrics(upstream: str, stats) -> list:
+    events = Counter(
+        'ip_locator_upstream_resilience_events_total',
+        'Retries, denied retries, hedged requests, attempt timeouts and requests rejected by the circuit breaker',
+        ('upstream', 'event'),
+    )
+    for event in ('retries', 'retries_denied', 'hedges', 'hedges_won', 'timeouts', 'rejected', 'circuit_opened'):
+        events.inc(upstream, event, amount=getattr(stats, event))
+    circuit_open = Gauge(
+        'ip_locator_upstream_circuit_open', '1 while the circuit breaker fails requests fast', ('upstream',)
+    )
+    circuit_open.set(1 if stats.circuit_state == 'open' else 0, upstream)
+    budget = Gauge('ip_locator_upstream_retry_budget', 'Retries the retry budget currently allows', ('upstream',))
+    budget.set(stats.retry_budget, upstream)
+    return [events, circuit_open, budget]
+
+
+def rate_limiter_metrics(upstream: str, stats) -> list:
+    tokens = Gauge('ip_locator_upstream_rate_limit_tokens', 'Requests the rate limiter allows at once', ('upstream',))
+    tokens.set(stats.tokens, upstream)
+    queue_depth = Gauge(
+        'ip_locator_upstream_rate_limit_queue_depth', 'Requests waiting for the rate limiter', ('upstream', 'priority')
+    )
+    for priority, depth in stats.queue_depth.items():
+        queue_depth.set(depth, upstream, priority)
+    rejected = Counter(
+        'ip_locator_upstream_rate_limit_rejections_total',
+        'Requests failed by the rate limiter, after waiting too long or with the monthly quota used up',
+        ('upstream', 'reason'),
+    )
+    rejected.inc(upstream, 'timeout', amount=stats.timed_out)
+    rejected.inc(upstream, 'quota', amount=stats.quota_exceeded)
+    used = Gauge('ip_locator_upstream_monthly_lookups', 'Lookups counted against the monthly quota', ('upstream',))
+    used.set(stats.monthly_used, upstream)
+    metrics = [tokens, queue_depth, rejected, used]
+    if stats.monthly_remaining is not None:
+        remaining = Gauge(
+            'ip_locator_upstream_monthly_quota_remaining', 'Lookups left of the monthly quota', ('upstream',)
+        )
+        remaining.set(stats.monthly_remaining, upstream)
+        metrics.append(remaining)
+    return metrics
+
+
+def refresh_metrics(stats) -> list:
+    lookups = Counter(
+        'ip_locator_refresh_lookups_total', 'Stale locations looked up again by outcome', ('table', 'outcome')
+    )
+    for table, count in stats.refreshed.items():
+        lookups.inc(table, 'refreshed', amount=count)
+    for table, count in stats.failed.items():
+        lookups.inc(table, 'failed', amount=count)
+    stale = Gauge(
+        'ip_locator_refresh_stale_keys', 'Keys whose newest location is older than the refresh age', ('table',)
+    )
+    lag = Gauge(
+        'ip_locator_refresh_lag_seconds', 'Time the most overdue key has been waiting for its refresh', ('table',)
+    )
+    for table, count in stats.stale_keys.items():
+        stale.set(count, table)
+        lag.set(stats.lag_seconds[table], table)
+    leader = Gauge('ip_locator_refresh_leader', '1 in the worker process running the refreshes')
+    leader.set(1 if stats.leader else 0)
+    return [lookups, stale, lag, leader]
+
+
+def database_pool_metrics(database: DatabaseConnector) -> list:
+    pool_status = database.pool_status()
+    if 'size' not in pool_status:
+        return []
+    connections = Gauge('ip_locator_database_pool_connections', 'Pooled database connections by state', ('state',))
+    connections.set(pool_status['checked_in'], 'idle')
+    connections.set(pool_status['checked_out'], 'checked_out')
+    saturation = Gauge('ip_locator_database_pool_saturation', 'Share of the pool capacity checked out')
+    saturation.set(pool_status['saturation'])
+    return [connections, saturation]
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    ip_stack_client: Annotated[IPStackAPIClient, Depends(get_ip_stack_client)],
+    ingest_buffer: Annotated[IngestBuffer | None, Depends(get_ingest_buffer)],
+    dns_resolver: Annotated[CachingDNSResolver | None, Depends(get_dns_resolver)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+):
+    stats_by_cache = {}
+    cache = find_layer(ip_stack_client, CachedLocationClient)
+    if cache is not None:
+        stats_by_cache['ipstack'] = cache.stats()
+    shared_cache = find_layer(ip_stack_client, SharedCacheLocationClient)
+    if shared_cache is not None:
+        stats_by_cache['ipstack_shared'] = shared_cache.stats()
+    if dns_resolver is not None:
+        stats_by_cache['dns'] = dns_resolver.stats()
+    collected = cache_metrics(stats_by_cache) if stats_by_cache else []
+    resilient_client = find_layer(ip_stack_client, ResilientLocationClient)
+    if resilient_client is not None:
+        collected += resilience_metrics('ipstack', resilient_client.stats())
+    raw_client = find_layer(ip_stack_client, IPStackAPIClient)
+    if raw_client is not None and isinstance(raw_client.rate_limiter, RateLimiter):
+        collected += rate_limiter_metrics('ipstack', raw_client.rate_limiter.stats())
+    if isinstance(database, DatabaseConnector):
+        collected += database_pool_metrics(database)
+    if ingest_buffer is not None:
+        queue_depth = Gauge('ip_locator_ingest_buffer_queue_depth', 'Locations waiting to be stored')
+        queue_depth.set(ingest_buffer.stats().queue_depth)
+        collected.append(queue_depth)
+    if refresh_scheduler is not None:
+        collected += refresh_metrics(refresh_scheduler.stats())
+
+    return Response(render_metrics(REGISTRY.metrics() + collected), media_type=CONTENT_TYPE)
@@ -1,36 +1,170 @@
-from datetime import datetime, timezone
-from typing import Annotated
+import base64
+import ipaddress
+import json
+from datetime import datetime, timezone, timedelta
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi import APIRouter, Depends, status, HTTPException, Response, Query
 from loguru import logger
 
-from api.models.models import LocationByIPRequestModel, LocationByURLRequestModel, LocationResponseModel, Location
-from api.routers.dependencies import get_database, get_ip_stack_client
+from api.models.models import (
+    LocationByIPRequestModel,
+    LocationByURLRequestModel,
+    LocationResponseModel,
+    Location,
+    LocationPageQueryModel,
+    NearbyLocationsResponseModel,
+    IPLocationsResponseModel,
+    NearbyLocationModel,
+    MAX_PAGE_SIZE,
+    MAX_SEARCH_RADIUS_KM,
+)
+from api.responses import RowsJSONResponse, location_dict, location_dicts
+from api.routers.dependencies import (
+    get_database,
+    get_ip_stack_client,
+    get_location_provider,
+    get_location_freshness_window,
+    get_ingest_buffer,
+    get_location_page_query,
+    get_dns_resolver,
+    get_refresh_scheduler,
+)
+from geolocation.dns_resolver import CachingDNSResolver
+from geolocation.location_provider import LocationProvider
+from geolocation.refresh_scheduler import RefreshScheduler
 from infrastructure.database.connector import DatabaseConnector
-from infrastructure.database.tables import IPLocation, HostnameLocation
-from ipstack_client.ipstack_client import IPStackAPIClient
-from utils.utils import get_hostname_of_url
+from infrastructure.database.ingest_buffer import IngestBuffer
+from infrastructure.database.tables import IPLocation, HostnameLocation, LOCATION_TABLES
+from ipstack_client.cache import CachedLocationClient
+from ipstack_client.ipstack_client import IPStackAPIClient, find_layer
+from ipstack_client.rate_limiter import RateLimiter
+from ipstack_client.resilience import ResilientLocationClient
+from ipstack_client.shared_cache import SharedCacheLocationClient
+from model.base.ip_locator_exception import IPLocatorIngestBufferFullException
+from utils.metrics import stage
+from utils.utils import get_hostname_of_url, to_utc
 
 router = APIRouter()
 
 
+async def get_fresh_location(
+    database: DatabaseConnector, table, key: str, timestamp: datetime, freshness_window: timedelta
+):
+    """Returns the location of `key` stored in the database if it is younger than `freshness_window`.
+
+    The add endpoints then answer 200 with the stored location instead of resolving and inserting it again. A copy
+    stamped with the time of the request would keep the location fresh for as long as it is added.
+    """
+    if freshness_window <= timedelta(0):
+        return None
+    try:
+        if table is IPLocation:
+            return await database.select_latest_by_ip(key, since=timestamp - freshness_window)
+        return await database.select_latest_by_hostname(key, since=timestamp - freshness_window)
+    except Exception as error:
+        logger.warning(f'Error while looking up stored location of {key} in database: {error}')
+        return None
+
+
+async def resolve_hostname(dns_resolver: CachingDNSResolver | None, hostname: str) -> str | None:
+    """Returns the IP address `hostname` resolves to, or None to locate it by hostname."""
+    if dns_resolver is None:
+        return None
+    try:
+        with stage('dns'):
+            return await dns_resolver.resolve(hostname)
+    except Exception as error:
+        logger.warning(f'Error while resolving hostname {hostname}, locating it by hostname: {error}')
+        return None
+
+
+async def put_in_ingest_buffer(ingest_buffer: IngestBuffer, entity) -> Response:
+    try:
+        await ingest_buffer.put(entity)
+    except IPLocatorIngestBufferFullException as error:
+        logger.error(f'Error while queueing {entity.__tablename__} location: {error}')
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f'Too many locations waiting to be stored'
+        )
+    except Exception as error:
+        logger.error(f'Error while queueing {entity.__tablename__} location: {error}')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while queueing location for database'
+        )
+
+    return Response(status_code=status.HTTP_202_ACCEPTED)
+
+
 @router.get("/healthcheck", include_in_schema=False)
 async def healthcheck():
     return {'message': 'OK'}
 
 
+@router.get("/healthcheck/database", include_in_schema=False)
+async def database_healthcheck(database: Annotated[DatabaseConnector, Depends(get_database)]):
+    try:
+        latency = await database.check_health()
+    except Exception as error:
+        logger.error(f'Database health check failed: {error}')
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f'Database unavailable')
+    return {**database.pool_status(), 'latency_seconds': round(latency, 6)}
+
+
+@router.get("/stats", include_in_schema=False)
+async def stats(
+    ip_stack_client: Annotated[IPStackAPIClient, Depends(get_ip_stack_client)],
+    ingest_buffer: Annotated[IngestBuffer | None, Depends(get_ingest_buffer)],
+    dns_resolver: Annotated[CachingDNSResolver | None, Depends(get_dns_resolver)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+):
+    statistics = {}
+    cache = find_layer(ip_stack_client, CachedLocationClient)
+    if cache is not None:
+        statistics['ipstack_cache'] = cache.stats().to_dict()
+    shared_cache = find_layer(ip_stack_client, SharedCacheLocationClient)
+    if shared_cache is not None:
+        statistics['ipstack_shared_cache'] = shared_cache.stats().to_dict()
+    resilient_client = find_layer(ip_stack_client, ResilientLocationClient)
+    if resilient_client is not None:
+        statistics['ipstack_resilience'] = resilient_client.stats().to_dict()
+    raw_client = find_layer(ip_stack_client, IPStackAPIClient)
+    if raw_client is not None and isinstance(raw_client.rate_limiter, RateLimiter):
+        statistics['ipstack_rate_limiter'] = raw_client.rate_limiter.stats().to_dict()
+    if ingest_buffer is not None:
+        statistics['ingest_buffer'] = ingest_buffer.stats().to_dict()
+    if dns_resolver is not None:
+        statistics['dns_cache'] = dns_resolver.stats().to_dict()
+    if refresh_scheduler is not None:
+        statistics['refresh'] = refresh_scheduler.stats().to_dict()
+    return statistics
+
+
 @router.post(
-    "/add-location-for-ip", status_code=status.HTTP_201_CREATED, responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}}
+    "/add-location-for-ip",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_200_OK: {'model': Location},
+        status.HTTP_202_ACCEPTED: {},
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {},
+    },
 )
 async def add_location_for_ip(
     request: LocationByIPRequestModel,
     database: Annotated[DatabaseConnector, Depends(get_database)],
-    ip_stack_client: Annotated[IPStackAPIClient, Depends(get_ip_stack_client)],
+    location_provider: Annotated[LocationProvider, Depends(get_location_provider)],
+    freshness_window: Annotated[timedelta, Depends(get_location_freshness_window)],
+    ingest_buffer: Annotated[IngestBuffer | None, Depends(get_ingest_buffer)],
 ):
     timestamp = datetime.now(timezone.utc)
 
+    stored = await get_fresh_location(database, IPLocation, request.ip, timestamp, freshness_window)
+    if stored is not None:
+        return RowsJSONResponse(location_dict(stored), status_code=status.HTTP_200_OK)
+
     try:
-        location_data = ip_stack_client.get_location(request.ip)
+        location_data = await location_provider.get_location(request.ip)
     except Exception as error:
         logger.error(f'Error while retrieving ip {request.ip} location from ipstack: {error}')
         raise HTTPException(
@@ -41,6 +175,9 @@ async def add_location_for_ip(
         ip=request.ip, latitude=location_data.latitude, longitude=location_data.longitude, timestamp=timestamp
     )
 
+    if ingest_buffer is not None:
+        return await put_in_ingest_buffer(ingest_buffer, ip_location)
+
     try:
         await database.insert(ip_location)
     except Exception as error:
@@ -53,12 +190,22 @@ async def add_location_for_ip(
 
 
 @router.post(
-    "/add-location-for-url", status_code=status.HTTP_201_CREATED, responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}}
+    "/add-location-for-url",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_200_OK: {'model': Location},
+        status.HTTP_202_ACCEPTED: {},
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {},
+    },
 )
 async def add_location_for_url(
     request: LocationByURLRequestModel,
     database: Annotated[DatabaseConnector, Depends(get_database)],
-    ip_stack_client: Annotated[IPStackAPIClient, Depends(get_ip_stack_client)],
+    location_provider: Annotated[LocationProvider, Depends(get_location_provider)],
+    freshness_window: Annotated[timedelta, Depends(get_location_freshness_window)],
+    ingest_buffer: Annotated[IngestBuffer | None, Depends(get_ingest_buffer)],
+    dns_resolver: Annotated[CachingDNSResolver | None, Depends(get_dns_resolver)],
 ):
     timestamp = datetime.now(timezone.utc)
 
@@ -69,18 +216,37 @@ async def add_location_for_url(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while retrieving hostname from url'
         )
-    try:
-        location_data = ip_stack_client.get_location(hostname)
-    except Exception as error:
-        logger.error(f'Error while retrieving url location {request.url} from ipstack: {error}')
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while retrieving location from ipstack'
-        )
+
+    stored = await get_fresh_location(database, HostnameLocation, hostname, timestamp, freshness_window)
+    if stored is not None:
+        return RowsJSONResponse(location_dict(stored), status_code=status.HTTP_200_OK)
+
+    resolved_ip = await resolve_hostname(dns_resolver, hostname)
+    # a fresh location of the resolved ip is as good as one of the hostname
+    location_data = None
+    if resolved_ip is not None:
+        location_data = await get_fresh_location(database, IPLocation, resolved_ip, timestamp, freshness_window)
+    if location_data is None:
+        try:
+            location_data = await location_provider.get_location(resolved_ip or hostname)
+        except Exception as error:
+            logger.error(f'Error while retrieving url location {request.url} from ipstack: {error}')
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f'Error while retrieving location from ipstack',
+            )
 
     hostname_location = HostnameLocation(
-        hostname=hostname, latitude=location_data.latitude, longitude=location_data.longitude, timestamp=timestamp
+        hostname=hostname,
+        latitude=location_data.latitude,
+        longitude=location_data.longitude,
+        timestamp=timestamp,
+        resolved_ip=resolved_ip,
     )
 
+    if ingest_buffer is not None:
+        return await put_in_ingest_buffer(ingest_buffer, hostname_location)
+
     try:
         await database.insert(hostname_location)
     except Exception as error:
@@ -109,6 +275,34 @@ async def delete_location_for_ip(ip: str, database: Annotated[DatabaseConnector,
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+def validate_cidr(cidr: str) -> None:
+    try:
+        ipaddress.ip_network(cidr.strip(), strict=False)
+    except ValueError as error:
+        logger.error(f'Invalid network {cidr}: {error}')
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid network')
+
+
+@router.delete(
+    "/delete-locations-for-cidr",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={status.HTTP_400_BAD_REQUEST: {}, status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def delete_locations_for_cidr(cidr: str, database: Annotated[DatabaseConnector, Depends(get_database)]):
+    validate_cidr(cidr)
+    try:
+        deleted = await database.delete_locations_by_cidr(cidr)
+    except Exception as error:
+        logger.error(f'Error while deleting network {cidr} locations in database: {error}')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f'Error while deleting network locations in database',
+        )
+    logger.info(f'Deleted {deleted} locations of network {cidr}')
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @router.delete(
     "/delete-location-for-url",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -135,30 +329,172 @@ async def delete_location_for_url(url: str, database: Annotated[DatabaseConnecto
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@router.get("/get-location-for-ip", responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}})
+def encode_cursor(timestamp: datetime, db_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([timestamp.isoformat(), db_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        timestamp, db_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(db_id)
+    except Exception as error:
+        logger.error(f'Invalid cursor {cursor}: {error}')
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid cursor')
+
+
+async def select_location_page(
+    database: DatabaseConnector, table, key: str, page: LocationPageQueryModel
+) -> RowsJSONResponse:
+    after = decode_cursor(page.cursor) if page.cursor is not None else None
+    try:
+        select_page = database.select_by_ip if table is IPLocation else database.select_by_hostname
+        results = await select_page(
+            key,
+            # one more row than requested tells whether there is a next page
+            limit=page.limit + 1 if page.limit is not None else None,
+            since=to_utc(page.since) if page.since is not None else None,
+            until=to_utc(page.until) if page.until is not None else None,
+            after=after,
+            descending=page.order == 'desc',
+        )
+    except Exception as error:
+        logger.error(f'Database error: {error}')
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
+
+    next_cursor = None
+    if page.limit is not None and len(results) > page.limit:
+        results = results[: page.limit]
+        next_cursor = encode_cursor(results[-1].timestamp, results[-1].id)
+
+    return RowsJSONResponse({'locations': location_dicts(results), 'next_cursor': next_cursor})
+
+
+@router.get(
+    "/get-location-for-ip",
+    response_model=LocationResponseModel,
+    responses={status.HTTP_400_BAD_REQUEST: {}, status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
 async def get_location_for_ip(
-    ip: str, database: Annotated[DatabaseConnector, Depends(get_database)]
-) -> LocationResponseModel:
+    ip: str,
+    page: Annotated[LocationPageQueryModel, Depends(get_location_page_query)],
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+) -> RowsJSONResponse:
+    if refresh_scheduler is not None:
+        refresh_scheduler.record_access(IPLocation, ip)
+    return await select_location_page(database, IPLocation, ip, page)
+
+
+@router.get(
+    "/get-location-for-url",
+    response_model=LocationResponseModel,
+    responses={status.HTTP_400_BAD_REQUEST: {}, status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def get_location_for_url(
+    url: str,
+    page: Annotated[LocationPageQueryModel, Depends(get_location_page_query)],
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+) -> RowsJSONResponse:
     try:
-        results = await database.select_by_ip(ip)
+        hostname = get_hostname_of_url(url)
+    except Exception as error:
+        logger.error(f'Error while retrieving hostname from url {url} error: {error}')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while retrieving hostname from url'
+        )
+
+    if refresh_scheduler is not None and hostname is not None:
+        refresh_scheduler.record_access(HostnameLocation, hostname)
+    return await select_location_page(database, HostnameLocation, hostname, page)
+
+
+@router.get(
+    "/get-locations-for-cidr",
+    response_model=IPLocationsResponseModel,
+    responses={status.HTTP_400_BAD_REQUEST: {}, status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def get_locations_for_cidr(
+    cidr: str,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = 1000,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+) -> RowsJSONResponse:
+    """Lists locations of the IPs in a network, e.g. `10.0.0.0/8`, ordered by IP."""
+    validate_cidr(cidr)
+    after = None
+    if cursor is not None:
+        try:
+            ip, db_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            after = str(ip), int(db_id)
+        except Exception as error:
+            logger.error(f'Invalid cursor {cursor}: {error}')
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid cursor')
+    try:
+        results = await database.select_by_cidr(
+            cidr,
+            # one more row than requested tells whether there is a next page
+            limit=limit + 1,
+            since=to_utc(since) if since is not None else None,
+            until=to_utc(until) if until is not None else None,
+            after=after,
+        )
     except Exception as error:
         logger.error(f'Database error: {error}')
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
 
-    locations = LocationResponseModel(
-        locations=[
-            Location(latitude=result.latitude, longitude=result.longitude, timestamp=result.timestamp)
-            for result in results
-        ]
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = base64.urlsafe_b64encode(json.dumps([results[-1].ip, results[-1].id]).encode()).decode()
+
+    return RowsJSONResponse(
+        {
+            'locations': [
+                {'ip': ip, 'latitude': latitude, 'longitude': longitude, 'timestamp': timestamp}
+                for _, ip, latitude, longitude, timestamp in results
+            ],
+            'next_cursor': next_cursor,
+        }
     )
 
-    return locations
 
+@router.get(
+    "/get-latest-location-for-ip",
+    response_model=Location,
+    responses={status.HTTP_404_NOT_FOUND: {}, status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def get_latest_location_for_ip(
+    ip: str,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+) -> RowsJSONResponse:
+    if refresh_scheduler is not None:
+        refresh_scheduler.record_access(IPLocation, ip)
+    try:
+        result = await database.select_latest_by_ip(ip)
+    except Exception as error:
+        logger.error(f'Database error: {error}')
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
+
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'No location found for ip')
+
+    return RowsJSONResponse(location_dict(result))
 
-@router.get("/get-location-for-url", responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}})
-async def get_location_for_url(
-    url: str, database: Annotated[DatabaseConnector, Depends(get_database)]
-) -> LocationResponseModel:
+
+@router.get(
+    "/get-latest-location-for-url",
+    response_model=Location,
+    responses={status.HTTP_404_NOT_FOUND: {}, status.HTTP_500_INTERNAL_SERVER_ERROR: {}},
+)
+async def get_latest_location_for_url(
+    url: str,
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    refresh_scheduler: Annotated[RefreshScheduler | None, Depends(get_refresh_scheduler)],
+) -> RowsJSONResponse:
     try:
         hostname = get_hostname_of_url(url)
     except Exception as error:
@@ -167,17 +503,53 @@ async def get_location_for_url(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error while retrieving hostname from url'
         )
 
+    if refresh_scheduler is not None and hostname is not None:
+        refresh_scheduler.record_access(HostnameLocation, hostname)
+    try:
+        result = await database.select_latest_by_hostname(hostname)
+    except Exception as error:
+        logger.error(f'Database error: {error}')
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
+
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'No location found for url')
+
+    return RowsJSONResponse(location_dict(result))
+
+
+@router.get("/search-nearby", responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {}})
+async def search_nearby(
+    latitude: Annotated[float, Query(ge=-90, le=90)],
+    longitude: Annotated[float, Query(ge=-180, le=180)],
+    radius_km: Annotated[float, Query(gt=0, le=MAX_SEARCH_RADIUS_KM)],
+    database: Annotated[DatabaseConnector, Depends(get_database)],
+    table: Literal['ip', 'url'] = 'ip',
+    since: datetime | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = 100,
+) -> NearbyLocationsResponseModel:
+    """Lists the IPs or hostnames located within `radius_km` of a point, nearest first."""
     try:
-        results = await database.select_by_hostname(hostname)
+        results = await database.search_nearby(
+            LOCATION_TABLES[table],
+            latitude,
+            longitude,
+            radius_km,
+            since=to_utc(since) if since is not None else None,
+            limit=limit,
+        )
     except Exception as error:
         logger.error(f'Database error: {error}')
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Database error')
 
-    locations = LocationResponseModel(
+    return NearbyLocationsResponseModel(
         locations=[
-            Location(latitude=result.latitude, longitude=result.longitude, timestamp=result.timestamp)
-            for result in results
+            NearbyLocationModel(
+                key=key,
+                latitude=result_latitude,
+                longitude=result_longitude,
+                timestamp=timestamp,
+                distance_km=round(distance, 3),
+            )
+            for key, result_latitude, result_longitude, timestamp, distance in results
         ]
     )
-
-    return locations
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.results import latency_summary, make_report, add_report_arguments, finish_report
+from infrastructure.database.base import Base
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.profiles import DATABASE_PROFILES
+from infrastructure.database.tables import IPLocation
+
+
+def key_ips(keys: int) -> list[str]:
+    return [f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}' for i in range(keys)]
+
+
+async def measure(operation, iterations: int, items_per_operation: int = 1) -> dict:
+    """Runs `operation` `iterations` times one after another, throughput counts items per second."""
+    await operation()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        operation_start = time.perf_counter()
+        await operation()
+        latencies.append(time.perf_counter() - operation_start)
+    elapsed = time.perf_counter() - start
+    return {'throughput': round(iterations * items_per_operation / elapsed, 2), **latency_summary(latencies)}
+
+
+async def benchmark_database(database: DatabaseConnector, keys: int, rows_per_key: int, iterations: int) -> dict:
+    await database.create_tables()
+    generator = random.Random(0)
+    ips = key_ips(keys)
+    timestamp = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        (ip, generator.uniform(-60, 60), generator.uniform(-180, 180), timestamp + timedelta(seconds=i))
+        for i in range(rows_per_key)
+        for ip in ips
+    ]
+    await database.insert_many(IPLocation, rows, chunk_size=10000)
+    clock = iter(range(1, 10**9))
+
+    def new_row() -> tuple:
+        return generator.choice(ips), 1.1, 2.2, timestamp + timedelta(days=1, microseconds=next(clock))
+
+    async def insert():
+        await database.insert(IPLocation(**dict(zip(IPLocation.row_fields, new_row()))))
+
+    async def insert_many():
+        await database.insert_many(IPLocation, [new_row() for _ in range(1000)])
+
+    async def select_by_ip():
+        await database.select_by_ip(generator.choice(ips), limit=100)
+
+    async def select_latest_by_ip():
+        await database.select_latest_by_ip(generator.choice(ips))
+
+    async def select_by_ips():
+        await database.select_by_ips(generator.sample(ips, min(100, keys)), latest=1)
+
+    async def search_nearby():
+        await database.search_nearby(IPLocation, generator.uniform(-60, 60), generator.uniform(-180, 180), 100)
+
+    return {
+        'insert': await measure(insert, iterations),
+        'insert_many_1000': await measure(insert_many, max(iterations // 20, 1), items_per_operation=1000),
+        'select_by_ip_100': await measure(select_by_ip, iterations),
+        'select_latest_by_ip': await measure(select_latest_by_ip, iterations),
+        'select_by_ips_100_latest': await measure(select_by_ips, iterations, items_per_operation=min(100, keys)),
+        'search_nearby_100km': await measure(search_nearby, iterations),
+    }
+
+
+async def run(parsed_arguments) -> dict:
+    profile = DATABASE_PROFILES[parsed_arguments.profile]
+    workload = (parsed_arguments.keys, parsed_arguments.rows_per_key, parsed_arguments.iterations)
+    cases = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database = DatabaseConnector(f'sqlite+aiosqlite:///{os.path.join(directory, "benchmark.db")}', profile)
+        try:
+            results = await benchmark_database(database, *workload)
+        finally:
+            await database.engine.dispose()
+    cases.update({f'sqlite/{operation}': metrics for operation, metrics in results.items()})
+
+    postgres_uri = parsed_arguments.postgres_uri or os.getenv('BENCHMARK_POSTGRES_URI')
+    if postgres_uri:
+        database = DatabaseConnector(postgres_uri, profile)
+        try:
+            results = await benchmark_database(database, *workload)
+        finally:
+            async with database.engine.begin() as connection:
+                await connection.run_sync(Base.metadata.drop_all)
+            await database.engine.dispose()
+        cases.update({f'postgresql/{operation}': metrics for operation, metrics in results.items()})
+    return cases
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Measures inserts and selects of DatabaseConnector.')
+    parser.add_argument('--keys', type=int, default=1000, help='distinct IPs stored before measuring')
+    parser.add_argument('--rows-per-key', type=int, default=20, help='locations of every IP stored before measuring')
+    parser.add_argument('--iterations', type=int, default=500, help='operations measured per case')
+    parser.add_argument('--profile', choices=DATABASE_PROFILES, default='default', help='database profile')
+    parser.add_argument(
+        '--postgres-uri',
+        help='also measure this postgresql+asyncpg database, defaults to BENCHMARK_POSTGRES_URI; '
+        'its location tables are dropped afterwards, use a scratch database',
+    )
+    add_report_arguments(parser)
+    parsed_arguments = parser.parse_args(arguments)
+
+    cases = asyncio.run(run(parsed_arguments))
+
+    parameters = {
+        'keys': parsed_arguments.keys,
+        'rows_per_key': parsed_arguments.rows_per_key,
+        'iterations': parsed_arguments.iterations,
+        'profile': parsed_arguments.profile,
+        'postgresql': bool(parsed_arguments.postgres_uri or os.getenv('BENCHMARK_POSTGRES_URI')),
+    }
+    finish_report(make_report('database', parameters, cases), parsed_arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import random
+import zlib
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def stub_location(host: str) -> dict:
+    """Coordinates derived from the host, the same host is always at the same place."""
+    checksum = zlib.crc32(host.encode())
+    return {
+        'latitude': round((checksum % 180000) / 1000 - 90, 3),
+        'longitude': round((checksum >> 8) % 360000 / 1000 - 180, 3),
+    }
+
+
+def create_stub_app(
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_latency: float = 1.0,
+    error_rate: float = 0.0,
+    error_status: int = 503,
+    seed: int | None = None,
+) -> Starlette:
+    """Serves ipstack's standard and bulk lookups for any access key.
+
+    A response waits `latency` seconds plus a uniform `jitter`, a `slow_rate` share of them `slow_latency`
+    seconds instead, and an `error_rate` share fails with `error_status`.
+    """
+    generator = random.Random(seed)
+    requests = {'total': 0, 'errors': 0}
+
+    async def lookup(request: Request) -> JSONResponse:
+        requests['total'] += 1
+        if generator.random() < slow_rate:
+            delay = slow_latency
+        else:
+            delay = latency + generator.uniform(0, jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if generator.random() < error_rate:
+            requests['errors'] += 1
+            return JSONResponse({'success': False, 'error': {'code': 500, 'type': 'stub_error'}}, error_status)
+        if not request.query_params.get('access_key'):
+            return JSONResponse({'success': False, 'error': {'code': 101, 'type': 'missing_access_key'}})
+
+        hosts = request.path_params['hosts'].split(',')
+        if len(hosts) == 1:
+            return JSONResponse(stub_location(hosts[0]))
+        return JSONResponse([{'ip': host, **stub_location(host)} for host in hosts])
+
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(requests)
+
+    return Starlette(routes=[Route('/_stats', stats), Route('/{hosts:path}', lookup)])
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Local stand-in for the ipstack API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds every response waits')
+    parser.add_argument('--jitter', type=float, default=0.01, help='up to this many seconds are added at random')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of responses waiting --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=1.0, help='seconds a slow response waits')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of responses failing')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of failing responses')
+    parser.add_argument('--seed', type=int, default=None, help='seed of latencies and errors')
+    parsed_arguments = parser.parse_args(arguments)
+    app = create_stub_app(
+        latency=parsed_arguments.latency,
+        jitter=parsed_arguments.jitter,
+        slow_rate=parsed_arguments.slow_rate,
+        slow_latency=parsed_arguments.slow_latency,
+        error_rate=parsed_arguments.error_rate,
+        error_status=parsed_arguments.error_status,
+        seed=parsed_arguments.seed,
+    )
+    uvicorn.run(app, host=parsed_arguments.host, port=parsed_arguments.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import httpx
+
+from benchmarks.ipstack_stub import stub_location
+from benchmarks.results import latency_summary, make_report, add_report_arguments, finish_report
+
+PREFIX = '/api/v1/public'
+
+
+class Keys:
+    """Pool of IPs and URLs the requests pick from, located by the add endpoints first."""
+
+    def __init__(self, size: int, seed: int) -> None:
+        self.ips = [f'10.{i // 256 % 256}.{i % 256}.1' for i in range(size)]
+        self.urls = [f'https://host-{i}.example.com/path' for i in range(size)]
+        self.generator = random.Random(seed)
+
+    def ip(self) -> str:
+        return self.generator.choice(self.ips)
+
+    def url(self) -> str:
+        return self.generator.choice(self.urls)
+
+    def network(self) -> str:
+        return self.ip().rsplit('.', 1)[0] + '.0/24'
+
+
+def nearby_parameters(keys: Keys) -> dict:
+    location = stub_location(keys.ip())
+    return {**location, 'radius_km': 500, 'limit': 100}
+
+
+# endpoint: method, path and a builder of request arguments, deleting endpoints come last
+ENDPOINTS = {
+    'add-location-for-ip': ('POST', '/add-location-for-ip', lambda keys: {'json': {'ip': keys.ip()}}),
+    'add-location-for-url': ('POST', '/add-location-for-url', lambda keys: {'json': {'url': keys.url()}}),
+    'get-location-for-ip': ('GET', '/get-location-for-ip', lambda keys: {'params': {'ip': keys.ip(), 'limit': 100}}),
+    'get-location-for-url': (
+        'GET',
+        '/get-location-for-url',
+        lambda keys: {'params': {'url': keys.url(), 'limit': 100}},
+    ),
+    'get-latest-location-for-ip': ('GET', '/get-latest-location-for-ip', lambda keys: {'params': {'ip': keys.ip()}}),
+    'get-latest-location-for-url': (
+        'GET',
+        '/get-latest-location-for-url',
+        lambda keys: {'params': {'url': keys.url()}},
+    ),
+    'get-locations-for-cidr': (
+        'GET',
+        '/get-locations-for-cidr',
+        lambda keys: {'params': {'cidr': '10.0.0.0/16', 'limit': 100}},
+    ),
+    'search-nearby': ('GET', '/search-nearby', lambda keys: {'params': nearby_parameters(keys)}),
+    'healthcheck': ('GET', '/healthcheck', lambda keys: {}),
+    'healthcheck-database': ('GET', '/healthcheck/database', lambda keys: {}),
+    'stats': ('GET', '/stats', lambda keys: {}),
+    'delete-location-for-ip': ('DELETE', '/delete-location-for-ip', lambda keys: {'params': {'ip': keys.ip()}}),
+    'delete-location-for-url': ('DELETE', '/delete-location-for-url', lambda keys: {'params': {'url': keys.url()}}),
+    'delete-locations-for-cidr': (
+        'DELETE',
+        '/delete-locations-for-cidr',
+        lambda keys: {'params': {'cidr': keys.network()}},
+    ),
+}
+
+
+async def drive(client: httpx.AsyncClient, endpoint: str, keys: Keys, rps: float, duration: float) -> dict:
+    """Sends requests to `endpoint` at a fixed rate for `duration` seconds, not waiting for responses.
+
+    Latency is taken from the time a request was due, so a server falling behind shows up in the percentiles
+    instead of slowing down the generator.
+    """
+    method, path, build = ENDPOINTS[endpoint]
+    loop = asyncio.get_running_loop()
+    latencies = []
+    statuses = Counter()
+
+    async def send(due: float, arguments: dict) -> None:
+        try:
+            response = await client.request(method, PREFIX + path, **arguments)
+            statuses[str(response.status_code)] += 1
+        except httpx.HTTPError as error:
+            statuses[type(error).__name__] += 1
+        latencies.append(loop.time() - due)
+
+    tasks = []
+    start = loop.time()
+    for i in range(max(int(rps * duration), 1)):
+        due = start + i / rps
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(due, build(keys))))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+    return {
+        'requests': len(tasks),
+        'throughput': round(len(tasks) / elapsed, 2),
+        'errors': errors,
+        'statuses': dict(statuses),
+        **latency_summary(latencies),
+    }
+
+
+async def populate(client: httpx.AsyncClient, keys: Keys, chunk_size: int = 1000) -> None:
+    """Locates every key once through the bulk endpoints, so that reads do not depend on the adding endpoints."""
+    for path, field, values in (
+        ('/add-locations-for-ips', 'ips', keys.ips),
+        ('/add-locations-for-urls', 'urls', keys.urls),
+    ):
+        for i in range(0, len(values), chunk_size):
+            response = await client.post(PREFIX + path, json={field: values[i : i + chunk_size]})
+            response.raise_for_status()
+
+
+async def run_load(base_url: str, endpoints: list[str], rps: float, duration: float, keys: Keys) -> dict:
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        await populate(client, keys)
+        cases = {}
+        for endpoint in endpoints:
+            cases[endpoint] = await drive(client, endpoint, keys, rps, duration)
+            print(f'{endpoint}: {cases[endpoint]}', file=sys.stderr)
+        return cases
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{process.args} exited with {process.returncode}')
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not answer within {timeout} seconds')
+
+
+@contextmanager
+def served_application(parsed_arguments):
+    """Runs the ipstack stub and the application on a fresh SQLite database in subprocesses."""
+    stub_port, app_port = parsed_arguments.stub_port, parsed_arguments.port
+    with tempfile.TemporaryDirectory() as directory:
+        environment = {
+            **os.environ,
+            'DATABASE_URI': f'sqlite+aiosqlite:///{os.path.join(directory, "load_test.db")}',
+            'IPSTACK_KEY': 'load-test',
+            'IPSTACK_BASE_URL': f'http://127.0.0.1:{stub_port}/',
+            'IPSTACK_SHARED_CACHE_PATH': os.path.join(directory, 'shared_cache.db'),
+            'STARTUP_LOCK_PATH': os.path.join(directory, 'startup.lock'),
+        }
+        stub_command = [
+            sys.executable,
+            '-m',
+            'benchmarks.ipstack_stub',
+            f'--port={stub_port}',
+            f'--latency={parsed_arguments.stub_latency}',
+            f'--jitter={parsed_arguments.stub_jitter}',
+            f'--error-rate={parsed_arguments.stub_error_rate}',
+            f'--seed={parsed_arguments.seed}',
+        ]
+        app_command = [
+            sys.executable,
+            '-m',
+            'uvicorn',
+            'main:app',
+            f'--port={app_port}',
+            f'--workers={parsed_arguments.workers}',
+            '--log-level=warning',
+        ]
+        processes = [subprocess.Popen(stub_command, env=environment)]
+        try:
+            wait_until_ready(f'http://127.0.0.1:{stub_port}/_stats', processes[0])
+            processes.append(subprocess.Popen(app_command, env=environment))
+            wait_until_ready(f'http://127.0.0.1:{app_port}{PREFIX}/healthcheck', processes[1])
+            yield f'http://127.0.0.1:{app_port}'
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait()
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Drives the public endpoints at a fixed rate and reports latencies.')
+    parser.add_argument('--url', help='base url of a running application, otherwise one is started with --serve')
+    parser.add_argument('--serve', action='store_true', help='start the ipstack stub and the application')
+    parser.add_argument('--port', type=int, default=8090, help='port of the application started by --serve')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes of the application started by --serve')
+    parser.add_argument('--stub-port', type=int, default=8089, help='port of the ipstack stub started by --serve')
+    parser.add_argument('--stub-latency', type=float, default=0.02)
+    parser.add_argument('--stub-jitter', type=float, default=0.01)
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='comma separated, in order of driving')
+    parser.add_argument('--rps', type=float, default=50.0, help='requests per second of every endpoint')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds every endpoint is driven')
+    parser.add_argument('--keys', type=int, default=500, help='distinct IPs and URLs')
+    parser.add_argument('--seed', type=int, default=0)
+    add_report_arguments(parser)
+    parsed_arguments = parser.parse_args(arguments)
+
+    endpoints = parsed_arguments.endpoints.split(',')
+    unknown = [endpoint for endpoint in endpoints if endpoint not in ENDPOINTS]
+    if unknown:
+        parser.error(f'unknown endpoints {", ".join(unknown)}')
+    if not parsed_arguments.url and not parsed_arguments.serve:
+        parser.error('either --url or --serve is required')
+
+    keys = Keys(parsed_arguments.keys, parsed_arguments.seed)
+    load = (endpoints, parsed_arguments.rps, parsed_arguments.duration, keys)
+    if parsed_arguments.serve:
+        with served_application(parsed_arguments) as url:
+            cases = asyncio.run(run_load(url, *load))
+    else:
+        cases = asyncio.run(run_load(parsed_arguments.url, *load))
+
+    parameters = {
+        name: value
+        for name, value in vars(parsed_arguments).items()
+        if name not in ('output', 'baseline', 'tolerance', 'url')
+    }
+    finish_report(make_report('load_test', parameters, cases), parsed_arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from api.models.models import LocationResponseModel, Location
+from api.responses import RowsJSONResponse, location_dicts
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.tables import IPLocation
+
+IP = '133.1.1.0'
+
+
+async def orm_read(database: DatabaseConnector) -> bytes:
+    """The read path before the zero-ORM one: entities, response models, revalidation and json."""
+    async with database.AsyncSession() as session:
+        rows = await session.execute(select(IPLocation).where(IPLocation.ip == IP).order_by(IPLocation.timestamp))
+        results = rows.scalars().all()
+    response = LocationResponseModel(
+        locations=[
+            Location(latitude=result.latitude, longitude=result.longitude, timestamp=result.timestamp)
+            for result in results
+        ]
+    )
+    # FastAPI validates the returned model against the response model before encoding it
+    content = LocationResponseModel.model_validate(response).model_dump(mode='json')
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+async def core_read(database: DatabaseConnector) -> bytes:
+    results = await database.select_by_ip(IP)
+    return RowsJSONResponse({'locations': location_dicts(results), 'next_cursor': None}).body
+
+
+async def measure(read, database: DatabaseConnector, rows: int, repeat: int) -> float:
+    await read(database)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await read(database)
+    return rows * repeat / (time.perf_counter() - start)
+
+
+async def run(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        database = DatabaseConnector(f'sqlite+aiosqlite:///{os.path.join(directory, "benchmark.db")}')
+        await database.create_tables()
+        timestamp = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        await database.insert_many(
+            IPLocation, [(IP, 1.1, 2.2, timestamp + timedelta(seconds=i)) for i in range(rows)], chunk_size=10000
+        )
+        try:
+            orm_rate = await measure(orm_read, database, rows, repeat)
+            core_rate = await measure(core_read, database, rows, repeat)
+        finally:
+            await database.engine.dispose()
+    print(f'ORM + pydantic: {orm_rate:12,.0f} rows/s')
+    print(f'Core + orjson:  {core_rate:12,.0f} rows/s ({core_rate / orm_rate:.1f}x)')
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Compares read paths of get-location-for-ip on one key history.')
+    parser.add_argument('--rows', type=int, default=100000, help='locations of the key')
+    parser.add_argument('--repeat', type=int, default=5, help='reads per read path')
+    parsed_arguments = parser.parse_args(arguments)
+    asyncio.run(run(parsed_arguments.rows, parsed_arguments.repeat))
+
+
+if __name__ == '__main__':
+    main()
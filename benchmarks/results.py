@@ -0,0 +1,97 @@
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+# metrics of a case compared with a baseline, the maximum latency is reported but too noisy to compare
+HIGHER_IS_BETTER = {'throughput'}
+LOWER_IS_BETTER = {'p50_ms', 'p95_ms', 'p99_ms'}
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Linearly interpolated percentile of already sorted values, `fraction` in [0, 1]."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    """p50, p95, p99 and maximum of latencies in seconds, reported in milliseconds."""
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def make_report(benchmark: str, parameters: dict, cases: dict[str, dict]) -> dict:
+    return {
+        'benchmark': benchmark,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'parameters': parameters,
+        'cases': cases,
+    }
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns a message for every case metric more than `tolerance` (a fraction) worse than in `baseline`.
+
+    Only metrics named in `HIGHER_IS_BETTER` or `LOWER_IS_BETTER` are compared, cases missing from either report
+    are skipped.
+    """
+    regressions = []
+    for case, metrics in report['cases'].items():
+        baseline_metrics = baseline.get('cases', {}).get(case)
+        if baseline_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            baseline_value = baseline_metrics.get(metric)
+            if not isinstance(baseline_value, (int, float)) or baseline_value <= 0:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                change = (baseline_value - value) / baseline_value
+            elif metric in LOWER_IS_BETTER:
+                change = (value - baseline_value) / baseline_value
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(f'{case} {metric}: {value} against {baseline_value} ({change:.0%} worse)')
+    return regressions
+
+
+def add_report_arguments(parser) -> None:
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON report to compare with, exits with 1 on a regression')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1, help='share a metric may be worse than the baseline, default 0.1'
+    )
+
+
+def finish_report(report: dict, parsed_arguments) -> None:
+    """Writes `report` and, when a baseline is given, exits with 1 if it regressed against it."""
+    encoded = json.dumps(report, indent=2)
+    if parsed_arguments.output:
+        with open(parsed_arguments.output, 'w') as file:
+            file.write(encoded + '\n')
+    else:
+        print(encoded)
+
+    if parsed_arguments.baseline:
+        with open(parsed_arguments.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_with_baseline(report, baseline, parsed_arguments.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
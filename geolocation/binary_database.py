@@ -0,0 +1,176 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+
+from loguru import logger
+
+from geolocation.range_database import (
+    IPRangeDatabase,
+    IPRangeDatabaseError,
+    IPRangeTable,
+    IPV4_KEY_WIDTH,
+    IPV6_KEY_WIDTH,
+)
+
+MAGIC = b'IPLGEODB'
+VERSION = 1
+# magic, version, ipv4 range count, ipv6 range count, crc32 of everything after the header
+HEADER = struct.Struct('<8sIQQI')
+COORDINATE_WIDTH = 4
+
+
+def write_binary_database(database: IPRangeDatabase, path: str) -> None:
+    """Writes `database` to `path` in the binary layout read by `MappedIPRangeDatabase`.
+
+    The file is written next to `path` and renamed over it, so processes mapping the old file keep a consistent
+    view and `ReloadingIPRangeDatabase` picks up the new one.
+    """
+    sections = []
+    for table in (database.ipv4, database.ipv6):
+        latitudes = array('f', table.latitudes)
+        longitudes = array('f', table.longitudes)
+        if sys.byteorder != 'little':
+            latitudes.byteswap()
+            longitudes.byteswap()
+        sections += [
+            bytes(table.keys[table.starts_offset : table.starts_offset + table.size * table.key_width]),
+            bytes(table.keys[table.ends_offset : table.ends_offset + table.size * table.key_width]),
+            latitudes.tobytes(),
+            longitudes.tobytes(),
+        ]
+    checksum = 0
+    for section in sections:
+        checksum = zlib.crc32(section, checksum)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.geo-', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, database.ipv4.size, database.ipv6.size, checksum))
+            for section in sections:
+                file.write(section)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+class MappedIPRangeDatabase(IPRangeDatabase):
+    """Range database backed by a read-only memory map of a file written by `write_binary_database`.
+
+    Pages are shared through the page cache by every process mapping the same file and nothing is copied
+    on open, only the header is read unless `verify` asks for the checksum to be checked.
+    """
+
+    def __init__(self, path: str, verify: bool = False) -> None:
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self._views = []
+        try:
+            ipv4, ipv6 = self._map_tables(path, verify)
+        except BaseException:
+            self.close()
+            raise
+        super().__init__(ipv4, ipv6)
+
+    def _map_tables(self, path: str, verify: bool) -> tuple[IPRangeTable, IPRangeTable]:
+        if len(self._mmap) < HEADER.size:
+            raise IPRangeDatabaseError(f'{path}: file too short for a geo database')
+        magic, version, ipv4_size, ipv6_size, checksum = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise IPRangeDatabaseError(f'{path}: not a version {VERSION} geo database')
+        expected_length = HEADER.size + sum(
+            size * 2 * (key_width + COORDINATE_WIDTH)
+            for size, key_width in ((ipv4_size, IPV4_KEY_WIDTH), (ipv6_size, IPV6_KEY_WIDTH))
+        )
+        if len(self._mmap) != expected_length:
+            raise IPRangeDatabaseError(f'{path}: expected {expected_length} bytes, found {len(self._mmap)}')
+        if verify:
+            with self._buffer[HEADER.size :] as payload:
+                if zlib.crc32(payload) != checksum:
+                    raise IPRangeDatabaseError(f'{path}: checksum mismatch')
+
+        offset = HEADER.size
+        tables = []
+        for size, key_width in ((ipv4_size, IPV4_KEY_WIDTH), (ipv6_size, IPV6_KEY_WIDTH)):
+            starts_offset = offset
+            ends_offset = starts_offset + size * key_width
+            coordinates_offset = ends_offset + size * key_width
+            latitudes = self._coordinates(coordinates_offset, size)
+            longitudes = self._coordinates(coordinates_offset + size * COORDINATE_WIDTH, size)
+            tables.append(IPRangeTable(key_width, self._mmap, starts_offset, ends_offset, latitudes, longitudes))
+            offset = coordinates_offset + 2 * size * COORDINATE_WIDTH
+        return tables[0], tables[1]
+
+    def _coordinates(self, offset: int, size: int):
+        view = self._buffer[offset : offset + size * COORDINATE_WIDTH]
+        if sys.byteorder != 'little':
+            coordinates = array('f', view.tobytes())
+            coordinates.byteswap()
+            view.release()
+            return coordinates
+        coordinates = view.cast('f')
+        self._views += [view, coordinates]
+        return coordinates
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._buffer.release()
+        self._mmap.close()
+
+
+class ReloadingIPRangeDatabase:
+    """Maps the binary database at `path` and maps it again whenever the file is replaced.
+
+    The file is checked at most every `check_interval` seconds, during a lookup.
+    """
+
+    def __init__(self, path: str, check_interval: float = 5.0, verify: bool = False) -> None:
+        self._path = path
+        self._check_interval = check_interval
+        self._verify = verify
+        self._file_id = self._stat_file_id()
+        self._database = MappedIPRangeDatabase(path, verify=verify)
+        self._next_check = time.monotonic() + check_interval
+
+    @property
+    def size(self) -> int:
+        return self._database.size
+
+    def lookup(self, ip: str) -> tuple[float, float] | None:
+        if time.monotonic() >= self._next_check:
+            self.reload_if_changed()
+        return self._database.lookup(ip)
+
+    def reload_if_changed(self) -> bool:
+        self._next_check = time.monotonic() + self._check_interval
+        try:
+            file_id = self._stat_file_id()
+            if file_id == self._file_id:
+                return False
+            database = MappedIPRangeDatabase(self._path, verify=self._verify)
+        except (OSError, IPRangeDatabaseError) as error:
+            logger.error(f'Error while reloading geo database {self._path}, keeping the loaded one: {error}')
+            return False
+        previous_database, self._database, self._file_id = self._database, database, file_id
+        previous_database.close()
+        logger.info(f'Reloaded geo database {self._path} with {database.size} ranges')
+        return True
+
+    def close(self) -> None:
+        self._database.close()
+
+    def _stat_file_id(self) -> tuple[int, int, int, int]:
+        stat = os.stat(self._path)
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
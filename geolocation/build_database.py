@@ -0,0 +1,25 @@
+import argparse
+import time
+
+from geolocation.binary_database import write_binary_database, MappedIPRangeDatabase
+from geolocation.range_database import IPRangeDatabase
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Compiles range CSV files into a binary geo database.')
+    parser.add_argument('csv_files', nargs='+', help='GeoLite2 blocks or start_ip/end_ip range CSV files')
+    parser.add_argument('--output', required=True, help='binary database file, replaced atomically')
+    parsed_arguments = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    database = IPRangeDatabase.from_csv(parsed_arguments.csv_files)
+    write_binary_database(database, parsed_arguments.output)
+    MappedIPRangeDatabase(parsed_arguments.output, verify=True).close()
+    print(
+        f'Wrote {database.ipv4.size} IPv4 and {database.ipv6.size} IPv6 ranges to {parsed_arguments.output} '
+        f'in {time.perf_counter() - start:.1f}s'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+
+from model.base.ip_locator_exception import IPLocatorResolvingHostnameException
+from utils.ip_address import parse_ip
+from utils.utils import get_bool_environment_variable, get_int_environment_variable, get_float_environment_variable
+
+
+class DNSResolverSingleton:
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'CachingDNSResolver | None':
+        if not get_bool_environment_variable('DNS_RESOLVE_HOSTNAMES', False):
+            return None
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = CachingDNSResolver(
+                        max_size=get_int_environment_variable('DNS_CACHE_SIZE', 10000),
+                        min_ttl=get_float_environment_variable('DNS_MIN_TTL', 5.0),
+                        max_ttl=get_float_environment_variable('DNS_MAX_TTL', 3600.0),
+                        negative_ttl=get_float_environment_variable('DNS_NEGATIVE_TTL', 30.0),
+                        concurrency=get_int_environment_variable('DNS_CONCURRENCY', 64),
+                        timeout=get_float_environment_variable('DNS_TIMEOUT', 2.0),
+                    )
+        return cls._instance
+
+
+@dataclass
+class DNSCacheStats:
+    hits: int = 0
+    misses: int = 0
+    negative_hits: int = 0
+    evictions: int = 0
+    coalesced: int = 0
+    size: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class CachingDNSResolver:
+    """Resolves hostnames to an IP address, preferring IPv4, and caches the answers for their DNS TTL.
+
+    TTLs are clamped to `[min_ttl, max_ttl]`, failed resolutions are cached for `negative_ttl` seconds and the
+    least recently used entry is evicted once `max_size` is reached. At most `concurrency` queries are in flight
+    and concurrent resolutions of the same hostname share a single query.
+    """
+
+    def __init__(
+        self,
+        resolver=None,
+        max_size: int = 10000,
+        min_ttl: float = 5.0,
+        max_ttl: float = 3600.0,
+        negative_ttl: float = 30.0,
+        concurrency: int = 64,
+        timeout: float = 2.0,
+    ) -> None:
+        self._resolver = resolver if resolver is not None else dns.asyncresolver.Resolver()
+        self._max_size = max_size
+        self._min_ttl = min_ttl
+        self._max_ttl = max_ttl
+        self._negative_ttl = negative_ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._timeout = timeout
+        self._entries: OrderedDict[str, tuple[float, str | IPLocatorResolvingHostnameException]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._stats = DNSCacheStats()
+
+    def stats(self) -> DNSCacheStats:
+        self._stats.size = len(self._entries)
+        return self._stats
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def resolve(self, hostname: str) -> str:
+        """Returns an IP address of `hostname`, raising IPLocatorResolvingHostnameException if there is none."""
+        address = parse_ip(hostname)
+        if address is not None:
+            return str(address)
+        hostname = hostname.lower().rstrip('.')
+
+        entry = self._entries.get(hostname)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(hostname)
+                if isinstance(value, Exception):
+                    self._stats.negative_hits += 1
+                    raise IPLocatorResolvingHostnameException(*value.args)
+                self._stats.hits += 1
+                return value
+            del self._entries[hostname]
+
+        task = self._in_flight.get(hostname)
+        if task is None:
+            self._stats.misses += 1
+            task = asyncio.create_task(self._query(hostname))
+            self._in_flight[hostname] = task
+            task.add_done_callback(lambda _: self._finish(hostname, task))
+        else:
+            self._stats.coalesced += 1
+        # the query keeps running for the other callers and the cache when this one is cancelled
+        return await asyncio.shield(task)
+
+    async def resolve_many(self, hostnames: list[str]) -> dict[str, str | IPLocatorResolvingHostnameException]:
+        hostnames = list(dict.fromkeys(hostnames))
+        results = await asyncio.gather(*(self.resolve(hostname) for hostname in hostnames), return_exceptions=True)
+        for hostname, result in zip(hostnames, results):
+            if isinstance(result, BaseException) and not isinstance(result, IPLocatorResolvingHostnameException):
+                raise result
+        return dict(zip(hostnames, results))
+
+    async def _query(self, hostname: str) -> str:
+        async with self._semaphore:
+            error = None
+            for record_type in ('A', 'AAAA'):
+                try:
+                    answer = await self._resolver.resolve(hostname, record_type, lifetime=self._timeout)
+                except (dns.resolver.NoAnswer, dns.resolver.NoNameservers) as no_answer:
+                    error = no_answer
+                    continue
+                except dns.exception.DNSException as dns_error:
+                    error = dns_error
+                    break
+                address = str(next(iter(answer)).address)
+                self._put(hostname, address, min(max(answer.rrset.ttl, self._min_ttl), self._max_ttl))
+                return address
+
+        exception = IPLocatorResolvingHostnameException(f'Error resolving hostname {hostname}: {error}')
+        self._put(hostname, exception, self._negative_ttl)
+        raise exception
+
+    def _finish(self, hostname: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(hostname, None)
+        # retrieve the exception so that a query all callers gave up on does not log "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def _put(self, hostname: str, value: str | IPLocatorResolvingHostnameException, ttl: float) -> None:
+        if ttl <= 0 or self._max_size <= 0:
+            return
+        self._entries[hostname] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(hostname)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
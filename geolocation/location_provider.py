@@ -0,0 +1,122 @@
+import asyncio
+import os
+import threading
+from typing import Protocol
+
+from geolocation.binary_database import ReloadingIPRangeDatabase
+from geolocation.range_database import IPRangeDatabase
+from ipstack_client.cache import get_uncached_locations
+from ipstack_client.ipstack_client import IPStackAPIClientSingleton
+from ipstack_client.models import LocationResponse
+from utils.utils import get_bool_environment_variable, get_float_environment_variable
+
+
+class LocationProvider(Protocol):
+    async def get_location(self, host: str) -> LocationResponse: ...
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | Exception]: ...
+
+    async def close(self) -> None: ...
+
+
+class LocationProviderSingleton:
+    """Provides the location provider selected by `LOCATION_PROVIDER`.
+
+    `ipstack` asks ipstack only, `offline` answers from the local range database only and `offline-first`
+    asks ipstack for the hosts the local range database does not know.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> LocationProvider:
+        mode = os.getenv('LOCATION_PROVIDER', 'ipstack')
+        if mode == 'ipstack':
+            return IPStackAPIClientSingleton.get_instance()
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls._create(mode)
+        return cls._instance
+
+    @staticmethod
+    def _create(mode: str) -> LocationProvider:
+        paths = os.getenv('OFFLINE_GEO_DATABASE')
+        if not paths:
+            raise EnvironmentError(f'OFFLINE_GEO_DATABASE is required by LOCATION_PROVIDER {mode}')
+        paths = paths.split(',')
+        if all(path.endswith('.csv') for path in paths):
+            database = IPRangeDatabase.from_csv(paths)
+        else:
+            database = ReloadingIPRangeDatabase(
+                paths[0],
+                check_interval=get_float_environment_variable('OFFLINE_GEO_DATABASE_RELOAD_INTERVAL', 5.0),
+                verify=get_bool_environment_variable('OFFLINE_GEO_DATABASE_VERIFY', False),
+            )
+        offline_provider = OfflineLocationProvider(database)
+        if mode == 'offline':
+            return offline_provider
+        if mode == 'offline-first':
+            return FallbackLocationProvider(offline_provider, IPStackAPIClientSingleton.get_instance())
+        raise EnvironmentError(f'Unknown LOCATION_PROVIDER {mode}, expected ipstack, offline or offline-first')
+
+
+class OfflineLocationNotFoundError(Exception):
+    pass
+
+
+class OfflineLocationProvider:
+    def __init__(self, database: IPRangeDatabase | ReloadingIPRangeDatabase) -> None:
+        self._database = database
+
+    async def get_location(self, host: str) -> LocationResponse:
+        location = self._database.lookup(host)
+        if location is None:
+            raise OfflineLocationNotFoundError(f'No offline location of {host}')
+        return LocationResponse(latitude=location[0], longitude=location[1])
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | Exception]:
+        results = {}
+        for host in dict.fromkeys(hosts):
+            location = self._database.lookup(host)
+            if location is None:
+                results[host] = OfflineLocationNotFoundError(f'No offline location of {host}')
+            else:
+                results[host] = LocationResponse(latitude=location[0], longitude=location[1])
+        return results
+
+    async def close(self) -> None:
+        self._database.close()
+
+
+class FallbackLocationProvider:
+    """Asks `fallback` for every host `primary` fails to locate."""
+
+    def __init__(self, primary: LocationProvider, fallback: LocationProvider) -> None:
+        self._primary = primary
+        self._fallback = fallback
+
+    async def get_location(self, host: str) -> LocationResponse:
+        try:
+            return await self._primary.get_location(host)
+        except Exception:
+            return await self._fallback.get_location(host)
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | Exception]:
+        results = await self._primary.get_locations(hosts)
+        missing = [host for host, location in results.items() if isinstance(location, Exception)]
+        if missing:
+            results.update(await self._fallback.get_locations(missing))
+        return results
+
+    async def get_fresh_locations(self, hosts: list[str]) -> dict[str, LocationResponse | Exception]:
+        """Like `get_locations`, past the caches of both providers."""
+        results = await get_uncached_locations(self._primary, hosts)
+        missing = [host for host, location in results.items() if isinstance(location, Exception)]
+        if missing:
+            results.update(await get_uncached_locations(self._fallback, missing))
+        return results
+
+    async def close(self) -> None:
+        await asyncio.gather(self._primary.close(), self._fallback.close())
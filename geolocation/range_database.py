@@ -0,0 +1,149 @@
+import csv
+import ipaddress
+from array import array
+from collections.abc import Iterable
+
+IPV4_KEY_WIDTH = 4
+IPV6_KEY_WIDTH = 16
+
+
+class IPRangeDatabaseError(Exception):
+    pass
+
+
+class IPRangeTable:
+    """Sorted, non-overlapping IP ranges of one address family.
+
+    Range boundaries are fixed-width big-endian keys stored back to back in `keys`, the starts of all ranges
+    from `starts_offset` and their ends from `ends_offset`. Comparing two keys as bytes compares the addresses,
+    so a lookup is a binary search over the buffer. `keys` only needs to support slicing to bytes, which lets
+    the table be backed by a memory-mapped file as well.
+    """
+
+    def __init__(self, key_width: int, keys, starts_offset: int, ends_offset: int, latitudes, longitudes) -> None:
+        self.key_width = key_width
+        self.keys = keys
+        self.starts_offset = starts_offset
+        self.ends_offset = ends_offset
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.size = len(latitudes)
+
+    @classmethod
+    def from_ranges(cls, key_width: int, ranges: Iterable[tuple[int, int, float, float]]) -> 'IPRangeTable':
+        starts = bytearray()
+        ends = bytearray()
+        latitudes = array('f')
+        longitudes = array('f')
+        for start, end, latitude, longitude in sorted(ranges):
+            starts += start.to_bytes(key_width, 'big')
+            ends += end.to_bytes(key_width, 'big')
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+        return cls(key_width, bytes(starts + ends), 0, len(starts), latitudes, longitudes)
+
+    def lookup(self, key: bytes) -> tuple[float, float] | None:
+        width = self.key_width
+        keys = self.keys
+        starts_offset = self.starts_offset
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            start = starts_offset + middle * width
+            if keys[start : start + width] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        index = low - 1
+        end = self.ends_offset + index * width
+        if index < 0 or keys[end : end + width] < key:
+            return None
+        # coordinates are stored as float32, rounding drops the noise of widening them back to float
+        return round(self.latitudes[index], 6), round(self.longitudes[index], 6)
+
+
+class IPRangeDatabase:
+    def __init__(self, ipv4: IPRangeTable, ipv6: IPRangeTable) -> None:
+        self.ipv4 = ipv4
+        self.ipv6 = ipv6
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def size(self) -> int:
+        return self.ipv4.size + self.ipv6.size
+
+    def lookup(self, ip: str) -> tuple[float, float] | None:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if address.version == 4:
+            return self.ipv4.lookup(address.packed)
+        return self.ipv6.lookup(address.packed)
+
+    @classmethod
+    def from_csv(cls, paths: Iterable[str]) -> 'IPRangeDatabase':
+        ipv4_ranges = []
+        ipv6_ranges = []
+        for path in paths:
+            for start, end, latitude, longitude in read_ranges_csv(path):
+                if start.version == 4:
+                    ipv4_ranges.append((int(start), int(end), latitude, longitude))
+                else:
+                    ipv6_ranges.append((int(start), int(end), latitude, longitude))
+        return cls(
+            IPRangeTable.from_ranges(IPV4_KEY_WIDTH, ipv4_ranges),
+            IPRangeTable.from_ranges(IPV6_KEY_WIDTH, ipv6_ranges),
+        )
+
+
+def read_ranges_csv(path: str):
+    """Yields `(start address, end address, latitude, longitude)` of every located row in a range CSV.
+
+    Ranges are given either by a `network` CIDR column (GeoLite2 blocks layout) or by `start_ip`/`end_ip`
+    columns holding addresses or their integer values. Rows without coordinates are skipped.
+    """
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        columns = set(reader.fieldnames or ())
+        if not {'latitude', 'longitude'} <= columns:
+            raise IPRangeDatabaseError(f'{path}: latitude and longitude columns are required')
+        if 'network' in columns:
+            parse_range = parse_network_range
+        elif {'start_ip', 'end_ip'} <= columns:
+            parse_range = parse_start_end_range
+        else:
+            raise IPRangeDatabaseError(f'{path}: either a network or start_ip and end_ip columns are required')
+
+        for line, row in enumerate(reader, start=2):
+            if not row['latitude'] or not row['longitude']:
+                continue
+            try:
+                start, end = parse_range(row)
+                yield start, end, float(row['latitude']), float(row['longitude'])
+            except ValueError as error:
+                raise IPRangeDatabaseError(f'{path}:{line}: {error}')
+
+
+def parse_network_range(row: dict):
+    network = ipaddress.ip_network(row['network'], strict=False)
+    return network.network_address, network.broadcast_address
+
+
+def parse_start_end_range(row: dict):
+    start = parse_address(row['start_ip'])
+    end = parse_address(row['end_ip'])
+    if start.version != end.version or start > end:
+        raise ValueError(f'invalid range {row["start_ip"]} - {row["end_ip"]}')
+    return start, end
+
+
+def parse_address(value: str):
+    value = value.strip()
+    if value.isdigit():
+        return ipaddress.ip_address(int(value))
+    return ipaddress.ip_address(value)
@@ -0,0 +1,290 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone, timedelta
+
+from loguru import logger
+
+from geolocation.dns_resolver import CachingDNSResolver, DNSResolverSingleton
+from geolocation.location_provider import LocationProvider, LocationProviderSingleton
+from infrastructure.database.connector import DatabaseConnector, DatabaseSingleton
+from infrastructure.database.tables import IPLocation, HostnameLocation
+from ipstack_client.cache import get_uncached_locations
+from ipstack_client.rate_limiter import lookup_priority, BACKGROUND
+from utils.file_lock import FileLock, default_lock_path
+from utils.utils import get_bool_environment_variable, get_float_environment_variable, get_int_environment_variable
+
+REFRESH_TABLES = (IPLocation, HostnameLocation)
+REFRESH_ORDERS = ('age', 'frequency')
+
+
+class RefreshSchedulerSingleton:
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'RefreshScheduler | None':
+        if not get_bool_environment_variable('REFRESH_ENABLED', False):
+            return None
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    order = os.getenv('REFRESH_ORDER', 'age')
+                    if order not in REFRESH_ORDERS:
+                        raise EnvironmentError(f'Unknown REFRESH_ORDER {order}, expected age or frequency')
+                    cls._instance = RefreshScheduler(
+                        DatabaseSingleton.get_instance(),
+                        LocationProviderSingleton.get_instance(),
+                        dns_resolver=DNSResolverSingleton.get_instance(),
+                        max_age=get_float_environment_variable('REFRESH_MAX_AGE_SECONDS', 86400.0),
+                        interval=get_float_environment_variable('REFRESH_INTERVAL', 60.0),
+                        batch_size=get_int_environment_variable('REFRESH_BATCH_SIZE', 100),
+                        batch_interval=get_float_environment_variable('REFRESH_BATCH_INTERVAL', 1.0),
+                        order=order,
+                        retry_failed_after=get_float_environment_variable('REFRESH_RETRY_FAILED_AFTER', 3600.0),
+                        lock_path=os.getenv('REFRESH_LOCK_PATH') or default_lock_path('refresh'),
+                    )
+        return cls._instance
+
+
+@dataclass
+class RefreshStats:
+    leader: bool = False
+    order: str = 'age'
+    scans: int = 0
+    last_scan_seconds: float = 0.0
+    tracked_keys: int = 0
+    refreshed: dict[str, int] = field(default_factory=dict)
+    failed: dict[str, int] = field(default_factory=dict)
+    stale_keys: dict[str, int] = field(default_factory=dict)
+    lag_seconds: dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class AccessTracker:
+    """Counts reads of every key, halving the counts every `half_life` seconds so that recent reads weigh more.
+
+    Once more than `max_keys` keys are tracked, the less read half of them is forgotten.
+    """
+
+    def __init__(self, max_keys: int = 100000, half_life: float = 3600.0) -> None:
+        self._max_keys = max_keys
+        self._half_life = half_life
+        self._counts: dict[str, dict[str, float]] = {table.__tablename__: {} for table in REFRESH_TABLES}
+        self._decayed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return sum(len(counts) for counts in self._counts.values())
+
+    def record(self, table, key: str) -> None:
+        normalize_key = getattr(table, 'normalize_key', None)
+        if normalize_key is not None:
+            key = normalize_key(key)
+        counts = self._counts[table.__tablename__]
+        counts[key] = counts.get(key, 0.0) + 1.0
+        if len(counts) > self._max_keys:
+            kept = sorted(counts.items(), key=lambda item: item[1], reverse=True)[: self._max_keys // 2]
+            self._counts[table.__tablename__] = dict(kept)
+
+    def hottest(self, table) -> list[str]:
+        """Keys of `table` from the most to the least read."""
+        counts = self._counts[table.__tablename__]
+        return sorted(counts, key=counts.__getitem__, reverse=True)
+
+    def decay(self) -> None:
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._decayed_at) / self._half_life)
+        self._decayed_at = now
+        for name, counts in self._counts.items():
+            # keys read once more than about ten half-lives ago are forgotten
+            self._counts[name] = {key: count * factor for key, count in counts.items() if count * factor >= 0.001}
+
+
+class RefreshScheduler:
+    """Looks up again the keys whose newest location is older than `max_age` seconds, ahead of any request.
+
+    Every `interval` seconds up to `batch_size` stale keys of each table are located through the location provider
+    at background priority, so interactive and bulk lookups go first when ipstack is rate limited, and stored as new
+    locations. The lookups go past the caches of the provider, which would answer with the stale locations, and
+    replace the cached locations. Readers get the stale location until then. As long as full batches are refreshed
+    the next one follows after `batch_interval` seconds. Keys are picked oldest first, or with `order` 'frequency'
+    most read first and then oldest first. A key whose lookup failed is skipped for `retry_failed_after` seconds.
+
+    Only the worker process holding the file lock `lock_path` refreshes, the others try to take it over every
+    `interval` seconds. Reads are counted by every worker on its own, so the frequency order follows the reads
+    served by the refreshing worker.
+    """
+
+    def __init__(
+        self,
+        database: DatabaseConnector,
+        location_provider: LocationProvider,
+        dns_resolver: CachingDNSResolver | None = None,
+        max_age: float = 86400.0,
+        interval: float = 60.0,
+        batch_size: int = 100,
+        batch_interval: float = 1.0,
+        order: str = 'age',
+        retry_failed_after: float = 3600.0,
+        max_failed_keys: int = 10000,
+        lock_path: str | None = None,
+    ) -> None:
+        self._database = database
+        self._location_provider = location_provider
+        self._dns_resolver = dns_resolver
+        self._max_age = max_age
+        self._interval = interval
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._order = order
+        self._retry_failed_after = retry_failed_after
+        self._max_failed_keys = max_failed_keys
+        self._failed: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = FileLock(lock_path or default_lock_path('refresh'))
+        self._access_tracker = AccessTracker() if order == 'frequency' else None
+        self._task: asyncio.Task | None = None
+        self._stats = RefreshStats(order=order)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> RefreshStats:
+        self._stats.leader = self._lock.locked
+        self._stats.tracked_keys = len(self._access_tracker) if self._access_tracker is not None else 0
+        return self._stats
+
+    def record_access(self, table, key: str) -> None:
+        """Counts a read of `key`, only needed by the frequency order."""
+        if self._access_tracker is not None:
+            self._access_tracker.record(table, key)
+
+    async def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._lock.release()
+
+    async def refresh_once(self) -> bool:
+        """Refreshes one batch of stale keys of every table, returning whether more may be waiting."""
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        before = now - timedelta(seconds=self._max_age)
+        more = False
+        for table in REFRESH_TABLES:
+            name = table.__tablename__
+            count, oldest = await self._database.count_stale_keys(table, before)
+            self._stats.stale_keys[name] = count
+            # how long the most overdue key has been waiting for its refresh
+            self._stats.lag_seconds[name] = round((before - oldest).total_seconds(), 3) if oldest is not None else 0.0
+            if not count:
+                continue
+            keys = await self._select_batch(table, before)
+            if keys:
+                refreshed = await self._refresh(table, keys)
+                more = more or (len(keys) == self._batch_size and refreshed > 0)
+        if self._access_tracker is not None:
+            self._access_tracker.decay()
+        self._stats.scans += 1
+        self._stats.last_scan_seconds = round(time.perf_counter() - start, 6)
+        return more
+
+    async def _run(self) -> None:
+        while True:
+            if not self._lock.locked and not await self._lock.acquire(blocking=False):
+                await asyncio.sleep(self._interval)
+                continue
+            try:
+                more = await self.refresh_once()
+            except Exception as error:
+                logger.error(f'Error while refreshing stale locations: {error}')
+                more = False
+            await asyncio.sleep(self._batch_interval if more else self._interval)
+
+    async def _select_batch(self, table, before: datetime) -> list[str]:
+        name = table.__tablename__
+        now = time.monotonic()
+        while self._failed and next(iter(self._failed.values())) <= now:
+            self._failed.popitem(last=False)
+        skipped = {key for table_name, key in self._failed if table_name == name}
+
+        batch = []
+        if self._access_tracker is not None:
+            hottest = [key for key in self._access_tracker.hottest(table) if key not in skipped]
+            stale = set(await self._database.select_stale_keys(table, before, len(hottest), keys=hottest))
+            batch = [key for key in hottest if key in stale][: self._batch_size]
+        if len(batch) < self._batch_size:
+            chosen = set(batch)
+            oldest = await self._database.select_stale_keys(table, before, self._batch_size + len(skipped) + len(batch))
+            batch += [key for key in oldest if key not in skipped and key not in chosen][
+                : self._batch_size - len(batch)
+            ]
+        return batch
+
+    async def _refresh(self, table, keys: list[str]) -> int:
+        """Locates `keys` and stores their new locations, returning how many were refreshed."""
+        name = table.__tablename__
+        resolved_ips = {}
+        if table is HostnameLocation and self._dns_resolver is not None:
+            resolutions = await self._dns_resolver.resolve_many(keys)
+            # hostnames that do not resolve are located by hostname
+            resolved_ips = {hostname: ip for hostname, ip in resolutions.items() if isinstance(ip, str)}
+        lookup_keys = {key: resolved_ips.get(key, key) for key in keys}
+        try:
+            with lookup_priority(BACKGROUND):
+                # past the caches, which would answer with the stale locations, and into them
+                locations = await get_uncached_locations(
+                    self._location_provider, list(dict.fromkeys(lookup_keys.values()))
+                )
+        except Exception as error:
+            logger.error(f'Error while refreshing {len(keys)} locations from ipstack: {error}')
+            locations = {}
+
+        timestamp = datetime.now(timezone.utc)
+        rows = []
+        failed = []
+        for key, lookup_key in lookup_keys.items():
+            location = locations.get(lookup_key)
+            if location is None or isinstance(location, Exception):
+                failed.append(key)
+                continue
+            row = {
+                table.key_field: key,
+                'latitude': location.latitude,
+                'longitude': location.longitude,
+                'timestamp': timestamp,
+            }
+            if table is HostnameLocation:
+                row['resolved_ip'] = resolved_ips.get(key)
+            rows.append(row)
+        if rows:
+            try:
+                await self._database.insert_many(table, rows)
+            except Exception as error:
+                logger.error(f'Error while inserting {len(rows)} refreshed locations in database: {error}')
+                failed.extend(row[table.key_field] for row in rows)
+                rows = []
+
+        retry_at = time.monotonic() + self._retry_failed_after
+        for key in failed:
+            self._failed[(name, key)] = retry_at
+            self._failed.move_to_end((name, key))
+        while len(self._failed) > self._max_failed_keys:
+            self._failed.popitem(last=False)
+        self._stats.refreshed[name] = self._stats.refreshed.get(name, 0) + len(rows)
+        self._stats.failed[name] = self._stats.failed.get(name, 0) + len(failed)
+        return len(rows)
@@ -1,31 +1,52 @@
-from abc import abstractmethod
+from operator import attrgetter
 
-from loguru import logger
+from sqlalchemy import DateTime, TypeDecorator
 from sqlalchemy.orm import DeclarativeBase
-from datetime import datetime, timezone
+
+from utils.utils import to_utc
 
 
 class Base(DeclarativeBase):
     pass
 
 
+class UTCDateTime(TypeDecorator):
+    """Timezone aware datetime, stored and loaded in UTC.
+
+    Naive datetimes are taken as UTC. SQLite keeps no offset, so values it returns are naive and get UTC attached.
+    """
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_utc(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return to_utc(value) if value is not None else None
+
+
 class TableBase:
-    @abstractmethod
+    # column order of rows given as tuples to DatabaseConnector.insert_many
+    row_fields: tuple[str, ...] = ()
+    # columns computed from the other columns on insert, left out of the dicts
+    derived_fields: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        # runs once the table is mapped, the dict fields are looked up here instead of for every row
+        super().__init_subclass__(**kwargs)
+        fields = tuple(column.key for column in cls.__table__.columns if column.key not in cls.derived_fields)
+        content_fields = tuple(field for field in fields if field != 'id')
+        cls._dict_fields, cls._get_dict_values = fields, attrgetter(*fields)
+        cls._content_dict_fields, cls._get_content_dict_values = content_fields, attrgetter(*content_fields)
+
+    @staticmethod
+    def normalize_key(key: str) -> str:
+        # the value a key is stored as, keys of tables with a normalizing column type override it
+        return key
+
     def to_dict(self) -> dict:
-        return self._to_dict()
+        return dict(zip(self._dict_fields, self._get_dict_values(self)))
 
-    @abstractmethod
     def to_content_dict(self) -> dict:
-        table_dict = self._to_dict()
-        table_dict.pop('id', None)
-        return table_dict
-
-    def _to_dict(self):
-        table_dict = {}
-        for column in self.__table__.columns:
-            value = getattr(self, column.name)
-            if isinstance(value, datetime) and value.tzinfo is None:
-                logger.warning('No timezone info found in database. Assuming UTC.')
-                value = value.replace(tzinfo=timezone.utc)
-            table_dict[column.name] = value
-        return table_dict
+        return dict(zip(self._content_dict_fields, self._get_content_dict_values(self)))
@@ -1,13 +1,51 @@
-import copy
+import asyncio
 import os
 import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable, AsyncIterator
+from datetime import datetime
+from itertools import islice
 
-from sqlalchemy import Engine, event, select, delete
+from sqlalchemy import (
+    Engine,
+    event,
+    select,
+    delete,
+    insert,
+    update,
+    func,
+    tuple_,
+    or_,
+    and_,
+    bindparam,
+    inspect,
+    text,
+    Row,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.dialects.sqlite.aiosqlite import AsyncAdapt_aiosqlite_connection
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 from infrastructure.database.base import Base
-from infrastructure.database.tables import HostnameLocation, IPLocation
+from infrastructure.database.profiles import DatabaseProfile
+from infrastructure.database.tables import (
+    HostnameLocation,
+    IPLocation,
+    IPLatestLocation,
+    HostnameLatestLocation,
+    IPStackQuotaUsage,
+)
+from utils.ip_address import ip_to_key, normalize_ip, cidr_to_key_range
+from utils.geohash import encode_geohash, geohash_cells_covering, geohash_prefix_range, haversine_km
+from utils.metrics import STAGE_DURATION, DATABASE_POOL_CHECKOUT_DURATION, current_route
+from utils.utils import to_utc
+
+# max_overflow of QueuePool when none is configured
+DEFAULT_MAX_OVERFLOW = 10
 
 
 @event.listens_for(Engine, "connect")
@@ -18,6 +56,141 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor.close()
 
 
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    context.statement_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def observe_statement_duration(connection, cursor, statement, parameters, context, executemany):
+    STAGE_DURATION.observe(time.perf_counter() - context.statement_start, current_route(), 'database')
+
+
+class CheckoutTimingPool:
+    """Pool mixin recording how long a checkout waits for a connection, opening it included."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DATABASE_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - start)
+
+
+def checkout_timing_pool_class(pool_class):
+    # keeps the name, it is reported by pool_status
+    return type(pool_class.__name__, (CheckoutTimingPool, pool_class), {})
+
+
+def entity_to_row(entity) -> dict:
+    # every column but the id and the derived ones, Nones included, so that the rows of one table share their keys
+    # and can be inserted together
+    return entity.to_content_dict()
+
+
+def add_missing_columns(connection) -> set[tuple[str, str]]:
+    """Returns the (table, column) names added."""
+    # create_all skips tables that already exist, so columns added to existing tables are created here
+    inspector = inspect(connection)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                added.add((table.name, column.name))
+    return added
+
+
+def backfill_geohashes(connection, chunk_size: int = 10000) -> None:
+    # rows stored before the geohash column existed
+    for table in (IPLocation, HostnameLocation):
+        columns = table.__table__.c
+        statement = update(table.__table__).where(columns.id == bindparam('row_id')).values(geohash=bindparam('hash'))
+        while rows := connection.execute(
+            select(columns.id, columns.latitude, columns.longitude).where(columns.geohash.is_(None)).limit(chunk_size)
+        ).all():
+            connection.execute(
+                statement,
+                [{'row_id': row.id, 'hash': encode_geohash(row.latitude, row.longitude)} for row in rows],
+            )
+
+
+def backfill_ip_keys(connection, chunk_size: int = 10000) -> None:
+    # rows stored before the ip_key column existed, their ips are normalized as well
+    columns = IPLocation.__table__.c
+    statement = (
+        update(IPLocation.__table__)
+        .where(columns.id == bindparam('row_id'))
+        .values(ip=bindparam('address'), ip_key=bindparam('key'))
+    )
+    renamed = False
+    last_id = 0
+    while rows := connection.execute(
+        select(columns.id, columns.ip)
+        .where(columns.ip_key.is_(None), columns.id > last_id)
+        .order_by(columns.id)
+        .limit(chunk_size)
+    ).all():
+        updates = []
+        for row in rows:
+            key = ip_to_key(row.ip)
+            if key is not None:
+                updates.append({'row_id': row.id, 'address': normalize_ip(row.ip), 'key': key})
+                renamed = renamed or normalize_ip(row.ip) != row.ip
+        if updates:
+            connection.execute(statement, updates)
+        last_id = rows[-1].id
+    if renamed:
+        # spellings of the same ip may have had latest rows of their own, backfill_latest_tables rebuilds them
+        connection.execute(delete(IPLatestLocation))
+
+
+def create_missing_indexes(connection) -> None:
+    # create_all skips tables that already exist, so indexes added to existing tables are created here
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def insert_latest_from_history(table, keys: list[str] | None = None):
+    """Builds an insert of the newest history row of every key (or of `keys`) into the latest table of `table`."""
+    key_column = getattr(table, table.key_field)
+    rank = func.row_number().over(partition_by=key_column, order_by=(table.timestamp.desc(), table.id.desc()))
+    ranked = select(key_column, table.latitude, table.longitude, table.timestamp, rank.label('rank'))
+    if keys is not None:
+        ranked = ranked.where(key_column.in_(keys))
+    ranked = ranked.subquery()
+    columns = [table.key_field, 'latitude', 'longitude', 'timestamp']
+    return insert(table.latest_table.__table__).from_select(
+        columns, select(*[ranked.c[column] for column in columns]).where(ranked.c.rank == 1)
+    )
+
+
+def backfill_latest_tables(connection) -> None:
+    # latest tables added to an existing database start out empty
+    for table in (IPLocation, HostnameLocation):
+        if connection.execute(select(table.latest_table).limit(1)).first() is None:
+            connection.execute(insert_latest_from_history(table))
+
+
+def sqlite_pragma_setter(pragmas: dict[str, str | int]):
+    statements = []
+    for name, value in pragmas.items():
+        if not str(value).lstrip('-').isalnum():
+            raise ValueError(f'Invalid value {value} of SQLite pragma {name}')
+        statements.append(f'PRAGMA {name}={value}')
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    return set_pragmas
+
+
 class DatabaseSingleton:
     _instance = None
     _lock = threading.Lock()
@@ -27,29 +200,167 @@ class DatabaseSingleton:
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
-                    cls._instance = DatabaseConnector(os.getenv('DATABASE_URI'))
+                    cls._instance = DatabaseConnector(os.getenv('DATABASE_URI'), DatabaseProfile.from_environment())
         return cls._instance
 
 
 class DatabaseConnector:
-    def __init__(self, uri: str):
-        self.engine = create_async_engine(uri)
+    def __init__(self, uri: str, profile: DatabaseProfile | None = None):
+        self.profile = profile if profile is not None else DatabaseProfile()
+        url = make_url(uri)
+        engine_arguments = {}
+        if url.get_backend_name() == 'postgresql':
+            engine_arguments['connect_args'] = self.profile.postgresql_connect_args()
+        if url.get_backend_name() != 'sqlite':
+            engine_arguments.update(self.profile.pool_arguments())
+        elif url.database not in (None, '', ':memory:') and self.profile.pool_size is not None:
+            # aiosqlite opens a connection per checkout by default, pooling keeps connections and their page cache
+            engine_arguments.update(self.profile.pool_arguments(), poolclass=AsyncAdaptedQueuePool)
+        pool_class = engine_arguments.get('poolclass') or url.get_dialect().get_pool_class(url)
+        engine_arguments['poolclass'] = checkout_timing_pool_class(pool_class)
+        self.engine = create_async_engine(url, **engine_arguments)
+        if url.get_backend_name() == 'sqlite' and self.profile.sqlite_pragmas():
+            event.listen(self.engine.sync_engine, 'connect', sqlite_pragma_setter(self.profile.sqlite_pragmas()))
         self.AsyncSession = async_sessionmaker(self.engine, expire_on_commit=False)
 
+    async def warm_up(self, connections: int | None = None) -> None:
+        """Opens `connections` (by default the profile's `warmup_connections`) pooled connections at once.
+
+        The first requests then find connections in the pool with their pragmas or server settings applied.
+        """
+        connections = self.profile.warmup_connections if connections is None else connections
+        if connections <= 0:
+            return
+
+        async def connect() -> None:
+            async with self.engine.connect() as connection:
+                await connection.execute(text('SELECT 1'))
+
+        await asyncio.gather(*(connect() for _ in range(connections)))
+
+    def pool_status(self) -> dict:
+        """Describes the connection pool, `saturation` is the share of its capacity checked out."""
+        pool = self.engine.pool
+        status = {'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            checked_out = pool.checkedout()
+            # as configured, the pool does not expose it
+            max_overflow = self.profile.max_overflow if self.profile.max_overflow is not None else DEFAULT_MAX_OVERFLOW
+            # a negative max_overflow allows any number of connections, the pool size is the one limit known
+            capacity = pool.size() + max(max_overflow, 0)
+            status.update(
+                size=pool.size(),
+                max_overflow=max_overflow,
+                checked_in=pool.checkedin(),
+                checked_out=checked_out,
+                overflow=max(pool.overflow(), 0),
+                saturation=round(checked_out / capacity, 3) if capacity else 0.0,
+            )
+        return status
+
+    async def check_health(self) -> float:
+        """Runs a trivial query and returns its round trip time in seconds."""
+        start = time.perf_counter()
+        async with self.engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+        return time.perf_counter() - start
+
     async def create_tables(self):
         async with self.engine.begin() as connection:
             await connection.run_sync(Base.metadata.create_all)
+            added_columns = await connection.run_sync(add_missing_columns)
+            await connection.run_sync(backfill_geohashes)
+            # rows of hosts that are not ips keep no key, so the backfill runs once, when the column is added
+            if (IPLocation.__tablename__, 'ip_key') in added_columns:
+                await connection.run_sync(backfill_ip_keys)
+            await connection.run_sync(create_missing_indexes)
+            await connection.run_sync(backfill_latest_tables)
 
     async def insert(self, entity) -> int:
-        entity = copy.deepcopy(entity)
+        row = entity_to_row(entity)
+        ids = await self.insert_many(type(entity), [row], return_ids=True)
+        return ids[0]
+
+    async def insert_many(
+        self, table, rows: Iterable[dict | tuple], chunk_size: int = 1000, return_ids: bool = False
+    ) -> list[int] | None:
+        """Inserts `rows` in a single transaction, issuing one executemany per `chunk_size` rows.
+
+        Rows are either dicts of column values or tuples ordered as `table.row_fields`, which may leave out trailing
+        fields. All rows of one call must have the same fields.
+        Generated ids are returned in the order of `rows` when `return_ids` is set.
+        """
+        statement = insert(table.__table__)
+        if return_ids:
+            statement = statement.returning(table.__table__.c.id, sort_by_parameter_order=True)
+        parameters = (row if isinstance(row, dict) else dict(zip(table.row_fields, row)) for row in rows)
+        ids = []
         async with self.AsyncSession() as session:
             try:
-                session.add(entity)
+                while chunk := list(islice(parameters, chunk_size)):
+                    result = await session.execute(statement, chunk)
+                    if return_ids:
+                        ids.extend(result.scalars().all())
+                    if getattr(table, 'latest_table', None) is not None:
+                        await self._upsert_latest(session, table, chunk)
                 await session.commit()
-                return entity.id
             except Exception as error:
                 await session.rollback()
                 raise error
+        return ids if return_ids else None
+
+    async def _upsert_latest(self, session, table, rows: list[dict]) -> None:
+        newest_rows = {}
+        for row in rows:
+            # spellings of the same key must not be upserted twice by one statement
+            key = table.normalize_key(row[table.key_field])
+            newest_row = newest_rows.get(key)
+            if newest_row is None or to_utc(newest_row['timestamp']) <= to_utc(row['timestamp']):
+                newest_rows[key] = row
+        fields = (table.key_field, 'latitude', 'longitude', 'timestamp')
+        await session.execute(
+            self._upsert_latest_statement(table.latest_table),
+            [{field: row[field] for field in fields} for row in newest_rows.values()],
+        )
+
+    def _upsert_latest_statement(self, latest_table):
+        """Builds an upsert into `latest_table` that keeps a stored location newer than the inserted one."""
+        dialect_insert = postgresql_insert if self.engine.dialect.name == 'postgresql' else sqlite_insert
+        statement = dialect_insert(latest_table.__table__)
+        columns = latest_table.__table__.c
+        return statement.on_conflict_do_update(
+            index_elements=[columns[latest_table.key_field]],
+            set_={
+                'latitude': statement.excluded.latitude,
+                'longitude': statement.excluded.longitude,
+                'timestamp': statement.excluded.timestamp,
+            },
+            where=columns.timestamp <= statement.excluded.timestamp,
+        )
+
+    async def reserve_quota(self, month: str, lookups: int, quota: int) -> int | None:
+        """Adds `lookups` to the lookups used in `month` unless that exceeds `quota`.
+
+        Returns the new number of lookups used, None when the quota does not allow them. Concurrent reservations of
+        several processes are serialized by the database.
+        """
+        dialect_insert = postgresql_insert if self.engine.dialect.name == 'postgresql' else sqlite_insert
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                dialect_insert(IPStackQuotaUsage).values(month=month, used=0).on_conflict_do_nothing()
+            )
+            rows = await connection.execute(
+                update(IPStackQuotaUsage)
+                .where(IPStackQuotaUsage.month == month, IPStackQuotaUsage.used + lookups <= quota)
+                .values(used=IPStackQuotaUsage.used + lookups)
+                .returning(IPStackQuotaUsage.used)
+            )
+            return rows.scalar()
+
+    async def select_quota_used(self, month: str) -> int:
+        async with self.engine.connect() as connection:
+            rows = await connection.execute(select(IPStackQuotaUsage.used).where(IPStackQuotaUsage.month == month))
+            return rows.scalar() or 0
 
     async def select_all(self, table):
         async with self.AsyncSession() as session:
@@ -58,6 +369,69 @@ class DatabaseConnector:
             result = rows.scalars().all()
             return result
 
+    async def stream_locations(
+        self,
+        table,
+        key: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[Row]]:
+        """Streams `(key, latitude, longitude, timestamp)` rows of `table` in batches of `batch_size` rows.
+
+        Rows are fetched through a server-side cursor, so memory use does not depend on the size of the table.
+        """
+        key_column = getattr(table, table.key_field)
+        statement = select(key_column, table.latitude, table.longitude, table.timestamp)
+        if key is not None:
+            statement = statement.where(key_column == key)
+        if since is not None:
+            statement = statement.where(table.timestamp >= since)
+        if until is not None:
+            statement = statement.where(table.timestamp < until)
+        statement = statement.order_by(table.id).execution_options(yield_per=batch_size)
+        async with self.AsyncSession() as session:
+            result = await session.stream(statement)
+            async for partition in result.partitions():
+                yield partition
+
+    async def search_nearby(
+        self,
+        table,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        since: datetime | None = None,
+        limit: int = 100,
+        batch_size: int = 1000,
+    ) -> list[tuple[str, float, float, datetime, float]]:
+        """Returns `(key, latitude, longitude, timestamp, distance)` of the keys of `table` located within `radius_km`.
+
+        Rows are pruned by the geohash cells covering the circle and filtered by their haversine distance, every key
+        is returned once, at its nearest location, sorted by distance and cut to `limit`.
+        """
+        key_column = getattr(table, table.key_field)
+        cell_ranges = [geohash_prefix_range(cell) for cell in geohash_cells_covering(latitude, longitude, radius_km)]
+        statement = select(key_column, table.latitude, table.longitude, table.timestamp).where(
+            or_(*[and_(table.geohash >= low, table.geohash < high) for low, high in cell_ranges])
+        )
+        if since is not None:
+            statement = statement.where(table.timestamp >= since)
+        statement = statement.execution_options(yield_per=batch_size)
+
+        nearest = {}
+        async with self.AsyncSession() as session:
+            result = await session.stream(statement)
+            async for partition in result.partitions():
+                for key, row_latitude, row_longitude, timestamp in partition:
+                    distance = haversine_km(latitude, longitude, row_latitude, row_longitude)
+                    if distance > radius_km:
+                        continue
+                    current = nearest.get(key)
+                    if current is None or (distance, to_utc(current[3])) < (current[4], to_utc(timestamp)):
+                        nearest[key] = (key, row_latitude, row_longitude, timestamp, distance)
+        return sorted(nearest.values(), key=lambda location: (location[4], location[0]))[:limit]
+
     async def select_by_id(self, table, db_id: int):
         async with self.AsyncSession() as session:
             statement = select(table).where(table.id == db_id)
@@ -65,25 +439,199 @@ class DatabaseConnector:
             result = rows.unique().scalar_one_or_none()
             return result
 
-    async def select_by_hostname(self, hostname: str):
-        async with self.AsyncSession() as session:
-            statement = select(HostnameLocation).where(HostnameLocation.hostname == hostname)
-            rows = await session.execute(statement)
-            result = rows.scalars().all()
-            return result
+    async def select_by_hostname(
+        self,
+        hostname: str,
+        limit: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: tuple[datetime, int] | None = None,
+        descending: bool = False,
+    ):
+        return await self._select_page(
+            HostnameLocation, HostnameLocation.hostname == hostname, limit, since, until, after, descending
+        )
 
-    async def select_by_ip(self, ip: str):
-        async with self.AsyncSession() as session:
-            statement = select(IPLocation).where(IPLocation.ip == ip)
-            rows = await session.execute(statement)
-            result = rows.scalars().all()
-            return result
+    async def select_by_ip(
+        self,
+        ip: str,
+        limit: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: tuple[datetime, int] | None = None,
+        descending: bool = False,
+    ):
+        return await self._select_page(IPLocation, IPLocation.ip == ip, limit, since, until, after, descending)
+
+    async def _select_page(
+        self,
+        table,
+        key_condition,
+        limit: int | None,
+        since: datetime | None,
+        until: datetime | None,
+        after: tuple[datetime, int] | None,
+        descending: bool,
+    ):
+        """Selects locations of a key ordered by `(timestamp, id)`, in pages of `limit` rows.
+
+        `since` is inclusive and `until` exclusive. The next page starts after the `(timestamp, id)` of the last
+        row of the previous page given as `after`, so that every page is a range scan of the key and timestamp
+        index. Rows hold `latitude`, `longitude`, `timestamp` and `id` only.
+        """
+        async with self.engine.connect() as connection:
+            statement = select(table.latitude, table.longitude, table.timestamp, table.id).where(key_condition)
+            if since is not None:
+                statement = statement.where(table.timestamp >= since)
+            if until is not None:
+                statement = statement.where(table.timestamp < until)
+            position = tuple_(table.timestamp, table.id)
+            if after is not None:
+                statement = statement.where(position < after if descending else position > after)
+            if descending:
+                statement = statement.order_by(table.timestamp.desc(), table.id.desc())
+            else:
+                statement = statement.order_by(table.timestamp, table.id)
+            if limit is not None:
+                statement = statement.limit(limit)
+            rows = await connection.execute(statement)
+            return rows.all()
+
+    async def select_by_cidr(
+        self,
+        cidr: str,
+        limit: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: tuple[str, int] | None = None,
+    ):
+        """Selects locations of the IPs in the network `cidr` with a range scan over `ip_key`, ordered by IP.
+
+        The next page starts after the `(ip, id)` of the last location of the previous one, given by `after`.
+        Rows hold `id`, `ip`, `latitude`, `longitude` and `timestamp`. Raises ValueError for an invalid network.
+        """
+        low, high = cidr_to_key_range(cidr)
+        statement = select(
+            IPLocation.id, IPLocation.ip, IPLocation.latitude, IPLocation.longitude, IPLocation.timestamp
+        ).where(IPLocation.ip_key.between(low, high))
+        if since is not None:
+            statement = statement.where(IPLocation.timestamp >= since)
+        if until is not None:
+            statement = statement.where(IPLocation.timestamp < until)
+        if after is not None:
+            statement = statement.where(tuple_(IPLocation.ip_key, IPLocation.id) > (ip_to_key(after[0]), after[1]))
+        statement = statement.order_by(IPLocation.ip_key, IPLocation.id).limit(limit)
+        async with self.engine.connect() as connection:
+            rows = await connection.execute(statement)
+            return rows.all()
+
+    async def select_by_hostnames(
+        self, hostnames: list[str], latest: int | None = None, chunk_size: int = 500
+    ) -> dict[str, list[Row]]:
+        return await self._select_by_keys(HostnameLocation, HostnameLocation.hostname, hostnames, latest, chunk_size)
+
+    async def select_by_ips(
+        self, ips: list[str], latest: int | None = None, chunk_size: int = 500
+    ) -> dict[str, list[Row]]:
+        return await self._select_by_keys(IPLocation, IPLocation.ip, ips, latest, chunk_size)
+
+    async def _select_by_keys(self, table, key_column, keys: list[str], latest: int | None, chunk_size: int) -> dict:
+        """Selects locations of many keys with one `IN` query per `chunk_size` keys, grouped by key.
+
+        Locations of a key are ordered by time, with `latest` only the newest `latest` ones are selected. Rows hold
+        `latitude`, `longitude` and `timestamp`.
+        """
+        results = {key: [] for key in keys}
+        # the requested spellings of every stored key
+        requested_keys = defaultdict(list)
+        for key in results:
+            requested_keys[table.normalize_key(key)].append(key)
+        keys = list(requested_keys)
+        async with self.engine.connect() as connection:
+            for i in range(0, len(keys), chunk_size):
+                chunk = keys[i : i + chunk_size]
+                if latest is None:
+                    statement = (
+                        select(table.latitude, table.longitude, table.timestamp, key_column)
+                        .where(key_column.in_(chunk))
+                        .order_by(table.timestamp, table.id)
+                    )
+                else:
+                    row_number = func.row_number().over(
+                        partition_by=key_column, order_by=(table.timestamp.desc(), table.id.desc())
+                    )
+                    ranked = (
+                        select(table.id, table.latitude, table.longitude, table.timestamp, key_column)
+                        .add_columns(row_number.label('row_number'))
+                        .where(key_column.in_(chunk))
+                        .subquery()
+                    )
+                    statement = (
+                        select(ranked.c.latitude, ranked.c.longitude, ranked.c.timestamp, ranked.c[key_column.key])
+                        .where(ranked.c.row_number <= latest)
+                        .order_by(ranked.c.timestamp, ranked.c.id)
+                    )
+                rows = await connection.execute(statement)
+                for row in rows:
+                    for key in requested_keys[row[3]]:
+                        results[key].append(row)
+        return results
+
+    async def select_latest_by_hostname(self, hostname: str, since: datetime | None = None):
+        return await self._select_latest(HostnameLatestLocation, HostnameLatestLocation.hostname == hostname, since)
+
+    async def select_latest_by_ip(self, ip: str, since: datetime | None = None):
+        return await self._select_latest(IPLatestLocation, IPLatestLocation.ip == ip, since)
+
+    async def _select_latest(self, latest_table, key_condition, since: datetime | None) -> Row | None:
+        async with self.engine.connect() as connection:
+            statement = select(latest_table.latitude, latest_table.longitude, latest_table.timestamp).where(
+                key_condition
+            )
+            if since is not None:
+                statement = statement.where(latest_table.timestamp >= since)
+            rows = await connection.execute(statement)
+            return rows.first()
+
+    async def select_stale_keys(
+        self, table, before: datetime, limit: int, keys: list[str] | None = None, chunk_size: int = 500
+    ) -> list[str]:
+        """Keys of `table` whose newest location is older than `before`, oldest first, only among `keys` if given."""
+        latest_table = table.latest_table
+        key_column = getattr(latest_table, table.key_field)
+        statement = select(key_column, latest_table.timestamp).where(latest_table.timestamp < before)
+        async with self.engine.connect() as connection:
+            if keys is None:
+                rows = await connection.execute(statement.order_by(latest_table.timestamp).limit(limit))
+                return [row[0] for row in rows]
+            found = []
+            for i in range(0, len(keys), chunk_size):
+                rows = await connection.execute(statement.where(key_column.in_(keys[i : i + chunk_size])))
+                found.extend(rows.all())
+        return [key for key, _ in sorted(found, key=lambda row: row[1])[:limit]]
+
+    async def count_stale_keys(self, table, before: datetime) -> tuple[int, datetime | None]:
+        """Number of keys of `table` whose newest location is older than `before`, and the oldest such location."""
+        latest_table = table.latest_table
+        async with self.engine.connect() as connection:
+            rows = await connection.execute(
+                select(func.count(), func.min(latest_table.timestamp)).where(latest_table.timestamp < before)
+            )
+            count, oldest = rows.one()
+        return count, to_utc(oldest) if oldest is not None else None
 
     async def delete_by_id(self, table, db_id: int):
         async with self.AsyncSession() as session:
             try:
+                latest_table = getattr(table, 'latest_table', None)
+                if latest_table is not None:
+                    key = await session.scalar(select(getattr(table, table.key_field)).where(table.id == db_id))
                 statement = delete(table).where(table.id == db_id)
                 await session.execute(statement)
+                if latest_table is not None and key is not None:
+                    # the deleted row may have been the newest one of its key
+                    await session.execute(delete(latest_table).where(getattr(latest_table, table.key_field) == key))
+                    await session.execute(insert_latest_from_history(table, [key]))
                 await session.commit()
             except Exception as error:
                 await session.rollback()
@@ -94,16 +642,40 @@ class DatabaseConnector:
             try:
                 statement = delete(HostnameLocation).where(HostnameLocation.hostname == hostname)
                 await session.execute(statement)
+                statement = delete(HostnameLatestLocation).where(HostnameLatestLocation.hostname == hostname)
+                await session.execute(statement)
                 await session.commit()
             except Exception as error:
                 await session.rollback()
                 raise error
 
+    async def delete_locations_by_cidr(self, cidr: str) -> int:
+        """Deletes the locations of the IPs in the network `cidr`, returning their number.
+
+        Raises ValueError for an invalid network.
+        """
+        low, high = cidr_to_key_range(cidr)
+        in_network = IPLocation.ip_key.between(low, high)
+        async with self.AsyncSession() as session:
+            try:
+                statement = delete(IPLatestLocation).where(
+                    IPLatestLocation.ip.in_(select(IPLocation.ip).where(in_network))
+                )
+                await session.execute(statement)
+                result = await session.execute(delete(IPLocation).where(in_network))
+                await session.commit()
+                return result.rowcount
+            except Exception as error:
+                await session.rollback()
+                raise error
+
     async def delete_location_by_ip(self, ip: str):
         async with self.AsyncSession() as session:
             try:
                 statement = delete(IPLocation).where(IPLocation.ip == ip)
                 await session.execute(statement)
+                statement = delete(IPLatestLocation).where(IPLatestLocation.ip == ip)
+                await session.execute(statement)
                 await session.commit()
             except Exception as error:
                 await session.rollback()
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.profiles import DatabaseProfile
+from infrastructure.database.tables import LOCATION_TABLES
+from utils.location_export import encode_locations, EXPORT_FORMATS
+from utils.utils import to_utc
+
+
+async def export_locations(
+    uri: str,
+    table_name: str,
+    export_format: str,
+    output,
+    key: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    compress: bool = False,
+) -> None:
+    table = LOCATION_TABLES[table_name]
+    database = DatabaseConnector(uri, DatabaseProfile.from_environment())
+    try:
+        partitions = database.stream_locations(table, key=key, since=since, until=until)
+        async for chunk in encode_locations(partitions, table.key_field, export_format, compress=compress):
+            output.write(chunk)
+    finally:
+        await database.engine.dispose()
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Streams a location table of DATABASE_URI as NDJSON or CSV.')
+    parser.add_argument('--table', choices=sorted(LOCATION_TABLES), default='ip')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--key', help='only export locations of this IP or hostname')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='inclusive ISO 8601 timestamp')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='exclusive ISO 8601 timestamp')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--output', help='output file, standard output by default')
+    parsed_arguments = parser.parse_args(arguments)
+
+    load_dotenv()
+    uri = os.getenv('DATABASE_URI')
+    if uri is None:
+        raise EnvironmentError('DATABASE_URI is not set')
+
+    output = open(parsed_arguments.output, 'wb') if parsed_arguments.output else sys.stdout.buffer
+    try:
+        asyncio.run(
+            export_locations(
+                uri,
+                parsed_arguments.table,
+                parsed_arguments.format,
+                output,
+                key=parsed_arguments.key,
+                since=to_utc(parsed_arguments.since) if parsed_arguments.since is not None else None,
+                until=to_utc(parsed_arguments.until) if parsed_arguments.until is not None else None,
+                compress=parsed_arguments.gzip,
+            )
+        )
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
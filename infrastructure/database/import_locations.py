@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.profiles import DatabaseProfile
+from infrastructure.database.tables import LOCATION_TABLES
+from utils.location_import import import_locations, IMPORT_FORMATS, LocationImportSummary
+
+READ_SIZE = 1024 * 1024
+
+
+async def read_chunks(file):
+    while chunk := await asyncio.to_thread(file.read, READ_SIZE):
+        yield chunk
+
+
+async def import_file(uri: str, table_name: str, import_format: str, file, batch_size: int) -> LocationImportSummary:
+    database = DatabaseConnector(uri, DatabaseProfile.from_environment())
+    try:
+        await database.create_tables()
+        return await import_locations(
+            database, LOCATION_TABLES[table_name], read_chunks(file), import_format, batch_size=batch_size
+        )
+    finally:
+        await database.engine.dispose()
+
+
+def main(arguments: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Imports pre-resolved locations from NDJSON or CSV into a location table of DATABASE_URI.'
+    )
+    parser.add_argument('input', nargs='?', help='input file, optionally gzipped, standard input by default')
+    parser.add_argument('--table', choices=sorted(LOCATION_TABLES), default='ip')
+    parser.add_argument('--format', choices=IMPORT_FORMATS, default='ndjson')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per transaction')
+    parsed_arguments = parser.parse_args(arguments)
+
+    load_dotenv()
+    uri = os.getenv('DATABASE_URI')
+    if uri is None:
+        raise EnvironmentError('DATABASE_URI is not set')
+
+    file = open(parsed_arguments.input, 'rb') if parsed_arguments.input else sys.stdin.buffer
+    start = time.perf_counter()
+    try:
+        summary = asyncio.run(
+            import_file(uri, parsed_arguments.table, parsed_arguments.format, file, parsed_arguments.batch_size)
+        )
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
+    print(json.dumps(summary.to_dict()))
+    print(
+        f'Imported {summary.imported} rows, {summary.failed} failed, in {time.perf_counter() - start:.1f}s',
+        file=sys.stderr,
+    )
+    if summary.aborted is not None:
+        print(f'Import stopped: {summary.aborted}', file=sys.stderr)
+    if summary.failed or summary.aborted is not None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
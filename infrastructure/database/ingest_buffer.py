@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+
+from loguru import logger
+
+from infrastructure.database.connector import DatabaseConnector, DatabaseSingleton, entity_to_row
+from model.base.ip_locator_exception import IPLocatorIngestBufferFullException
+from utils.metrics import REGISTRY
+from utils.utils import get_bool_environment_variable, get_int_environment_variable, get_float_environment_variable
+
+FLUSH_DURATION = REGISTRY.histogram(
+    'ip_locator_ingest_buffer_flush_duration_seconds', 'Time a group commit of the ingest buffer took'
+)
+ROWS = REGISTRY.counter(
+    'ip_locator_ingest_buffer_rows_total',
+    'Locations that left the ingest buffer by outcome, flushed, failed or dropped at shutdown',
+    ('outcome',),
+)
+
+
+class IngestBufferSingleton:
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'IngestBuffer | None':
+        if not get_bool_environment_variable('DATABASE_WRITE_BEHIND', False):
+            return None
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = IngestBuffer(
+                        DatabaseSingleton.get_instance(),
+                        max_size=get_int_environment_variable('DATABASE_WRITE_BEHIND_QUEUE_SIZE', 10000),
+                        batch_size=get_int_environment_variable('DATABASE_WRITE_BEHIND_BATCH_SIZE', 500),
+                        flush_interval=get_float_environment_variable('DATABASE_WRITE_BEHIND_FLUSH_INTERVAL', 0.05),
+                        put_timeout=get_float_environment_variable('DATABASE_WRITE_BEHIND_PUT_TIMEOUT', 5.0),
+                        stop_timeout=get_float_environment_variable('DATABASE_WRITE_BEHIND_STOP_TIMEOUT', 30.0),
+                    )
+        return cls._instance
+
+
+@dataclass
+class IngestBufferStats:
+    queue_depth: int = 0
+    queue_size: int = 0
+    flushes: int = 0
+    flushed_rows: int = 0
+    failed_rows: int = 0
+    dropped_rows: int = 0
+    last_flush_seconds: float = 0.0
+    max_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class IngestBuffer:
+    """Write-behind queue of entities that a background task stores in group commits.
+
+    A batch is flushed once `batch_size` entities are queued or `flush_interval` seconds passed since its first
+    entity. When `max_size` entities are waiting, `put` blocks for up to `put_timeout` seconds. `stop` waits up to
+    `stop_timeout` seconds for the queued entities to be stored, those still waiting then are dropped.
+    """
+
+    def __init__(
+        self,
+        database: DatabaseConnector,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        put_timeout: float = 5.0,
+        stop_timeout: float = 30.0,
+    ) -> None:
+        self._database = database
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._put_timeout = put_timeout
+        self._stop_timeout = stop_timeout
+        # entities taken from the queue whose rows were neither stored nor failed yet
+        self._unflushed = 0
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._stats = IngestBufferStats(queue_size=max_size)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> IngestBufferStats:
+        self._stats.queue_depth = self._queue.qsize()
+        return self._stats
+
+    async def start(self) -> None:
+        if not self.running:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops accepting entities and waits up to `stop_timeout` seconds until everything queued is stored."""
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self._stop_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # the rest of a flush cut short and the entities still queued
+        dropped = self._unflushed
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            dropped += 1
+        self._unflushed = 0
+        if dropped:
+            logger.error(f'Dropped {dropped} locations not stored within {self._stop_timeout}s of shutdown')
+            self._stats.dropped_rows += dropped
+            ROWS.inc('dropped', amount=dropped)
+
+    async def put(self, entity) -> None:
+        if not self.running or self._closing:
+            raise RuntimeError('Ingest buffer is not running')
+        try:
+            await asyncio.wait_for(self._queue.put(entity), timeout=self._put_timeout)
+        except asyncio.TimeoutError:
+            raise IPLocatorIngestBufferFullException(f'Ingest buffer is full ({self._queue.maxsize} entities)')
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            self._unflushed += 1
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                    self._unflushed += 1
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list) -> None:
+        rows_by_table = defaultdict(list)
+        for entity in batch:
+            rows_by_table[type(entity)].append(entity_to_row(entity))
+
+        start = time.perf_counter()
+        for table, rows in rows_by_table.items():
+            try:
+                await self._database.insert_many(table, rows, chunk_size=self._batch_size)
+                self._stats.flushed_rows += len(rows)
+                ROWS.inc('flushed', amount=len(rows))
+            except Exception as error:
+                logger.error(f'Error while flushing {len(rows)} {table.__tablename__} rows to database: {error}')
+                self._stats.failed_rows += len(rows)
+                ROWS.inc('failed', amount=len(rows))
+            self._unflushed -= len(rows)
+        elapsed = time.perf_counter() - start
+        FLUSH_DURATION.observe(elapsed)
+
+        self._stats.flushes += 1
+        self._stats.last_flush_seconds = elapsed
+        self._stats.max_flush_seconds = max(self._stats.max_flush_seconds, elapsed)
+        self._stats.total_flush_seconds += elapsed
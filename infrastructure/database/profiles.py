@@ -0,0 +1,131 @@
+import os
+from dataclasses import dataclass, fields, replace
+from typing import get_args
+
+from utils.utils import get_bool_environment_variable, get_int_environment_variable, get_float_environment_variable
+
+
+@dataclass(frozen=True)
+class DatabaseProfile:
+    """Engine, pool and per-connection settings of a database, None leaves the driver or server default.
+
+    SQLite settings are applied as pragmas to every new connection, Postgres settings as asyncpg connection
+    arguments. Pool settings apply to both.
+    """
+
+    # SQLite
+    journal_mode: str | None = None
+    synchronous: str | None = None
+    mmap_size: int | None = None
+    cache_size: int | None = None
+    busy_timeout: int | None = None
+    # Postgres
+    prepared_statement_cache_size: int | None = None
+    statement_timeout: int | None = None
+    # pool
+    pool_size: int | None = None
+    max_overflow: int | None = None
+    pool_timeout: float | None = None
+    pool_recycle: int | None = None
+    pool_pre_ping: bool = False
+    # connections opened at startup
+    warmup_connections: int = 0
+
+    @classmethod
+    def from_environment(cls) -> 'DatabaseProfile':
+        """Returns the profile named by `DATABASE_PROFILE` with the settings given by environment variables."""
+        name = os.getenv('DATABASE_PROFILE') or 'default'
+        if name not in DATABASE_PROFILES:
+            raise EnvironmentError(f'Unknown DATABASE_PROFILE {name}, expected one of {", ".join(DATABASE_PROFILES)}')
+        profile = DATABASE_PROFILES[name]
+        overrides = {}
+        for field in fields(cls):
+            variable = ENVIRONMENT_VARIABLES[field.name]
+            if not os.getenv(variable):
+                continue
+            types = get_args(field.type) or (field.type,)
+            if bool in types:
+                overrides[field.name] = get_bool_environment_variable(variable, False)
+            elif int in types:
+                overrides[field.name] = get_int_environment_variable(variable, 0)
+            elif float in types:
+                overrides[field.name] = get_float_environment_variable(variable, 0.0)
+            else:
+                overrides[field.name] = os.getenv(variable)
+        return replace(profile, **overrides)
+
+    def sqlite_pragmas(self) -> dict[str, str | int]:
+        pragmas = {
+            'journal_mode': self.journal_mode,
+            'synchronous': self.synchronous,
+            'mmap_size': self.mmap_size,
+            'cache_size': self.cache_size,
+            'busy_timeout': self.busy_timeout,
+        }
+        return {name: value for name, value in pragmas.items() if value is not None}
+
+    def postgresql_connect_args(self) -> dict:
+        connect_args = {}
+        if self.prepared_statement_cache_size is not None:
+            connect_args['prepared_statement_cache_size'] = self.prepared_statement_cache_size
+        if self.statement_timeout is not None:
+            connect_args['server_settings'] = {'statement_timeout': str(self.statement_timeout)}
+        return connect_args
+
+    def pool_arguments(self) -> dict:
+        arguments = {
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.pool_timeout,
+            'pool_recycle': self.pool_recycle,
+        }
+        arguments = {name: value for name, value in arguments.items() if value is not None}
+        arguments['pool_pre_ping'] = self.pool_pre_ping
+        return arguments
+
+
+ENVIRONMENT_VARIABLES = {
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT',
+    'prepared_statement_cache_size': 'DATABASE_PREPARED_STATEMENT_CACHE_SIZE',
+    'statement_timeout': 'DATABASE_STATEMENT_TIMEOUT',
+    'pool_size': 'DATABASE_POOL_SIZE',
+    'max_overflow': 'DATABASE_MAX_OVERFLOW',
+    'pool_timeout': 'DATABASE_POOL_TIMEOUT',
+    'pool_recycle': 'DATABASE_POOL_RECYCLE',
+    'pool_pre_ping': 'DATABASE_POOL_PRE_PING',
+    'warmup_connections': 'DATABASE_WARMUP_CONNECTIONS',
+}
+
+DATABASE_PROFILES = {
+    # driver and server defaults
+    'default': DatabaseProfile(),
+    # concurrent readers next to a writer, commits survive a crash of the process but not of the machine
+    'throughput': DatabaseProfile(
+        journal_mode='WAL',
+        synchronous='NORMAL',
+        mmap_size=256 * 1024 * 1024,
+        cache_size=-64 * 1024,
+        busy_timeout=5000,
+        prepared_statement_cache_size=500,
+        statement_timeout=30000,
+        pool_size=20,
+        max_overflow=20,
+        pool_timeout=10,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        warmup_connections=5,
+    ),
+    # every commit is synced to disk
+    'durable': DatabaseProfile(
+        journal_mode='WAL',
+        synchronous='FULL',
+        busy_timeout=10000,
+        statement_timeout=60000,
+        pool_pre_ping=True,
+        warmup_connections=1,
+    ),
+}
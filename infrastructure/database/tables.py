@@ -1,23 +1,96 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, Index, LargeBinary
 
-from infrastructure.database.base import Base, TableBase
+from infrastructure.database.base import Base, TableBase, UTCDateTime
+from infrastructure.database.types import IPAddressString
+from utils.geohash import encode_geohash, GEOHASH_PRECISION
+from utils.ip_address import ip_to_key, normalize_ip, IP_KEY_WIDTH
+
+
+def geohash_of_inserted_row(context) -> str:
+    parameters = context.get_current_parameters()
+    return encode_geohash(parameters['latitude'], parameters['longitude'])
+
+
+def ip_key_of_inserted_row(context) -> bytes | None:
+    return ip_to_key(context.get_current_parameters()['ip'])
 
 
 class LocationAndTimeMixin:
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
-    timestamp = Column(DateTime(timezone=True), nullable=False)
+    timestamp = Column(UTCDateTime, nullable=False)
+
+
+class GeohashMixin:
+    # computed on insert, prunes proximity searches to the rows of a few geohash prefixes
+    geohash = Column(String(GEOHASH_PRECISION), default=geohash_of_inserted_row)
+
+
+class IPStackQuotaUsage(Base):
+    """Lookups counted against the ipstack monthly quota, by UTC month, shared by all workers and restarts."""
+
+    __tablename__ = "ipstack_quota_usage"
 
+    # YYYY-MM
+    month = Column(String(7), primary_key=True)
+    used = Column(Integer, nullable=False)
 
-class IPLocation(Base, TableBase, LocationAndTimeMixin):
+
+class IPLatestLocation(Base, TableBase, LocationAndTimeMixin):
+    __tablename__ = "ip_address_latest"
+    # finds the stale locations to refresh
+    __table_args__ = (Index('ix_ip_address_latest_timestamp', 'timestamp'),)
+    key_field = 'ip'
+    normalize_key = staticmethod(normalize_ip)
+
+    ip = Column(IPAddressString, primary_key=True)
+
+
+class HostnameLatestLocation(Base, TableBase, LocationAndTimeMixin):
+    __tablename__ = "url_address_latest"
+    __table_args__ = (Index('ix_url_address_latest_timestamp', 'timestamp'),)
+    key_field = 'hostname'
+
+    hostname = Column(String, primary_key=True)
+
+
+class IPLocation(Base, TableBase, LocationAndTimeMixin, GeohashMixin):
     __tablename__ = "ip_address"
+    __table_args__ = (
+        Index('ix_ip_address_ip_timestamp', 'ip', 'timestamp'),
+        Index('ix_ip_address_geohash', 'geohash'),
+        Index('ix_ip_address_ip_key_id', 'ip_key', 'id'),
+    )
+    row_fields = ('ip', 'latitude', 'longitude', 'timestamp')
+    derived_fields = ('geohash', 'ip_key')
+    key_field = 'ip'
+    normalize_key = staticmethod(normalize_ip)
+    # newest location of every ip, maintained by DatabaseConnector together with this table
+    latest_table = IPLatestLocation
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ip = Column(String, index=True, nullable=False)
+    ip = Column(IPAddressString, nullable=False)
+    # order-preserving binary form of ip, NULL when ip is no IP address
+    ip_key = Column(LargeBinary(IP_KEY_WIDTH), default=ip_key_of_inserted_row)
 
 
-class HostnameLocation(Base, TableBase, LocationAndTimeMixin):
+class HostnameLocation(Base, TableBase, LocationAndTimeMixin, GeohashMixin):
     __tablename__ = "url_address"
+    __table_args__ = (
+        Index('ix_url_address_hostname_timestamp', 'hostname', 'timestamp'),
+        Index('ix_url_address_geohash', 'geohash'),
+    )
+    # rows may leave out resolved_ip
+    row_fields = ('hostname', 'latitude', 'longitude', 'timestamp', 'resolved_ip')
+    derived_fields = ('geohash',)
+    key_field = 'hostname'
+    # newest location of every hostname, maintained by DatabaseConnector together with this table
+    latest_table = HostnameLatestLocation
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    hostname = Column(String, index=True, nullable=False)
+    hostname = Column(String, nullable=False)
+    # IP address the hostname resolved to when it was located, NULL when it was located by hostname
+    resolved_ip = Column(IPAddressString)
+
+
+LOCATION_TABLES = {'ip': IPLocation, 'url': HostnameLocation}
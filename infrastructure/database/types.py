@@ -0,0 +1,13 @@
+from sqlalchemy import String, TypeDecorator
+
+from utils.ip_address import normalize_ip
+
+
+class IPAddressString(TypeDecorator):
+    """IP address stored in its canonical spelling, so that spellings of the same address compare equal."""
+
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return normalize_ip(value) if isinstance(value, str) else value
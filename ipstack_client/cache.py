@@ -0,0 +1,216 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+from ipstack_client.models import (
+    LocationResponse,
+    IPStackAPIClientError,
+    IPStackAPIClientTransientError,
+    IPStackCircuitOpenError,
+    IPStackRateLimitError,
+    IPStackQuotaExceededError,
+)
+
+# errors that tell nothing about the host, looking it up again may well succeed
+UNCACHED_ERRORS = (
+    IPStackAPIClientTransientError,
+    IPStackCircuitOpenError,
+    IPStackRateLimitError,
+    IPStackQuotaExceededError,
+)
+
+
+async def get_uncached_locations(client, hosts: list[str]) -> dict[str, LocationResponse | Exception]:
+    """Looks `hosts` up with `client`, past the caches it is wrapped in, which keep the locations found."""
+    get_fresh_locations = getattr(client, 'get_fresh_locations', None)
+    if get_fresh_locations is None:
+        return await client.get_locations(hosts)
+    return await get_fresh_locations(hosts)
+
+
+@dataclass
+class LocationCacheStats:
+    hits: int = 0
+    misses: int = 0
+    negative_hits: int = 0
+    evictions: int = 0
+    coalesced: int = 0
+    size: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class CachedLocationClient:
+    """Caches `get_location` results of the wrapped client.
+
+    Successful lookups are kept for `ttl` seconds and errors upstream answered with, such as an invalid host, for
+    `error_ttl` seconds. Transient errors and those of the circuit breaker and the rate limiter are not kept. The
+    least recently used entry is evicted once `max_size` is reached. Concurrent lookups of the same host share
+    a single upstream call.
+    """
+
+    def __init__(self, client, max_size: int = 10000, ttl: float = 300.0, error_ttl: float = 5.0) -> None:
+        self._client = client
+        self._max_size = max_size
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        self._entries: OrderedDict[str, tuple[float, LocationResponse | IPStackAPIClientError]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._stats = LocationCacheStats()
+
+    @property
+    def client(self):
+        return self._client
+
+    def stats(self) -> LocationCacheStats:
+        self._stats.size = len(self._entries)
+        return self._stats
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_location(self, host: str) -> LocationResponse:
+        cached = self._get_cached(host)
+        if cached is not None:
+            if isinstance(cached, IPStackAPIClientError):
+                self._stats.negative_hits += 1
+                raise type(cached)(*cached.args)
+            self._stats.hits += 1
+            return cached
+
+        in_flight = self._in_flight.get(host)
+        if in_flight is not None:
+            self._stats.coalesced += 1
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # the lookup we joined was cancelled together with its caller, do our own unless we are cancelled too
+                if in_flight.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.get_location(host)
+                raise
+
+        self._stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[host] = future
+        try:
+            location = await self._client.get_location(host)
+        except IPStackAPIClientError as error:
+            self._put_error(host, error)
+            future.set_exception(error)
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            self._put(host, location, self._ttl)
+            future.set_result(location)
+            return location
+        finally:
+            del self._in_flight[host]
+            # retrieve the exception so that futures nobody awaited do not log "exception was never retrieved"
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        results = {}
+        joined = {}
+        missing = []
+        for host in dict.fromkeys(hosts):
+            cached = self._get_cached(host)
+            if cached is not None:
+                if isinstance(cached, IPStackAPIClientError):
+                    self._stats.negative_hits += 1
+                else:
+                    self._stats.hits += 1
+                results[host] = cached
+            elif host in self._in_flight:
+                self._stats.coalesced += 1
+                joined[host] = self._in_flight[host]
+            else:
+                self._stats.misses += 1
+                missing.append(host)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {host: loop.create_future() for host in missing}
+            self._in_flight.update(futures)
+            try:
+                fetched = await self._client.get_locations(missing)
+            except IPStackAPIClientError as error:
+                fetched = {host: error for host in missing}
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            finally:
+                for host in missing:
+                    del self._in_flight[host]
+            for host, future in futures.items():
+                value = fetched.get(host, IPStackAPIClientError('Missing in upstream response'))
+                if isinstance(value, IPStackAPIClientError):
+                    self._put_error(host, value)
+                    future.set_exception(value)
+                    future.exception()
+                else:
+                    self._put(host, value, self._ttl)
+                    future.set_result(value)
+                results[host] = value
+
+        for host, future in joined.items():
+            try:
+                results[host] = await asyncio.shield(future)
+            except IPStackAPIClientError as error:
+                results[host] = error
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                results[host] = (await self.get_locations([host]))[host]
+
+        return {host: results[host] for host in dict.fromkeys(hosts)}
+
+    async def get_fresh_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        """Looks `hosts` up past the cache, replacing the cached locations with those found.
+
+        Errors are not cached, the cached locations of hosts failing to be looked up are kept.
+        """
+        hosts = list(dict.fromkeys(hosts))
+        try:
+            fetched = await get_uncached_locations(self._client, hosts)
+        except IPStackAPIClientError as error:
+            fetched = {host: error for host in hosts}
+        for host, value in fetched.items():
+            if isinstance(value, LocationResponse):
+                self._put(host, value, self._ttl)
+        return {host: fetched.get(host, IPStackAPIClientError('Missing in upstream response')) for host in hosts}
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def _get_cached(self, host: str) -> LocationResponse | IPStackAPIClientError | None:
+        entry = self._entries.get(host)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[host]
+            return None
+        self._entries.move_to_end(host)
+        return value
+
+    def _put_error(self, host: str, error: IPStackAPIClientError) -> None:
+        if not isinstance(error, UNCACHED_ERRORS):
+            self._put(host, error, self._error_ttl)
+
+    def _put(self, host: str, value: LocationResponse | IPStackAPIClientError, ttl: float) -> None:
+        if ttl <= 0 or self._max_size <= 0:
+            return
+        self._entries[host] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(host)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
@@ -1,9 +1,20 @@
+import asyncio
+import ipaddress
 import os
 import threading
+import time
 import urllib
 
-import requests
-from pydantic import BaseModel, ValidationError
+import httpx
+
+from infrastructure.database.connector import DatabaseSingleton
+from ipstack_client.cache import CachedLocationClient
+from ipstack_client.rate_limiter import RateLimiter, INTERACTIVE, BULK, BACKGROUND
+from ipstack_client.resilience import ResilientLocationClient
+from ipstack_client.shared_cache import SharedCacheLocationClient, SharedLocationCache
+from ipstack_client.models import LocationResponse, IPStackAPIClientError, IPStackAPIClientTransientError
+from utils.metrics import UPSTREAM_REQUESTS, UPSTREAM_DURATION, stage
+from utils.utils import get_bool_environment_variable, get_float_environment_variable, get_int_environment_variable
 
 
 class IPStackAPIClientSingleton:
@@ -11,47 +22,229 @@ class IPStackAPIClientSingleton:
     _lock = threading.Lock()
 
     @classmethod
-    def get_instance(cls) -> 'IPStackAPIClient':
+    def get_instance(
+        cls,
+    ) -> 'IPStackAPIClient | ResilientLocationClient | SharedCacheLocationClient | CachedLocationClient':
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
-                    cls._instance = IPStackAPIClient(
-                        baseurl='http://api.ipstack.com/', access_key=os.getenv('IPSTACK_KEY')
+                    bulk_chunk_size = get_int_environment_variable('IPSTACK_BULK_CHUNK_SIZE', 50)
+                    bulk_concurrency = get_int_environment_variable('IPSTACK_BULK_CONCURRENCY', 8)
+                    client = IPStackAPIClient(
+                        baseurl=os.getenv('IPSTACK_BASE_URL', 'http://api.ipstack.com/'),
+                        access_key=os.getenv('IPSTACK_KEY'),
+                        max_connections=get_int_environment_variable('IPSTACK_MAX_CONNECTIONS', 100),
+                        max_keepalive_connections=get_int_environment_variable('IPSTACK_MAX_KEEPALIVE_CONNECTIONS', 20),
+                        connect_timeout=get_float_environment_variable('IPSTACK_CONNECT_TIMEOUT', 3.0),
+                        read_timeout=get_float_environment_variable('IPSTACK_READ_TIMEOUT', 10.0),
+                        bulk_chunk_size=bulk_chunk_size,
+                        bulk_concurrency=bulk_concurrency,
+                        rate_limiter=create_rate_limiter(),
                     )
+                    if get_bool_environment_variable('IPSTACK_RESILIENCE', True):
+                        client = ResilientLocationClient(
+                            client,
+                            attempt_timeout=get_float_environment_variable('IPSTACK_ATTEMPT_TIMEOUT', 5.0),
+                            total_timeout=get_float_environment_variable('IPSTACK_TOTAL_TIMEOUT', 12.0),
+                            max_attempts=get_int_environment_variable('IPSTACK_MAX_ATTEMPTS', 3),
+                            backoff=get_float_environment_variable('IPSTACK_RETRY_BACKOFF', 0.1),
+                            max_backoff=get_float_environment_variable('IPSTACK_RETRY_MAX_BACKOFF', 2.0),
+                            retry_budget_ratio=get_float_environment_variable('IPSTACK_RETRY_BUDGET_RATIO', 0.2),
+                            retry_budget_reserve=get_float_environment_variable('IPSTACK_RETRY_BUDGET_RESERVE', 10.0),
+                            failure_threshold=get_int_environment_variable('IPSTACK_CIRCUIT_FAILURES', 5),
+                            open_seconds=get_float_environment_variable('IPSTACK_CIRCUIT_OPEN_SECONDS', 30.0),
+                            hedge_percentile=get_float_environment_variable('IPSTACK_HEDGE_PERCENTILE', 0.0) or None,
+                            min_hedge_delay=get_float_environment_variable('IPSTACK_HEDGE_MIN_DELAY', 0.01),
+                            # chunks get deadlines of their own
+                            bulk_chunk_size=bulk_chunk_size,
+                            bulk_concurrency=bulk_concurrency,
+                        )
+                    shared_cache_path = os.getenv('IPSTACK_SHARED_CACHE_PATH')
+                    if shared_cache_path:
+                        client = SharedCacheLocationClient(
+                            client,
+                            SharedLocationCache(
+                                shared_cache_path,
+                                ttl=get_float_environment_variable('IPSTACK_SHARED_CACHE_TTL', 3600.0),
+                                max_entries=get_int_environment_variable('IPSTACK_SHARED_CACHE_SIZE', 1000000),
+                            ),
+                        )
+                    cache_size = get_int_environment_variable('IPSTACK_CACHE_SIZE', 10000)
+                    if cache_size > 0:
+                        client = CachedLocationClient(
+                            client,
+                            max_size=cache_size,
+                            ttl=get_float_environment_variable('IPSTACK_CACHE_TTL', 300.0),
+                            error_ttl=get_float_environment_variable('IPSTACK_CACHE_ERROR_TTL', 5.0),
+                        )
+                    cls._instance = client
         return cls._instance
 
 
-class LocationResponse(BaseModel):
-    latitude: float
-    longitude: float
-
-
-class IPStackAPIClientError(Exception):
-    pass
+def create_rate_limiter() -> RateLimiter | None:
+    rate = get_float_environment_variable('IPSTACK_RATE_LIMIT', 0.0)
+    if rate <= 0:
+        return None
+    monthly_quota = get_int_environment_variable('IPSTACK_MONTHLY_QUOTA', 0) or None
+    return RateLimiter(
+        rate,
+        burst=get_float_environment_variable('IPSTACK_RATE_LIMIT_BURST', rate),
+        monthly_quota=monthly_quota,
+        # the database keeps the count across restarts and workers
+        quota_store=DatabaseSingleton.get_instance() if monthly_quota is not None else None,
+        quota_lease=get_int_environment_variable('IPSTACK_MONTHLY_QUOTA_LEASE', 100),
+        max_waits={
+            INTERACTIVE: get_float_environment_variable('IPSTACK_RATE_LIMIT_INTERACTIVE_MAX_WAIT', 2.0),
+            BULK: get_float_environment_variable('IPSTACK_RATE_LIMIT_BULK_MAX_WAIT', 10.0),
+            BACKGROUND: get_float_environment_variable('IPSTACK_RATE_LIMIT_BACKGROUND_MAX_WAIT', 60.0),
+        },
+    )
 
 
 class IPStackAPIClient:
-    def __init__(self, baseurl: str, access_key: str) -> None:
+    def __init__(
+        self,
+        baseurl: str,
+        access_key: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        bulk_chunk_size: int = 50,
+        bulk_concurrency: int = 8,
+        transport: httpx.AsyncBaseTransport | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ) -> None:
+        self._rate_limiter = rate_limiter
         self._baseurl = baseurl.rstrip('/') + '/'
         self._access_key = access_key
-        self._session = requests.Session()
+        self._bulk_chunk_size = bulk_chunk_size
+        self._bulk_concurrency = bulk_concurrency
+        # HTTP/2 is negotiated through ALPN, so it is only used when the base url is https
+        self._client = httpx.AsyncClient(
+            http2=transport is None,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout),
+            transport=transport,
+        )
 
-    def get_location(self, host: str) -> LocationResponse:
+    async def get_location(self, host: str) -> LocationResponse:
         url = self._baseurl + urllib.parse.quote(host)
+        json_data = await self._get_json(url, 'latitude,longitude', 'single', 1)
+        try:
+            return LocationResponse.model_validate(json_data)
+        except ValueError as error:
+            raise IPStackAPIClientError(f"Validation Error: {error}")
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        """Resolves many hosts at once, returning a location or an error for every host.
+
+        IP addresses are resolved through the ipstack bulk endpoint in chunks of `bulk_chunk_size`, other hosts
+        one by one. At most `bulk_concurrency` requests are in flight at the same time.
+        """
+        hosts = list(dict.fromkeys(hosts))
+        ips = [host for host in hosts if is_ip_address(host)]
+        hostnames = [host for host in hosts if not is_ip_address(host)]
+        semaphore = asyncio.Semaphore(self._bulk_concurrency)
+        results = {}
+
+        async def resolve_chunk(chunk: list[str]):
+            async with semaphore:
+                try:
+                    results.update(await self._get_bulk_locations(chunk))
+                except IPStackAPIClientError as error:
+                    results.update({host: error for host in chunk})
+
+        async def resolve_host(host: str):
+            async with semaphore:
+                try:
+                    results[host] = await self.get_location(host)
+                except IPStackAPIClientError as error:
+                    results[host] = error
+
+        chunks = [ips[i : i + self._bulk_chunk_size] for i in range(0, len(ips), self._bulk_chunk_size)]
+        await asyncio.gather(
+            *[resolve_chunk(chunk) for chunk in chunks], *[resolve_host(hostname) for hostname in hostnames]
+        )
+        return {host: results[host] for host in hosts}
+
+    async def _get_bulk_locations(self, ips: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        if len(ips) == 1:
+            return {ips[0]: await self.get_location(ips[0])}
+
+        url = self._baseurl + ','.join(urllib.parse.quote(ip) for ip in ips)
+        json_data = await self._get_json(url, 'ip,latitude,longitude', 'bulk', len(ips))
+        if not isinstance(json_data, list):
+            raise IPStackAPIClientError(f"Validation Error: expected a list of locations, got {json_data}")
+
+        # ipstack echoes addresses in its own spelling, so they are matched by value
+        results = {}
+        for item in json_data:
+            try:
+                ip = ipaddress.ip_address(item['ip'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            try:
+                results[ip] = LocationResponse.model_validate(item)
+            except ValueError as error:
+                results[ip] = IPStackAPIClientError(f"Validation Error: {error}")
+        return {
+            ip: results.get(ipaddress.ip_address(ip), IPStackAPIClientError('Missing in ipstack bulk response'))
+            for ip in ips
+        }
+
+    async def _get_json(self, url: str, fields: str, endpoint: str, lookups: int):
+        """Requests `url` and decodes its JSON body, recording the duration and outcome as upstream metrics.
+
+        With a rate limiter the request first waits for a slot and takes `lookups` from the monthly quota.
+        """
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire(lookups)
+        outcome = 'error'
+        start = time.perf_counter()
         try:
-            response = self._session.get(
-                url,
-                params={
-                    'access_key': self._access_key,
-                    'fields': 'latitude,longitude',
-                },
-            )
+            with stage('upstream'):
+                response = await self._client.get(url, params={'access_key': self._access_key, 'fields': fields})
+            outcome = str(response.status_code)
             response.raise_for_status()
-            json_data = response.json()
-            location_parsed = LocationResponse.model_validate(json_data)
-        except requests.RequestException as error:
+            return response.json()
+        except httpx.TimeoutException as error:
+            outcome = 'timeout'
+            raise IPStackAPIClientTransientError(f"Request Error: {error}")
+        except httpx.HTTPStatusError as error:
+            if error.response.status_code == 429 or error.response.status_code >= 500:
+                raise IPStackAPIClientTransientError(f"Request Error: {error}")
             raise IPStackAPIClientError(f"Request Error: {error}")
-        except ValidationError as error:
+        except httpx.HTTPError as error:
+            outcome = 'transport_error'
+            raise IPStackAPIClientTransientError(f"Request Error: {error}")
+        except ValueError as error:
+            outcome = 'invalid_json'
             raise IPStackAPIClientError(f"Validation Error: {error}")
+        finally:
+            UPSTREAM_DURATION.observe(time.perf_counter() - start, 'ipstack', endpoint)
+            UPSTREAM_REQUESTS.inc('ipstack', endpoint, outcome)
+
+    @property
+    def rate_limiter(self) -> RateLimiter | None:
+        return self._rate_limiter
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
 
-        return location_parsed
+def find_layer(client, layer_type):
+    """Returns the client of type `layer_type` among `client` and the clients it wraps, None if there is none."""
+    while not isinstance(client, layer_type):
+        if not isinstance(client, (CachedLocationClient, SharedCacheLocationClient, ResilientLocationClient)):
+            return None
+        client = client.client
+    return client
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+
+
+class LocationResponse(BaseModel):
+    latitude: float
+    longitude: float
+
+
+class IPStackAPIClientError(Exception):
+    pass
+
+
+class IPStackAPIClientTransientError(IPStackAPIClientError):
+    """A failure that may not happen again: a timeout, a transport error, a 429 or a 5xx response."""
+
+
+class IPStackCircuitOpenError(IPStackAPIClientError):
+    pass
+
+
+class IPStackRateLimitError(IPStackAPIClientError):
+    """No request slot became free within the wait allowed, raised before anything is sent."""
+
+
+class IPStackQuotaExceededError(IPStackAPIClientError):
+    """The monthly lookup quota is used up, raised before anything is sent."""
@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from typing import Protocol
+
+from loguru import logger
+
+from ipstack_client.models import IPStackRateLimitError, IPStackQuotaExceededError
+from utils.metrics import REGISTRY
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk', BACKGROUND: 'background'}
+
+_priority: ContextVar[int] = ContextVar('lookup_priority', default=INTERACTIVE)
+# deadlines of the lookups in progress, they stand still while a request of the lookup waits in the queue
+_deadlines: ContextVar[tuple['QueueExcludingDeadline', ...]] = ContextVar('lookup_deadlines', default=())
+
+QUEUE_WAIT = REGISTRY.histogram(
+    'ip_locator_upstream_queue_wait_seconds', 'Time ipstack requests waited for the rate limiter', ('priority',)
+)
+
+
+@contextmanager
+def lookup_priority(priority: int):
+    """Runs the enclosed ipstack lookups, and the tasks they start, with `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class QueueExcludingDeadline:
+    """Timeout that is paused while requests under it wait for a rate limiter, see `deadline_excluding_queue`."""
+
+    def __init__(self, timeout: asyncio.Timeout) -> None:
+        self._timeout = timeout
+        self._waiting = 0
+        self._remaining: float | None = None
+        self._paused_at = 0.0
+        self.queued_seconds = 0.0
+
+    def pause(self) -> None:
+        self._waiting += 1
+        if self._waiting > 1 or self._timeout.expired() or self._timeout.when() is None:
+            return
+        loop = asyncio.get_running_loop()
+        self._paused_at = loop.time()
+        self._remaining = self._timeout.when() - self._paused_at
+        try:
+            self._timeout.reschedule(None)
+        except RuntimeError:
+            # the lookup already ended, its request outlived it
+            self._remaining = None
+
+    def resume(self) -> None:
+        self._waiting -= 1
+        if self._waiting > 0 or self._remaining is None:
+            return
+        loop = asyncio.get_running_loop()
+        self.queued_seconds += loop.time() - self._paused_at
+        try:
+            self._timeout.reschedule(loop.time() + self._remaining)
+        except RuntimeError:
+            # the lookup ended while its request was still queued
+            pass
+        self._remaining = None
+
+
+@asynccontextmanager
+async def deadline_excluding_queue(seconds: float):
+    """Like `asyncio.timeout(seconds)`, except that time spent waiting for a rate limiter does not count.
+
+    The queue bounds that wait itself, see the `max_waits` of `RateLimiter`.
+    """
+    async with asyncio.timeout(seconds) as timeout:
+        deadline = QueueExcludingDeadline(timeout)
+        token = _deadlines.set((*_deadlines.get(), deadline))
+        try:
+            yield deadline
+        finally:
+            _deadlines.reset(token)
+
+
+@dataclass
+class RateLimiterStats:
+    granted: int = 0
+    queued: int = 0
+    timed_out: int = 0
+    quota_exceeded: int = 0
+    tokens: float = 0.0
+    queue_depth: dict[str, int] = field(default_factory=dict)
+    total_wait_seconds: dict[str, float] = field(default_factory=dict)
+    max_wait_seconds: dict[str, float] = field(default_factory=dict)
+    monthly_quota: int | None = None
+    monthly_used: int = 0
+    monthly_remaining: int | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class QuotaStore(Protocol):
+    async def reserve_quota(self, month: str, lookups: int, quota: int) -> int | None: ...
+
+
+class RateLimiter:
+    """Token bucket of `rate` requests per second holding up to `burst` tokens, and a monthly lookup quota.
+
+    A request finding no token waits in a queue ordered by priority, then by arrival, for at most the `max_waits`
+    seconds of its priority before failing with IPStackRateLimitError. Lookups beyond `monthly_quota` in a calendar
+    month (UTC) fail at once with IPStackQuotaExceededError.
+
+    Without a `quota_store` the quota is counted by this process only and starts over with it. With one, lookups
+    are leased from the store `quota_lease` at a time, so the count survives restarts and is shared by every
+    process using the store. Lookups leased but not used when the process ends are lost, which errs on the side
+    of the quota.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float | None = None,
+        monthly_quota: int | None = None,
+        max_waits: dict[int, float] | None = None,
+        quota_store: QuotaStore | None = None,
+        quota_lease: int = 100,
+    ) -> None:
+        self._rate = rate
+        self._burst = max(burst if burst is not None else rate, 1.0)
+        self._tokens = self._burst
+        self._updated_at = time.monotonic()
+        self._monthly_quota = monthly_quota
+        self._month = self._current_month()
+        self._monthly_used = 0
+        self._quota_store = quota_store if monthly_quota is not None else None
+        self._quota_lease = max(quota_lease, 1)
+        self._leased = 0
+        self._stored_used = 0
+        self._max_waits = {INTERACTIVE: 2.0, BULK: 10.0, BACKGROUND: 60.0, **(max_waits or {})}
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        self._stats = RateLimiterStats(monthly_quota=monthly_quota)
+
+    def stats(self) -> RateLimiterStats:
+        self._refill()
+        self._reset_month_if_changed()
+        self._stats.tokens = round(self._tokens, 3)
+        depths = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depths[PRIORITY_NAMES[priority]] += 1
+        self._stats.queue_depth = depths
+        # with a store, the lookups of every process as of this process' last lease, less its unused lookups
+        self._stats.monthly_used = self._monthly_used if self._quota_store is None else self._stored_used - self._leased
+        if self._monthly_quota is not None:
+            self._stats.monthly_remaining = max(self._monthly_quota - self._stats.monthly_used, 0)
+        return self._stats
+
+    async def acquire(self, lookups: int = 1) -> None:
+        """Waits for a request token and takes `lookups` from the monthly quota."""
+        priority = _priority.get()
+        await self._reserve_quota(lookups)
+        self._refill()
+        if self._tokens >= 1 and not self._waiters:
+            self._tokens -= 1
+            self._stats.granted += 1
+            QUEUE_WAIT.observe(0.0, PRIORITY_NAMES[priority])
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._stats.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        start = time.monotonic()
+        deadlines = _deadlines.get()
+        for deadline in deadlines:
+            deadline.pause()
+        try:
+            await asyncio.wait_for(future, self._max_waits[priority])
+        except asyncio.TimeoutError:
+            self._stats.timed_out += 1
+            self._release_quota(lookups)
+            raise IPStackRateLimitError(
+                f'Request Error: no ipstack request slot within {self._max_waits[priority]} seconds'
+            )
+        except BaseException:
+            self._release_quota(lookups)
+            raise
+        finally:
+            for deadline in deadlines:
+                deadline.resume()
+            waited = time.monotonic() - start
+            name = PRIORITY_NAMES[priority]
+            QUEUE_WAIT.observe(waited, name)
+            self._stats.total_wait_seconds[name] = self._stats.total_wait_seconds.get(name, 0.0) + waited
+            self._stats.max_wait_seconds[name] = max(self._stats.max_wait_seconds.get(name, 0.0), waited)
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            # waiters that timed out or were cancelled leave their future behind
+            if not future.done():
+                future.set_result(None)
+                self._tokens -= 1
+                self._stats.granted += 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated_at) * self._rate, self._burst)
+        self._updated_at = now
+
+    async def _reserve_quota(self, lookups: int) -> None:
+        self._reset_month_if_changed()
+        if self._monthly_quota is not None:
+            if self._quota_store is not None:
+                await self._lease_quota(lookups)
+            elif self._monthly_used + lookups > self._monthly_quota:
+                self._stats.quota_exceeded += 1
+                raise IPStackQuotaExceededError(
+                    f'Request Error: monthly quota of {self._monthly_quota} lookups used up'
+                )
+        self._monthly_used += lookups
+
+    async def _lease_quota(self, lookups: int) -> None:
+        if self._leased >= lookups:
+            self._leased -= lookups
+            return
+        month = self._month
+        used = None
+        # the last lookups of the month may not allow a whole lease
+        for amount in dict.fromkeys((max(lookups, self._quota_lease), lookups)):
+            try:
+                used = await self._quota_store.reserve_quota(
+                    f'{month[0]:04d}-{month[1]:02d}', amount, self._monthly_quota
+                )
+            except Exception as error:
+                logger.error(f'Error while reserving ipstack quota: {error}')
+                raise IPStackQuotaExceededError('Request Error: monthly quota could not be checked')
+            if used is not None:
+                break
+        if used is None:
+            self._stats.quota_exceeded += 1
+            raise IPStackQuotaExceededError(f'Request Error: monthly quota of {self._monthly_quota} lookups used up')
+        # a lease taken while the month turned is of the past month, only its lookups for this request are used
+        if month == self._month:
+            self._leased += amount - lookups
+            self._stored_used = used
+
+    def _release_quota(self, lookups: int) -> None:
+        self._monthly_used -= lookups
+        if self._quota_store is not None:
+            self._leased += lookups
+
+    def _reset_month_if_changed(self) -> None:
+        month = self._current_month()
+        if month != self._month:
+            self._month = month
+            self._monthly_used = 0
+            self._leased = 0
+            self._stored_used = 0
+
+    @staticmethod
+    def _current_month() -> tuple[int, int]:
+        now = datetime.now(timezone.utc)
+        return now.year, now.month
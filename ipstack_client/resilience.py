@@ -0,0 +1,363 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+
+from ipstack_client.models import (
+    LocationResponse,
+    IPStackAPIClientError,
+    IPStackAPIClientTransientError,
+    IPStackCircuitOpenError,
+    IPStackRateLimitError,
+    IPStackQuotaExceededError,
+)
+from ipstack_client.rate_limiter import deadline_excluding_queue
+from utils.ip_address import parse_ip
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# raised by our own rate limiter, they tell nothing about the health of the upstream
+LOCAL_ERRORS = (IPStackRateLimitError, IPStackQuotaExceededError)
+
+
+@dataclass
+class ResilienceStats:
+    requests: int = 0
+    retries: int = 0
+    retries_denied: int = 0
+    hedges: int = 0
+    hedges_won: int = 0
+    timeouts: int = 0
+    rejected: int = 0
+    circuit_opened: int = 0
+    circuit_state: str = CLOSED
+    retry_budget: float = 0.0
+    hedge_delay: float | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class RetryBudget:
+    """Allows retries of at most `ratio` of the requests, plus a reserve of `reserve` retries.
+
+    Every request deposits `ratio` tokens and every retry or hedged request withdraws one, the balance never
+    exceeds `reserve`. During an outage the extra load retries add is therefore bounded by the share `ratio`.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10.0) -> None:
+        self._ratio = ratio
+        self._reserve = max(reserve, 1.0)
+        self._balance = self._reserve
+
+    @property
+    def balance(self) -> float:
+        return self._balance
+
+    def deposit(self, requests: int = 1) -> None:
+        self._balance = min(self._balance + self._ratio * requests, self._reserve)
+
+    def withdraw(self, retries: int = 1) -> int:
+        """Withdraws up to `retries` tokens and returns how many retries they allow."""
+        allowed = min(retries, int(self._balance))
+        self._balance -= allowed
+        return allowed
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails requests fast for `open_seconds`.
+
+    Once that passed a single trial request is let through, its success closes the circuit and its failure opens
+    it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 30.0) -> None:
+        self._failure_threshold = failure_threshold
+        self._open_seconds = open_seconds
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._state = CLOSED
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self._open_seconds:
+            self._state = HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._trial_in_flight = False
+        self._state = CLOSED
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self._failure_threshold:
+            self._open()
+
+    def release(self) -> None:
+        """Ends a trial request that neither succeeded nor failed upstream, for example because it was cancelled."""
+        self._trial_in_flight = False
+
+    def _open(self) -> None:
+        self._trial_in_flight = False
+        self._opened_at = time.monotonic()
+        if self._state != OPEN:
+            self.opened += 1
+        self._state = OPEN
+
+
+class LatencyTracker:
+    """Percentile of the latencies of the last `window` successful attempts, recomputed every `refresh` samples."""
+
+    def __init__(self, percentile: float, window: int = 1000, min_samples: int = 20, refresh: int = 50) -> None:
+        self._percentile = percentile
+        self._samples: deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+        self._refresh = refresh
+        self._since_refresh = 0
+        self._value: float | None = None
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+        self._since_refresh += 1
+        if self._since_refresh >= self._refresh or (self._value is None and len(self._samples) >= self._min_samples):
+            ordered = sorted(self._samples)
+            self._value = ordered[min(int(len(ordered) * self._percentile), len(ordered) - 1)]
+            self._since_refresh = 0
+
+    @property
+    def value(self) -> float | None:
+        return self._value
+
+
+class ResilientLocationClient:
+    """Wraps a location client with deadlines, budgeted retries, a circuit breaker and hedged requests.
+
+    Every attempt is limited to `attempt_timeout` seconds and a lookup, retries included, to `total_timeout`, bulk
+    lookups apply both to each chunk of `bulk_chunk_size` IPs on its own. Time spent waiting for the rate limiter
+    of the wrapped client does not count, the limiter bounds it on its own and fails with IPStackRateLimitError,
+    which leaves the circuit breaker alone.
+    Transient errors and timeouts are retried up to `max_attempts` times after a jittered exponential backoff,
+    as long as the retry budget allows. When `hedge_percentile` is set, a second request is sent once an attempt
+    takes longer than that percentile of recent latencies, and the first answer wins. Hedged requests draw from
+    the retry budget as well.
+    """
+
+    def __init__(
+        self,
+        client,
+        attempt_timeout: float = 5.0,
+        total_timeout: float = 12.0,
+        max_attempts: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        retry_budget_ratio: float = 0.2,
+        retry_budget_reserve: float = 10.0,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        hedge_percentile: float | None = None,
+        min_hedge_delay: float = 0.01,
+        bulk_chunk_size: int = 50,
+        bulk_concurrency: int = 8,
+    ) -> None:
+        self._client = client
+        self._attempt_timeout = attempt_timeout
+        self._total_timeout = total_timeout
+        self._max_attempts = max(max_attempts, 1)
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._retry_budget = RetryBudget(retry_budget_ratio, retry_budget_reserve)
+        self._breaker = CircuitBreaker(failure_threshold, open_seconds)
+        self._latencies = LatencyTracker(hedge_percentile) if hedge_percentile else None
+        self._min_hedge_delay = min_hedge_delay
+        self._bulk_chunk_size = max(bulk_chunk_size, 1)
+        self._bulk_concurrency = max(bulk_concurrency, 1)
+        self._stats = ResilienceStats()
+
+    @property
+    def client(self):
+        return self._client
+
+    def stats(self) -> ResilienceStats:
+        self._stats.circuit_state = self._breaker.state
+        self._stats.circuit_opened = self._breaker.opened
+        self._stats.retry_budget = round(self._retry_budget.balance, 3)
+        self._stats.hedge_delay = self._hedge_delay()
+        return self._stats
+
+    async def get_location(self, host: str) -> LocationResponse:
+        self._stats.requests += 1
+        self._retry_budget.deposit()
+        deadline = time.monotonic() + self._total_timeout
+        attempt = 0
+        last_error = None
+        while True:
+            if not self._breaker.allow():
+                if last_error is not None:
+                    raise last_error
+                self._stats.rejected += 1
+                raise IPStackCircuitOpenError('Request Error: ipstack circuit is open')
+            timeout = min(self._attempt_timeout, deadline - time.monotonic())
+            try:
+                async with deadline_excluding_queue(timeout) as attempt_deadline:
+                    location = await self._attempt(host)
+            except IPStackAPIClientTransientError as error:
+                self._breaker.record_failure()
+                last_error = error
+            except asyncio.TimeoutError:
+                self._breaker.record_failure()
+                self._stats.timeouts += 1
+                last_error = IPStackAPIClientTransientError(f'Request Error: no answer within {timeout:.3f} seconds')
+            except LOCAL_ERRORS:
+                self._breaker.release()
+                raise
+            except IPStackAPIClientError:
+                # the upstream answered, it is healthy even though it refused this lookup
+                self._breaker.record_success()
+                raise
+            except BaseException:
+                self._breaker.release()
+                raise
+            else:
+                self._breaker.record_success()
+                return location
+
+            # waiting for the rate limiter is bounded by the limiter, not by the deadline
+            deadline += attempt_deadline.queued_seconds
+            attempt += 1
+            delay = random.uniform(0, min(self._max_backoff, self._backoff * 2**attempt))
+            if attempt >= self._max_attempts or time.monotonic() + delay >= deadline:
+                raise last_error
+            if not self._retry_budget.withdraw():
+                self._stats.retries_denied += 1
+                raise last_error
+            self._stats.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, host: str) -> LocationResponse:
+        start = time.monotonic()
+        hedge_delay = self._hedge_delay()
+        primary = asyncio.create_task(self._client.get_location(host))
+        pending = {primary}
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done and self._retry_budget.withdraw():
+                    self._stats.hedges += 1
+                    pending.add(asyncio.create_task(self._client.get_location(host)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._stats.hedges_won += 1
+                        if self._latencies is not None:
+                            self._latencies.add(time.monotonic() - start)
+                        return task.result()
+                    # a definite answer of either request is taken over a transient error of the other
+                    if error is None or isinstance(error, IPStackAPIClientTransientError):
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> float | None:
+        if self._latencies is None or self._latencies.value is None:
+            return None
+        return max(self._latencies.value, self._min_hedge_delay)
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        """Looks hosts up through the wrapped client's bulk lookup and retries the hosts that failed transiently.
+
+        IPs are looked up in chunks of `bulk_chunk_size`, other hosts one by one, with at most `bulk_concurrency`
+        chunks in flight. Every chunk has deadlines of its own, so a large lookup is not failed as a whole by one
+        `total_timeout` and the chunks answered are kept. Bulk lookups are not hedged, a retry of a host draws one
+        token from the retry budget.
+        """
+        hosts = list(dict.fromkeys(hosts))
+        self._stats.requests += len(hosts)
+        self._retry_budget.deposit(len(hosts))
+        ips = [host for host in hosts if parse_ip(host) is not None]
+        chunks = [ips[i : i + self._bulk_chunk_size] for i in range(0, len(ips), self._bulk_chunk_size)]
+        chunks += [[host] for host in hosts if parse_ip(host) is None]
+        semaphore = asyncio.Semaphore(self._bulk_concurrency)
+        results = {}
+
+        async def resolve_chunk(chunk: list[str]) -> None:
+            # the deadlines start once the chunk's turn has come
+            async with semaphore:
+                results.update(await self._get_chunk_locations(chunk))
+
+        await asyncio.gather(*(resolve_chunk(chunk) for chunk in chunks))
+        return {host: results.get(host, IPStackAPIClientError('Missing in upstream response')) for host in hosts}
+
+    async def _get_chunk_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        """Looks up a chunk in attempts of at most `attempt_timeout` seconds, all of them within `total_timeout`."""
+        deadline = time.monotonic() + self._total_timeout
+        results = {}
+        remaining = hosts
+        attempt = 0
+        while True:
+            if not self._breaker.allow():
+                # hosts of a retry keep the error of their last attempt
+                if attempt == 0:
+                    self._stats.rejected += len(remaining)
+                    circuit_error = IPStackCircuitOpenError('Request Error: ipstack circuit is open')
+                    results.update({host: circuit_error for host in remaining})
+                break
+            timeout = min(self._attempt_timeout, deadline - time.monotonic())
+            try:
+                async with deadline_excluding_queue(timeout) as attempt_deadline:
+                    fetched = await self._client.get_locations(remaining)
+            except asyncio.TimeoutError:
+                self._breaker.record_failure()
+                self._stats.timeouts += 1
+                timeout_error = IPStackAPIClientTransientError(f'Request Error: no answer within {timeout:.3f} seconds')
+                results.update({host: timeout_error for host in remaining})
+            except BaseException:
+                self._breaker.release()
+                raise
+            else:
+                results.update(fetched)
+                failed = [host for host in remaining if isinstance(results.get(host), IPStackAPIClientTransientError)]
+                answered = [host for host in remaining if not isinstance(results.get(host), LOCAL_ERRORS)]
+                if not answered:
+                    self._breaker.release()
+                elif len(failed) == len(answered):
+                    self._breaker.record_failure()
+                else:
+                    self._breaker.record_success()
+
+            # waiting for the rate limiter is bounded by the limiter, not by the deadline
+            deadline += attempt_deadline.queued_seconds
+            failed = [host for host in remaining if isinstance(results.get(host), IPStackAPIClientTransientError)]
+            attempt += 1
+            delay = random.uniform(0, min(self._max_backoff, self._backoff * 2**attempt))
+            if not failed or attempt >= self._max_attempts or time.monotonic() + delay >= deadline:
+                break
+            allowed = self._retry_budget.withdraw(len(failed))
+            self._stats.retries_denied += len(failed) - allowed
+            if not allowed:
+                break
+            remaining = failed[:allowed]
+            self._stats.retries += allowed
+            await asyncio.sleep(delay)
+        return results
+
+    async def close(self) -> None:
+        await self._client.close()
@@ -0,0 +1,258 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+from loguru import logger
+
+from ipstack_client.cache import get_uncached_locations
+from ipstack_client.models import LocationResponse, IPStackAPIClientError
+
+# hosts per statement, SQLite limits the number of parameters
+_SELECT_CHUNK_SIZE = 500
+
+
+@dataclass
+class SharedCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    write_errors: int = 0
+    evictions: int = 0
+    size: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class SharedLocationCache:
+    """Successful lookups stored in a SQLite file, seen by every worker process of the host.
+
+    The file is opened in WAL mode, so reads never wait for a writer. A write waiting longer than `busy_timeout`
+    seconds for another worker's write is dropped, the cache is best effort. Entries expire after `ttl` seconds of
+    wall clock time, and every `prune_interval` writes expired entries are deleted and the oldest ones beyond
+    `max_entries`, in the background.
+
+    SQLite calls block, so they run one at a time in a thread of their own, never on the event loop. The number of
+    entries is counted by triggers as they are written and deleted, reading it costs no scan.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 3600.0,
+        max_entries: int = 1000000,
+        busy_timeout: float = 0.05,
+        prune_interval: int = 1000,
+    ) -> None:
+        self._path = path
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._busy_timeout = busy_timeout
+        self._prune_interval = prune_interval
+        self._writes_since_prune = 0
+        self._pruning = False
+        self._connection: sqlite3.Connection | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._stats = SharedCacheStats()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def stats(self) -> SharedCacheStats:
+        return self._stats
+
+    async def get_many(self, hosts: list[str]) -> dict[str, LocationResponse]:
+        """Returns the unexpired locations of `hosts`, hosts without one are left out."""
+        found = await self._run(self._select, hosts)
+        self._stats.hits += len(found)
+        self._stats.misses += len(hosts) - len(found)
+        return found
+
+    async def put_many(self, locations: dict[str, LocationResponse]) -> None:
+        if not locations or self._ttl <= 0:
+            return
+        if not await self._run(self._upsert, locations):
+            self._stats.write_errors += 1
+            logger.warning(f'Dropped {len(locations)} shared cache writes')
+            return
+        self._stats.writes += len(locations)
+        self._writes_since_prune += len(locations)
+        if self._writes_since_prune >= self._prune_interval and not self._pruning:
+            self._writes_since_prune = 0
+            self._pruning = True
+            # not awaited, the next calls queue behind it in the thread
+            asyncio.get_running_loop().run_in_executor(self._get_executor(), self._prune)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self._run(self._close)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), function, *args)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # created on first use, so that every worker process has a thread and a connection of its own
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared-cache')
+        return self._executor
+
+    # the methods below run in the executor thread
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            try:
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                with connection:
+                    connection.execute(
+                        'CREATE TABLE IF NOT EXISTS locations (host TEXT PRIMARY KEY, latitude REAL NOT NULL, '
+                        'longitude REAL NOT NULL, expires_at REAL NOT NULL)'
+                    )
+                    connection.execute('CREATE INDEX IF NOT EXISTS ix_locations_expires_at ON locations (expires_at)')
+                    connection.execute('CREATE TABLE IF NOT EXISTS size (entries INTEGER NOT NULL)')
+                    # counted once for a file written before the triggers existed
+                    connection.execute(
+                        'INSERT INTO size SELECT count(*) FROM locations WHERE NOT EXISTS (SELECT 1 FROM size)'
+                    )
+                    connection.execute(
+                        'CREATE TRIGGER IF NOT EXISTS locations_inserted AFTER INSERT ON locations '
+                        'BEGIN UPDATE size SET entries = entries + 1; END'
+                    )
+                    connection.execute(
+                        'CREATE TRIGGER IF NOT EXISTS locations_deleted AFTER DELETE ON locations '
+                        'BEGIN UPDATE size SET entries = entries - 1; END'
+                    )
+                self._stats.size = self._size(connection)
+            except sqlite3.Error:
+                connection.close()
+                raise
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def _size(connection: sqlite3.Connection) -> int:
+        return connection.execute('SELECT entries FROM size').fetchone()[0]
+
+    def _select(self, hosts: list[str]) -> dict[str, LocationResponse]:
+        now = time.time()
+        found = {}
+        try:
+            connection = self._connect()
+            for i in range(0, len(hosts), _SELECT_CHUNK_SIZE):
+                chunk = hosts[i : i + _SELECT_CHUNK_SIZE]
+                rows = connection.execute(
+                    f'SELECT host, latitude, longitude FROM locations '
+                    f'WHERE host IN ({",".join("?" * len(chunk))}) AND expires_at > ?',
+                    (*chunk, now),
+                )
+                for host, latitude, longitude in rows:
+                    found[host] = LocationResponse(latitude=latitude, longitude=longitude)
+        except sqlite3.Error as error:
+            logger.warning(f'Shared cache read failed: {error}')
+        return found
+
+    def _upsert(self, locations: dict[str, LocationResponse]) -> bool:
+        expires_at = time.time() + self._ttl
+        try:
+            connection = self._connect()
+            with connection:
+                # an upsert rather than a replace, which would delete the entry without counting it
+                connection.executemany(
+                    'INSERT INTO locations (host, latitude, longitude, expires_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (host) DO UPDATE SET latitude = excluded.latitude, '
+                    'longitude = excluded.longitude, expires_at = excluded.expires_at',
+                    [(host, location.latitude, location.longitude, expires_at) for host, location in locations.items()],
+                )
+                self._stats.size = self._size(connection)
+        except sqlite3.Error as error:
+            logger.warning(f'Shared cache write failed: {error}')
+            return False
+        return True
+
+    def _prune(self) -> None:
+        try:
+            connection = self._connect()
+            with connection:
+                deleted = connection.execute('DELETE FROM locations WHERE expires_at <= ?', (time.time(),)).rowcount
+                excess = self._size(connection) - self._max_entries
+                if excess > 0:
+                    deleted += connection.execute(
+                        'DELETE FROM locations WHERE host IN '
+                        '(SELECT host FROM locations ORDER BY expires_at LIMIT ?)',
+                        (excess,),
+                    ).rowcount
+                self._stats.size = self._size(connection)
+        except sqlite3.Error as error:
+            logger.warning(f'Shared cache pruning skipped: {error}')
+            return
+        finally:
+            self._pruning = False
+        self._stats.evictions += deleted
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class SharedCacheLocationClient:
+    """Answers lookups of the wrapped client from a `SharedLocationCache` and stores its successful lookups there.
+
+    Errors are not shared, each worker caches them in its own `CachedLocationClient`.
+    """
+
+    def __init__(self, client, cache: SharedLocationCache) -> None:
+        self._client = client
+        self._cache = cache
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def cache(self) -> SharedLocationCache:
+        return self._cache
+
+    def stats(self) -> SharedCacheStats:
+        return self._cache.stats()
+
+    async def get_location(self, host: str) -> LocationResponse:
+        cached = await self._cache.get_many([host])
+        if host in cached:
+            return cached[host]
+        location = await self._client.get_location(host)
+        await self._cache.put_many({host: location})
+        return location
+
+    async def get_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        hosts = list(dict.fromkeys(hosts))
+        results = await self._cache.get_many(hosts)
+        missing = [host for host in hosts if host not in results]
+        if missing:
+            fetched = await self._client.get_locations(missing)
+            await self._cache.put_many(
+                {host: value for host, value in fetched.items() if isinstance(value, LocationResponse)}
+            )
+            results.update(fetched)
+        return {host: results.get(host, IPStackAPIClientError('Missing in upstream response')) for host in hosts}
+
+    async def get_fresh_locations(self, hosts: list[str]) -> dict[str, LocationResponse | IPStackAPIClientError]:
+        """Looks `hosts` up past the cache, replacing the cached locations with those found."""
+        hosts = list(dict.fromkeys(hosts))
+        fetched = await get_uncached_locations(self._client, hosts)
+        await self._cache.put_many(
+            {host: value for host, value in fetched.items() if isinstance(value, LocationResponse)}
+        )
+        return {host: fetched.get(host, IPStackAPIClientError('Missing in upstream response')) for host in hosts}
+
+    async def close(self) -> None:
+        await self._cache.close()
+        await self._client.close()
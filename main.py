@@ -6,8 +6,11 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.routers import public
-from api.routers.dependencies import get_database
+from api.middleware import MetricsMiddleware
+from api.routers import public, bulk, export, imports, metrics
+from api.routers.dependencies import get_database, get_ingest_buffer, get_location_provider, get_refresh_scheduler
+from utils.file_lock import FileLock, default_lock_path
+from utils.utils import get_bool_environment_variable
 
 
 def validate_environment_variables(required_variables):
@@ -19,12 +22,29 @@ def validate_environment_variables(required_variables):
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # app startup
-    required_environment_variables = ['IPSTACK_KEY', 'DATABASE_URI']
+    required_environment_variables = ['DATABASE_URI']
+    if os.getenv('LOCATION_PROVIDER', 'ipstack') != 'offline':
+        required_environment_variables.append('IPSTACK_KEY')
     validate_environment_variables(required_environment_variables)
+    location_provider = await get_location_provider()
     database = await get_database()
-    await database.create_tables()
+    # workers start at the same time, only the first one creates and migrates the tables
+    async with FileLock(os.getenv('STARTUP_LOCK_PATH') or default_lock_path('startup')):
+        await database.create_tables()
+    await database.warm_up()
+    ingest_buffer = await get_ingest_buffer()
+    if ingest_buffer is not None:
+        await ingest_buffer.start()
+    refresh_scheduler = await get_refresh_scheduler()
+    if refresh_scheduler is not None:
+        await refresh_scheduler.start()
     yield
     # app teardown
+    if refresh_scheduler is not None:
+        await refresh_scheduler.stop()
+    if ingest_buffer is not None:
+        await ingest_buffer.stop()
+    await location_provider.close()
 
 
 load_dotenv()
@@ -42,9 +62,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if get_bool_environment_variable('METRICS_ENABLED', True):
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router, tags=["metrics"])
+
 
 app.include_router(
     public.router,
     prefix="/api/v1/public",
     tags=["public"],
 )
+
+app.include_router(
+    bulk.router,
+    prefix="/api/v1/public",
+    tags=["public"],
+)
+
+app.include_router(
+    export.router,
+    prefix="/api/v1/public",
+    tags=["public"],
+)
+
+app.include_router(
+    imports.router,
+    prefix="/api/v1/public",
+    tags=["public"],
+)
@@ -4,3 +4,11 @@ class IPLocatorException(Exception):
 
 class IPLocatorResolvingHostnameException(IPLocatorException):
     pass
+
+
+class IPLocatorIngestBufferFullException(IPLocatorException):
+    pass
+
+
+class IPLocatorImportException(IPLocatorException):
+    pass
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone, timedelta
+
 import pytest
 from fastapi import status
 from freezegun import freeze_time
@@ -49,3 +51,41 @@ async def test_add_location_for_ip_ipstack_error(
         response = api_client.post('/api/v1/public/add-location-for-ip', json=request.model_dump())
 
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@pytest.mark.asyncio
+async def test_add_location_for_ip_reuses_fresh_stored_location(
+    api_client, mock_database, mock_ip_stack_client, monkeypatch
+):
+    monkeypatch.setenv('LOCATION_FRESHNESS_SECONDS', '60')
+    request = LocationByIPRequestModel(ip='120.1.1.1')
+    await mock_database.insert(
+        IPLocation(
+            ip=request.ip, latitude=3.3, longitude=4.4, timestamp=datetime.now(timezone.utc) - timedelta(seconds=30)
+        )
+    )
+
+    response = api_client.post('/api/v1/public/add-location-for-ip', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.json()['latitude'], response.json()['longitude']) == (3.3, 4.4)
+    mock_ip_stack_client.get_location.assert_not_called()
+    assert len(await mock_database.select_all(IPLocation)) == 1
+
+
+@pytest.mark.asyncio
+async def test_add_location_for_ip_refreshes_stale_stored_location(
+    api_client, mock_database, fixed_timestamp_with_timezone, mock_ip_stack_client, monkeypatch
+):
+    monkeypatch.setenv('LOCATION_FRESHNESS_SECONDS', '60')
+    request = LocationByIPRequestModel(ip='120.1.1.1')
+    await mock_database.insert(
+        IPLocation(ip=request.ip, latitude=3.3, longitude=4.4, timestamp=fixed_timestamp_with_timezone)
+    )
+
+    with freeze_time(fixed_timestamp_with_timezone + timedelta(seconds=90)):
+        response = api_client.post('/api/v1/public/add-location-for-ip', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    mock_ip_stack_client.get_location.assert_called_once_with(request.ip)
+    assert len(await mock_database.select_all(IPLocation)) == 2
@@ -1,11 +1,14 @@
-from datetime import timedelta
+from datetime import datetime, timezone, timedelta
+from unittest.mock import Mock
 
 import pytest
 from fastapi import status
 from freezegun import freeze_time
 
 from api.models.models import LocationByURLRequestModel
-from infrastructure.database.tables import HostnameLocation
+from geolocation.dns_resolver import CachingDNSResolver, DNSResolverSingleton
+from infrastructure.database.tables import HostnameLocation, IPLocation
+from model.base.ip_locator_exception import IPLocatorResolvingHostnameException
 
 
 @pytest.mark.asyncio
@@ -31,10 +34,12 @@ async def test_add_location_for_url(
 
 
 @pytest.mark.asyncio
-async def test_add_location_for_url_twice(api_client, mock_database, fixed_timestamp, mock_ip_stack_client, location):
+async def test_add_location_for_url_twice(
+    api_client, mock_database, fixed_timestamp_with_timezone, mock_ip_stack_client, location
+):
     hostname = 'www.somehost.com'
     request = LocationByURLRequestModel(url=f'https://{hostname}/and/path?query=value')
-    sending_time = [fixed_timestamp, fixed_timestamp + timedelta(seconds=1)]
+    sending_time = [fixed_timestamp_with_timezone, fixed_timestamp_with_timezone + timedelta(seconds=1)]
     expected_ip_locations = [
         HostnameLocation(
             id=1,
@@ -87,3 +92,75 @@ async def test_add_location_for_ip_ipstack_error(
         response = api_client.post('/api/v1/public/add-location-for-url', json=request.model_dump())
 
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@pytest.fixture
+def mock_dns_resolver(monkeypatch):
+    dns_resolver = Mock(spec=CachingDNSResolver)
+    dns_resolver.resolve.return_value = '133.1.1.0'
+    monkeypatch.setattr(DNSResolverSingleton, 'get_instance', Mock(return_value=dns_resolver))
+    return dns_resolver
+
+
+@pytest.mark.asyncio
+async def test_add_location_for_url_located_by_resolved_ip(
+    api_client, mock_database, mock_ip_stack_client, mock_dns_resolver, location
+):
+    request = LocationByURLRequestModel(url='https://www.somehost.com/and/path')
+
+    response = api_client.post('/api/v1/public/add-location-for-url', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    mock_ip_stack_client.get_location.assert_called_once_with('133.1.1.0')
+    stored = await mock_database.select_all(HostnameLocation)
+    assert [(row.hostname, row.resolved_ip, row.latitude) for row in stored] == [
+        ('www.somehost.com', '133.1.1.0', location.latitude)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_add_location_for_url_reuses_fresh_location_of_resolved_ip(
+    api_client, mock_database, mock_ip_stack_client, mock_dns_resolver, monkeypatch, fixed_timestamp_with_timezone
+):
+    monkeypatch.setenv('LOCATION_FRESHNESS_SECONDS', '60')
+    await mock_database.insert_many(IPLocation, [('133.1.1.0', 5.5, 6.6, fixed_timestamp_with_timezone)])
+    request = LocationByURLRequestModel(url='https://www.somehost.com/and/path')
+
+    with freeze_time(fixed_timestamp_with_timezone + timedelta(seconds=10)):
+        response = api_client.post('/api/v1/public/add-location-for-url', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    mock_ip_stack_client.get_location.assert_not_called()
+    stored = await mock_database.select_all(HostnameLocation)
+    assert [(row.resolved_ip, row.latitude, row.longitude) for row in stored] == [('133.1.1.0', 5.5, 6.6)]
+
+
+@pytest.mark.asyncio
+async def test_add_location_for_url_reuses_fresh_stored_location(
+    api_client, mock_database, mock_ip_stack_client, mock_dns_resolver, monkeypatch
+):
+    monkeypatch.setenv('LOCATION_FRESHNESS_SECONDS', '60')
+    timestamp = datetime.now(timezone.utc) - timedelta(seconds=10)
+    await mock_database.insert_many(HostnameLocation, [('www.somehost.com', 5.5, 6.6, timestamp)])
+    request = LocationByURLRequestModel(url='https://www.somehost.com/and/path')
+
+    response = api_client.post('/api/v1/public/add-location-for-url', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.json()['latitude'], response.json()['longitude']) == (5.5, 6.6)
+    mock_ip_stack_client.get_location.assert_not_called()
+    assert len(await mock_database.select_all(HostnameLocation)) == 1
+
+
+@pytest.mark.asyncio
+async def test_add_location_for_url_located_by_hostname_when_resolving_fails(
+    api_client, mock_database, mock_ip_stack_client, mock_dns_resolver
+):
+    mock_dns_resolver.resolve.side_effect = IPLocatorResolvingHostnameException('NXDOMAIN')
+    request = LocationByURLRequestModel(url='https://www.somehost.com/and/path')
+
+    response = api_client.post('/api/v1/public/add-location-for-url', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    mock_ip_stack_client.get_location.assert_called_once_with('www.somehost.com')
+    assert [row.resolved_ip for row in await mock_database.select_all(HostnameLocation)] == [None]
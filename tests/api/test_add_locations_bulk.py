@@ -0,0 +1,109 @@
+from unittest.mock import Mock
+
+import pytest
+from fastapi import status
+from freezegun import freeze_time
+
+from api.models.models import LocationsByIPsRequestModel, LocationsByURLsRequestModel, BulkResultResponseModel
+from geolocation.dns_resolver import CachingDNSResolver, DNSResolverSingleton
+from infrastructure.database.tables import IPLocation, HostnameLocation
+from ipstack_client.models import IPStackAPIClientError
+from model.base.ip_locator_exception import IPLocatorResolvingHostnameException
+
+
+@pytest.fixture
+def mock_bulk_ip_stack_client(mock_ip_stack_client, location):
+    async def get_locations(hosts):
+        return {host: IPStackAPIClientError('invalid') if host.startswith('bad') else location for host in hosts}
+
+    mock_ip_stack_client.get_locations.side_effect = get_locations
+    return mock_ip_stack_client
+
+
+@pytest.mark.asyncio
+async def test_add_locations_for_ips(
+    api_client, mock_database, fixed_timestamp_with_timezone, mock_bulk_ip_stack_client, location
+):
+    request = LocationsByIPsRequestModel(ips=['120.1.1.1', '120.1.1.2', '120.1.1.1', 'bad'])
+
+    with freeze_time(fixed_timestamp_with_timezone):
+        response = api_client.post('/api/v1/public/add-locations-for-ips', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    results = BulkResultResponseModel.model_validate(response.json()).results
+    assert [(result.key, result.success) for result in results] == [
+        ('120.1.1.1', True),
+        ('120.1.1.2', True),
+        ('bad', False),
+    ]
+    mock_bulk_ip_stack_client.get_locations.assert_called_once_with(['120.1.1.1', '120.1.1.2', 'bad'])
+    ip_locations = await mock_database.select_all(IPLocation)
+    assert sorted(ip_location.ip for ip_location in ip_locations) == ['120.1.1.1', '120.1.1.2']
+
+
+@pytest.mark.asyncio
+async def test_add_locations_for_urls(
+    api_client, mock_database, fixed_timestamp_with_timezone, mock_bulk_ip_stack_client, location
+):
+    request = LocationsByURLsRequestModel(
+        urls=['https://www.somehost.com/a', 'https://www.somehost.com/b', 'https://bad.host.com', 'no-hostname']
+    )
+
+    with freeze_time(fixed_timestamp_with_timezone):
+        response = api_client.post('/api/v1/public/add-locations-for-urls', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    results = BulkResultResponseModel.model_validate(response.json()).results
+    assert [result.success for result in results] == [True, True, False, False]
+    mock_bulk_ip_stack_client.get_locations.assert_called_once_with(['www.somehost.com', 'bad.host.com'])
+    hostname_locations = await mock_database.select_all(HostnameLocation)
+    assert [hostname_location.hostname for hostname_location in hostname_locations] == ['www.somehost.com']
+
+
+@pytest.mark.asyncio
+async def test_add_locations_for_ips_database_error(
+    api_client, mock_error_database, fixed_timestamp_with_timezone, mock_bulk_ip_stack_client
+):
+    request = LocationsByIPsRequestModel(ips=['120.1.1.1'])
+
+    response = api_client.post('/api/v1/public/add-locations-for-ips', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    results = BulkResultResponseModel.model_validate(response.json()).results
+    assert [result.success for result in results] == [False]
+
+
+@pytest.mark.asyncio
+async def test_add_locations_for_ips_ipstack_error(api_client, mock_database, mock_error_ip_stack_client):
+    request = LocationsByIPsRequestModel(ips=['120.1.1.1'])
+
+    response = api_client.post('/api/v1/public/add-locations-for-ips', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@pytest.mark.asyncio
+async def test_add_locations_for_urls_by_resolved_ips(
+    api_client, mock_database, mock_bulk_ip_stack_client, monkeypatch
+):
+    async def resolve_many(hostnames):
+        resolved = {'www.a.com': '133.1.1.0', 'www.b.com': '133.1.1.0'}
+        return {
+            hostname: resolved.get(hostname, IPLocatorResolvingHostnameException('NXDOMAIN')) for hostname in hostnames
+        }
+
+    dns_resolver = Mock(spec=CachingDNSResolver)
+    dns_resolver.resolve_many.side_effect = resolve_many
+    monkeypatch.setattr(DNSResolverSingleton, 'get_instance', Mock(return_value=dns_resolver))
+    request = LocationsByURLsRequestModel(urls=['https://www.a.com', 'https://www.b.com', 'https://www.c.com'])
+
+    response = api_client.post('/api/v1/public/add-locations-for-urls', json=request.model_dump())
+
+    assert response.status_code == status.HTTP_201_CREATED
+    mock_bulk_ip_stack_client.get_locations.assert_called_once_with(['133.1.1.0', 'www.c.com'])
+    hostname_locations = await mock_database.select_all(HostnameLocation)
+    assert [(row.hostname, row.resolved_ip) for row in hostname_locations] == [
+        ('www.a.com', '133.1.1.0'),
+        ('www.b.com', '133.1.1.0'),
+        ('www.c.com', None),
+    ]
@@ -0,0 +1,59 @@
+import pytest
+from fastapi import status
+
+from api.models.models import IPLocationsResponseModel
+from infrastructure.database.tables import IPLocation
+
+
+@pytest.fixture
+def stored_ips():
+    return ['10.0.0.2', '10.255.255.255', '9.255.255.255', '11.0.0.0', '10.0.0.1', '::ffff:10.1.0.0', '2001:db8::1']
+
+
+@pytest.mark.asyncio
+async def test_get_locations_for_cidr(api_client, mock_database, fixed_timestamp_with_timezone, stored_ips):
+    await mock_database.insert_many(IPLocation, [(ip, 1.1, 2.2, fixed_timestamp_with_timezone) for ip in stored_ips])
+
+    first_page = api_client.get('/api/v1/public/get-locations-for-cidr', params={'cidr': '10.0.0.0/8', 'limit': 2})
+    parsed_first_page = IPLocationsResponseModel.model_validate(first_page.json())
+    second_page = api_client.get(
+        '/api/v1/public/get-locations-for-cidr',
+        params={'cidr': '10.0.0.0/8', 'limit': 2, 'cursor': parsed_first_page.next_cursor},
+    )
+    parsed_second_page = IPLocationsResponseModel.model_validate(second_page.json())
+
+    assert first_page.status_code == status.HTTP_200_OK
+    assert [location.ip for location in parsed_first_page.locations] == ['10.0.0.1', '10.0.0.2']
+    assert [location.ip for location in parsed_second_page.locations] == ['10.1.0.0', '10.255.255.255']
+    assert parsed_second_page.next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_get_locations_for_ipv6_cidr(api_client, mock_database, fixed_timestamp_with_timezone, stored_ips):
+    await mock_database.insert_many(IPLocation, [(ip, 1.1, 2.2, fixed_timestamp_with_timezone) for ip in stored_ips])
+
+    response = api_client.get('/api/v1/public/get-locations-for-cidr', params={'cidr': '2001:DB8::/32'})
+
+    assert [location['ip'] for location in response.json()['locations']] == ['2001:db8::1']
+
+
+def test_get_locations_for_invalid_cidr(api_client, mock_database):
+    response = api_client.get('/api/v1/public/get-locations-for-cidr', params={'cidr': '10.0.0.0/33'})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_delete_locations_for_cidr(api_client, mock_database, fixed_timestamp_with_timezone, stored_ips):
+    await mock_database.insert_many(IPLocation, [(ip, 1.1, 2.2, fixed_timestamp_with_timezone) for ip in stored_ips])
+
+    response = api_client.delete('/api/v1/public/delete-locations-for-cidr', params={'cidr': '10.0.0.0/8'})
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert sorted(location.ip for location in await mock_database.select_all(IPLocation)) == [
+        '11.0.0.0',
+        '2001:db8::1',
+        '9.255.255.255',
+    ]
+    assert await mock_database.select_latest_by_ip('10.0.0.1') is None
+    assert (await mock_database.select_latest_by_ip('11.0.0.0')).latitude == 1.1
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+
+from infrastructure.database.tables import IPLocation, HostnameLocation
+
+
+@pytest.mark.asyncio
+async def test_export_ips_as_ndjson(api_client, mock_database, fixed_timestamp):
+    await mock_database.insert_many(
+        IPLocation,
+        [('133.1.1.0', 1.1, 2.2, fixed_timestamp), ('133.1.1.1', 3.3, 4.4, fixed_timestamp + timedelta(hours=1))],
+    )
+
+    response = api_client.get('/api/v1/public/export', params={'table': 'ip', 'format': 'ndjson'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {'ip': '133.1.1.0', 'latitude': 1.1, 'longitude': 2.2, 'timestamp': '2022-01-01T12:00:00+00:00'},
+        {'ip': '133.1.1.1', 'latitude': 3.3, 'longitude': 4.4, 'timestamp': '2022-01-01T13:00:00+00:00'},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_urls_as_gzipped_csv_with_filters(api_client, mock_database, fixed_timestamp):
+    hostname = 'www.somehost.com'
+    await mock_database.insert_many(
+        HostnameLocation,
+        [
+            (hostname, 1.1, 2.2, fixed_timestamp - timedelta(hours=1)),
+            (hostname, 3.3, 4.4, fixed_timestamp),
+            ('www.otherhost.com', 5.5, 6.6, fixed_timestamp),
+        ],
+    )
+
+    response = api_client.get(
+        '/api/v1/public/export',
+        params={'table': 'url', 'format': 'csv', 'key': hostname, 'since': fixed_timestamp.isoformat(), 'gzip': True},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-encoding'] == 'gzip'
+    # the test client undoes the content encoding
+    assert list(csv.reader(io.StringIO(response.text))) == [
+        ['hostname', 'latitude', 'longitude', 'timestamp'],
+        [hostname, '3.3', '4.4', '2022-01-01T12:00:00+00:00'],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_of_empty_table(api_client, mock_database):
+    response = api_client.get('/api/v1/public/export', params={'table': 'ip', 'format': 'csv'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.text == 'ip,latitude,longitude,timestamp\n'
+
+
+def test_export_of_unknown_table(api_client, mock_database):
+    response = api_client.get('/api/v1/public/export', params={'table': 'ip_address'})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
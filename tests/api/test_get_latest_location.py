@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+
+from api.models.models import Location
+from infrastructure.database.tables import IPLocation, HostnameLocation
+
+
+@pytest.mark.asyncio
+async def test_get_latest_location_for_ip(api_client, mock_database, fixed_timestamp, fixed_timestamp_with_timezone):
+    ip = '133.1.1.0'
+    for seconds in [0, 2, 1]:
+        await mock_database.insert(
+            IPLocation(ip=ip, latitude=seconds, longitude=2.2, timestamp=fixed_timestamp + timedelta(seconds=seconds))
+        )
+
+    response = api_client.get('/api/v1/public/get-latest-location-for-ip', params={'ip': ip})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert Location.model_validate(response.json()) == Location(
+        latitude=2, longitude=2.2, timestamp=fixed_timestamp_with_timezone + timedelta(seconds=2)
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_latest_location_for_url(api_client, mock_database, fixed_timestamp):
+    hostname = 'www.somehost.com'
+    await mock_database.insert_many(
+        HostnameLocation,
+        [(hostname, 1.1, 2.2, fixed_timestamp), (hostname, 3.3, 4.4, fixed_timestamp + timedelta(seconds=1))],
+    )
+
+    response = api_client.get('/api/v1/public/get-latest-location-for-url', params={'url': f'https://{hostname}/path'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert Location.model_validate(response.json()).latitude == 3.3
+
+
+@pytest.mark.asyncio
+async def test_get_latest_location_for_ip_not_found(api_client, mock_database):
+    response = api_client.get('/api/v1/public/get-latest-location-for-ip', params={'ip': '133.1.1.0'})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_get_latest_location_for_ip_after_deleting_newest(api_client, mock_database, fixed_timestamp):
+    ip = '133.1.1.0'
+    db_ids = await mock_database.insert_many(
+        IPLocation,
+        [(ip, 1.1, 2.2, fixed_timestamp), (ip, 3.3, 4.4, fixed_timestamp + timedelta(seconds=1))],
+        return_ids=True,
+    )
+    await mock_database.delete_by_id(IPLocation, db_ids[1])
+
+    response = api_client.get('/api/v1/public/get-latest-location-for-ip', params={'ip': ip})
+
+    assert Location.model_validate(response.json()).latitude == 1.1
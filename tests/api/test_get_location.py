@@ -1,3 +1,5 @@
+from datetime import timedelta, timezone
+
 import pytest
 from fastapi import status
 
@@ -6,7 +8,7 @@ from infrastructure.database.tables import HostnameLocation, IPLocation
 
 
 @pytest.mark.asyncio
-async def test_get_location_for_url(api_client, mock_database, fixed_timestamp):
+async def test_get_location_for_url(api_client, mock_database, fixed_timestamp, fixed_timestamp_with_timezone):
     hostname = 'www.somehost.com'
     url = f'https://{hostname}/and/path?query=value'
     entity = HostnameLocation(
@@ -18,7 +20,8 @@ async def test_get_location_for_url(api_client, mock_database, fixed_timestamp):
     await mock_database.insert(entity)
     await mock_database.insert(entity)
     assert len(await mock_database.select_all(HostnameLocation)) == 2
-    location = Location(latitude=1.1, longitude=2.2, timestamp=fixed_timestamp)
+    # naive timestamps are stored as UTC
+    location = Location(latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
     expected_response = LocationResponseModel(locations=[location, location])
 
     response = api_client.get('/api/v1/public/get-location-for-url', params={'url': url})
@@ -29,7 +32,7 @@ async def test_get_location_for_url(api_client, mock_database, fixed_timestamp):
 
 
 @pytest.mark.asyncio
-async def test_get_location_for_ip(api_client, mock_database, fixed_timestamp):
+async def test_get_location_for_ip(api_client, mock_database, fixed_timestamp, fixed_timestamp_with_timezone):
     ip = '133.1.1.0'
     entity = IPLocation(
         ip=ip,
@@ -40,7 +43,8 @@ async def test_get_location_for_ip(api_client, mock_database, fixed_timestamp):
     await mock_database.insert(entity)
     await mock_database.insert(entity)
     assert len(await mock_database.select_all(IPLocation)) == 2
-    location = Location(latitude=1.1, longitude=2.2, timestamp=fixed_timestamp)
+    # naive timestamps are stored as UTC
+    location = Location(latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
     expected_response = LocationResponseModel(locations=[location, location])
 
     response = api_client.get('/api/v1/public/get-location-for-ip', params={'ip': ip})
@@ -48,3 +52,67 @@ async def test_get_location_for_ip(api_client, mock_database, fixed_timestamp):
     parsed_response = LocationResponseModel.model_validate(response.json())
     assert response.status_code == status.HTTP_200_OK
     assert parsed_response == expected_response
+
+
+@pytest.mark.asyncio
+async def test_get_location_for_ip_pages(api_client, mock_database, fixed_timestamp):
+    ip = '133.1.1.0'
+    for seconds in [3, 0, 4, 1, 2]:
+        await mock_database.insert(
+            IPLocation(ip=ip, latitude=seconds, longitude=2.2, timestamp=fixed_timestamp + timedelta(seconds=seconds))
+        )
+
+    pages = []
+    params = {'ip': ip, 'limit': 2, 'since': (fixed_timestamp + timedelta(seconds=1)).isoformat()}
+    while True:
+        response = api_client.get('/api/v1/public/get-location-for-ip', params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = LocationResponseModel.model_validate(response.json())
+        pages.append([location.latitude for location in page.locations])
+        if page.next_cursor is None:
+            break
+        params['cursor'] = page.next_cursor
+
+    assert pages == [[1, 2], [3, 4]]
+
+
+@pytest.mark.asyncio
+async def test_get_location_for_ip_latest_first(api_client, mock_database, fixed_timestamp):
+    ip = '133.1.1.0'
+    for seconds in [0, 2, 1]:
+        await mock_database.insert(
+            IPLocation(ip=ip, latitude=seconds, longitude=2.2, timestamp=fixed_timestamp + timedelta(seconds=seconds))
+        )
+
+    response = api_client.get(
+        '/api/v1/public/get-location-for-ip',
+        params={'ip': ip, 'limit': 1, 'order': 'desc', 'until': (fixed_timestamp + timedelta(seconds=2)).isoformat()},
+    )
+
+    page = LocationResponseModel.model_validate(response.json())
+    assert [location.latitude for location in page.locations] == [1]
+    assert page.next_cursor is not None
+
+
+@pytest.mark.asyncio
+async def test_get_location_for_ip_invalid_cursor(api_client, mock_database):
+    response = api_client.get('/api/v1/public/get-location-for-ip', params={'ip': '133.1.1.0', 'cursor': 'invalid'})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_get_location_is_encoded_like_the_response_model(api_client, mock_database, fixed_timestamp):
+    ip = '133.1.1.0'
+    timestamps = [fixed_timestamp, fixed_timestamp.replace(microsecond=123456)]
+    await mock_database.insert_many(IPLocation, [(ip, 1.1, 2.2, timestamp) for timestamp in timestamps])
+    expected_response = LocationResponseModel(
+        locations=[
+            Location(latitude=1.1, longitude=2.2, timestamp=timestamp.replace(tzinfo=timezone.utc))
+            for timestamp in timestamps
+        ]
+    )
+
+    response = api_client.get('/api/v1/public/get-location-for-ip', params={'ip': ip})
+
+    assert response.json() == expected_response.model_dump(mode='json')
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+
+from api.models.models import LocationsByKeyResponseModel, Location
+from infrastructure.database.tables import IPLocation, HostnameLocation
+
+
+@pytest.mark.asyncio
+async def test_get_locations_for_ips(api_client, mock_database, fixed_timestamp):
+    for ip, seconds in [('133.1.1.0', 0), ('133.1.1.1', 0), ('133.1.1.0', 2), ('133.1.1.0', 1)]:
+        await mock_database.insert(
+            IPLocation(ip=ip, latitude=seconds, longitude=2.2, timestamp=fixed_timestamp + timedelta(seconds=seconds))
+        )
+
+    response = api_client.post(
+        '/api/v1/public/get-locations-for-ips', json={'ips': ['133.1.1.0', '133.1.1.1', '133.1.1.2']}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    locations = LocationsByKeyResponseModel.model_validate(response.json()).locations
+    assert [location.latitude for location in locations['133.1.1.0']] == [0, 1, 2]
+    assert [location.latitude for location in locations['133.1.1.1']] == [0]
+    assert locations['133.1.1.2'] == []
+
+
+@pytest.mark.asyncio
+async def test_get_locations_for_ips_latest(api_client, mock_database, fixed_timestamp):
+    for seconds in [0, 2, 1]:
+        await mock_database.insert(
+            IPLocation(
+                ip='133.1.1.0', latitude=seconds, longitude=2.2, timestamp=fixed_timestamp + timedelta(seconds=seconds)
+            )
+        )
+
+    response = api_client.post('/api/v1/public/get-locations-for-ips', json={'ips': ['133.1.1.0'], 'latest': 2})
+
+    locations = LocationsByKeyResponseModel.model_validate(response.json()).locations
+    assert [location.latitude for location in locations['133.1.1.0']] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_get_locations_for_urls(api_client, mock_database, fixed_timestamp, fixed_timestamp_with_timezone):
+    hostname = 'www.somehost.com'
+    await mock_database.insert(
+        HostnameLocation(hostname=hostname, latitude=1.1, longitude=2.2, timestamp=fixed_timestamp)
+    )
+    urls = [f'https://{hostname}/a', f'http://{hostname}/b', 'https://otherhost.com']
+
+    response = api_client.post('/api/v1/public/get-locations-for-urls', json={'urls': urls})
+
+    assert response.status_code == status.HTTP_200_OK
+    location = Location(latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
+    assert LocationsByKeyResponseModel.model_validate(response.json()) == LocationsByKeyResponseModel(
+        locations={urls[0]: [location], urls[1]: [location], urls[2]: []}
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_locations_for_ips_database_error(api_client, mock_error_database):
+    response = api_client.post('/api/v1/public/get-locations-for-ips', json={'ips': ['133.1.1.0']})
+
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -0,0 +1,20 @@
+from unittest.mock import AsyncMock
+
+from fastapi import status
+
+
+def test_database_healthcheck(api_client, mock_database):
+    response = api_client.get('/api/v1/public/healthcheck/database')
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['pool'] == 'NullPool'
+    assert response.json()['latency_seconds'] >= 0
+
+
+def test_database_healthcheck_when_database_fails(api_client, mock_database, monkeypatch):
+    monkeypatch.setattr(mock_database, 'check_health', AsyncMock(side_effect=OSError('connection refused')))
+
+    response = api_client.get('/api/v1/public/healthcheck/database')
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json() == {'detail': 'Database unavailable'}
@@ -0,0 +1,116 @@
+import gzip
+import json
+from datetime import timezone
+
+import pytest
+from fastapi import status
+
+from api.models.models import ImportSummaryResponseModel, ImportErrorModel
+from api.routers import imports
+from infrastructure.database.tables import IPLocation, HostnameLocation
+from utils.location_import import decompress, MAX_DECOMPRESSED_CHUNK_SIZE, MAX_LINE_LENGTH
+
+
+@pytest.mark.asyncio
+async def test_import_ips_from_ndjson(api_client, mock_database, mock_ip_stack_client, fixed_timestamp):
+    lines = [
+        {'ip': '133.1.1.0', 'latitude': 1.1, 'longitude': 2.2, 'timestamp': '2022-01-01T12:00:00Z'},
+        {'ip': '2001:DB8::1', 'latitude': 3.3, 'longitude': 4.4, 'timestamp': '2022-01-01T14:00:00+02:00'},
+    ]
+    body = ''.join(json.dumps(line) + '\n' for line in lines)
+
+    response = api_client.post(
+        '/api/v1/public/import',
+        params={'table': 'ip', 'format': 'ndjson'},
+        content=body,
+        headers={'Content-Type': 'application/x-ndjson'},
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert ImportSummaryResponseModel.model_validate(response.json()) == ImportSummaryResponseModel(
+        imported=2, failed=0, errors=[]
+    )
+    stored = await mock_database.select_all(IPLocation)
+    assert [(row.ip, row.latitude, row.longitude) for row in stored] == [
+        ('133.1.1.0', 1.1, 2.2),
+        ('2001:db8::1', 3.3, 4.4),
+    ]
+    assert all(
+        row.timestamp.replace(tzinfo=timezone.utc) == fixed_timestamp.replace(tzinfo=timezone.utc) for row in stored
+    )
+    mock_ip_stack_client.get_location.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_import_urls_from_gzipped_csv_reports_invalid_rows(api_client, mock_database):
+    body = (
+        'timestamp,hostname,latitude,longitude\n'
+        '2022-01-01T12:00:00,www.somehost.com,1.1,2.2\n'
+        '2022-01-01T12:00:00,www.otherhost.com,91,2.2\n'
+        'yesterday,www.otherhost.com,1.1,2.2\n'
+        '\n'
+        '2022-01-01T12:00:00,www.otherhost.com,5.5,6.6'
+    )
+
+    response = api_client.post(
+        '/api/v1/public/import', params={'table': 'url', 'format': 'csv'}, content=gzip.compress(body.encode())
+    )
+
+    summary = ImportSummaryResponseModel.model_validate(response.json())
+    assert response.status_code == status.HTTP_201_CREATED
+    assert (summary.imported, summary.failed) == (2, 2)
+    assert [error.line for error in summary.errors] == [3, 4]
+    assert summary.errors[0] == ImportErrorModel(line=3, error='latitude 91.0 out of range')
+    stored = await mock_database.select_all(HostnameLocation)
+    assert [(row.hostname, row.latitude) for row in stored] == [('www.somehost.com', 1.1), ('www.otherhost.com', 5.5)]
+    latest = await mock_database.select_latest_by_hostname('www.otherhost.com')
+    assert latest.latitude == 5.5
+
+
+@pytest.mark.asyncio
+async def test_import_stopped_after_stored_batches_answers_with_summary(api_client, mock_database, monkeypatch):
+    monkeypatch.setattr(imports, 'IMPORT_BATCH_SIZE', 1)
+    line = {'ip': '133.1.1.0', 'latitude': 1.1, 'longitude': 2.2, 'timestamp': '2022-01-01T12:00:00Z'}
+    # gzipped, so that the lines before the overlong one are decompressed and stored first
+    body = gzip.compress(((json.dumps(line) + '\n') * 2 + 'x' * (MAX_LINE_LENGTH + 1)).encode())
+
+    response = api_client.post('/api/v1/public/import', params={'table': 'ip', 'format': 'ndjson'}, content=body)
+
+    assert response.status_code == status.HTTP_200_OK
+    summary = ImportSummaryResponseModel.model_validate(response.json())
+    assert (summary.imported, summary.failed) == (2, 0)
+    assert summary.aborted == f'Line 3 is longer than {MAX_LINE_LENGTH} bytes'
+    assert len(await mock_database.select_all(IPLocation)) == 2
+
+
+@pytest.mark.asyncio
+async def test_gzip_stream_is_decompressed_in_bounded_chunks():
+    async def chunks():
+        yield gzip.compress(b'\n' * (5 * MAX_DECOMPRESSED_CHUNK_SIZE))
+
+    sizes = [len(chunk) async for chunk in decompress(chunks())]
+
+    assert sum(sizes) == 5 * MAX_DECOMPRESSED_CHUNK_SIZE
+    assert max(sizes) <= MAX_DECOMPRESSED_CHUNK_SIZE
+
+
+def test_import_csv_without_required_columns(api_client, mock_database):
+    response = api_client.post(
+        '/api/v1/public/import', params={'table': 'ip', 'format': 'csv'}, content='ip,latitude\n1.1.1.1,1.1\n'
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_export_can_be_imported(api_client, mock_database, fixed_timestamp):
+    await mock_database.insert_many(
+        IPLocation, [(f'10.0.0.{i}', float(i), float(i), fixed_timestamp) for i in range(10)]
+    )
+    exported = api_client.get('/api/v1/public/export', params={'table': 'ip', 'format': 'csv'}).content
+    await mock_database.delete_location_by_ip('10.0.0.0')
+
+    response = api_client.post('/api/v1/public/import', params={'table': 'ip', 'format': 'csv'}, content=exported)
+
+    assert response.json()['imported'] == 10
+    assert len(await mock_database.select_all(IPLocation)) == 19
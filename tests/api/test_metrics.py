@@ -0,0 +1,79 @@
+import httpx
+import pytest
+from fastapi import status
+
+from api.models.models import LocationByURLRequestModel
+from ipstack_client.ipstack_client import IPStackAPIClient, IPStackAPIClientError
+from utils.metrics import REGISTRY, MetricsRegistry, render_metrics
+
+
+@pytest.fixture(autouse=True)
+def cleared_metrics():
+    REGISTRY.clear()
+    yield
+    REGISTRY.clear()
+
+
+def test_render_histogram():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('duration_seconds', 'Duration', ('route',), buckets=(0.1, 1.0))
+    counter = registry.counter('requests_total', 'Requests', ('route',))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.5, '/a')
+    histogram.observe(5, '/a')
+    counter.inc('/"quoted"')
+
+    assert render_metrics(registry.metrics()).splitlines() == [
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{route="/a",le="0.1"} 1',
+        'duration_seconds_bucket{route="/a",le="1"} 2',
+        'duration_seconds_bucket{route="/a",le="+Inf"} 3',
+        'duration_seconds_sum{route="/a"} 5.55',
+        'duration_seconds_count{route="/a"} 3',
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/\\"quoted\\""} 1',
+    ]
+
+
+def test_metrics_of_request(api_client, mock_database, mock_ip_stack_client):
+    request = LocationByURLRequestModel(url='https://www.somehost.com/path')
+    api_client.post('/api/v1/public/add-location-for-url', json=request.model_dump())
+
+    response = api_client.get('/metrics')
+
+    route = '/api/v1/public/add-location-for-url'
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/plain')
+    lines = response.text.splitlines()
+    assert f'ip_locator_requests_total{{method="POST",route="{route}",status="201"}} 1' in lines
+    assert f'ip_locator_request_duration_seconds_count{{method="POST",route="{route}"}} 1' in lines
+    stages = {line.split('stage="')[1].split('"')[0] for line in lines if f'_count{{route="{route}"' in line}
+    assert stages == {'hostname', 'database'}
+
+
+def test_metrics_of_unmatched_route(api_client, mock_database, mock_ip_stack_client):
+    api_client.get('/api/v1/public/no-such-endpoint')
+
+    response = api_client.get('/metrics')
+
+    assert 'ip_locator_requests_total{method="GET",route="unmatched",status="404"} 1' in response.text.splitlines()
+
+
+@pytest.mark.asyncio
+async def test_upstream_metrics():
+    responses = iter([httpx.Response(200, json={'latitude': 1.1, 'longitude': 2.2}), httpx.Response(503)])
+    client = IPStackAPIClient(
+        baseurl='http://ipstack.test', access_key='secret', transport=httpx.MockTransport(lambda _: next(responses))
+    )
+
+    await client.get_location('120.1.1.1')
+    with pytest.raises(IPStackAPIClientError):
+        await client.get_location('120.1.1.2')
+    await client.close()
+
+    lines = render_metrics(REGISTRY.metrics()).splitlines()
+    assert 'ip_locator_upstream_requests_total{upstream="ipstack",endpoint="single",outcome="200"} 1' in lines
+    assert 'ip_locator_upstream_requests_total{upstream="ipstack",endpoint="single",outcome="503"} 1' in lines
+    assert 'ip_locator_upstream_request_duration_seconds_count{upstream="ipstack",endpoint="single"} 2' in lines
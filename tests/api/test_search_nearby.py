@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+
+from api.models.models import NearbyLocationsResponseModel
+from infrastructure.database.tables import HostnameLocation
+
+
+@pytest.mark.asyncio
+async def test_search_nearby_urls(api_client, mock_database, fixed_timestamp_with_timezone):
+    await mock_database.insert_many(
+        HostnameLocation,
+        [
+            ('www.potsdam.com', 52.3906, 13.0645, fixed_timestamp_with_timezone),
+            ('www.berlin.com', 52.52, 13.405, fixed_timestamp_with_timezone),
+            ('www.hamburg.com', 53.5511, 9.9937, fixed_timestamp_with_timezone),
+            ('www.old-berlin.com', 52.52, 13.405, fixed_timestamp_with_timezone - timedelta(days=2)),
+        ],
+    )
+
+    response = api_client.get(
+        '/api/v1/public/search-nearby',
+        params={
+            'table': 'url',
+            'latitude': 52.52,
+            'longitude': 13.405,
+            'radius_km': 50,
+            'since': (fixed_timestamp_with_timezone - timedelta(days=1)).isoformat(),
+            'limit': 10,
+        },
+    )
+
+    parsed_response = NearbyLocationsResponseModel.model_validate(response.json())
+    assert response.status_code == status.HTTP_200_OK
+    assert [(location.key, round(location.distance_km)) for location in parsed_response.locations] == [
+        ('www.berlin.com', 0),
+        ('www.potsdam.com', 27),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_search_nearby_across_the_antimeridian(api_client, mock_database, fixed_timestamp_with_timezone):
+    await mock_database.insert_many(HostnameLocation, [('www.fiji.com', -17.0, -179.9, fixed_timestamp_with_timezone)])
+
+    response = api_client.get(
+        '/api/v1/public/search-nearby',
+        params={'table': 'url', 'latitude': -17.0, 'longitude': 179.9, 'radius_km': 50, 'limit': 1},
+    )
+
+    assert [location['key'] for location in response.json()['locations']] == ['www.fiji.com']
+
+
+def test_search_nearby_with_invalid_radius(api_client, mock_database):
+    response = api_client.get('/api/v1/public/search-nearby', params={'latitude': 0, 'longitude': 0, 'radius_km': 0})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,51 @@
+import httpx
+import pytest
+
+from benchmarks.ipstack_stub import create_stub_app, stub_location
+from benchmarks.results import percentile, compare_with_baseline
+from ipstack_client.ipstack_client import IPStackAPIClient, IPStackAPIClientError
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+
+    assert percentile(values, 0.5) == 50.5
+    assert percentile(values, 0.99) == pytest.approx(99.01)
+    assert percentile([], 0.5) == 0.0
+
+
+def test_compare_with_baseline():
+    baseline = {'cases': {'read': {'throughput': 100.0, 'p99_ms': 10.0, 'max_ms': 20.0}, 'gone': {'p99_ms': 1.0}}}
+    report = {'cases': {'read': {'throughput': 85.0, 'p99_ms': 10.5, 'max_ms': 90.0}, 'new': {'p99_ms': 5.0}}}
+
+    regressions = compare_with_baseline(report, baseline, tolerance=0.1)
+
+    assert regressions == ['read throughput: 85.0 against 100.0 (15% worse)']
+
+
+def make_client(app) -> IPStackAPIClient:
+    return IPStackAPIClient(baseurl='http://stub', access_key='key', transport=httpx.ASGITransport(app=app))
+
+
+@pytest.mark.asyncio
+async def test_stub_answers_ipstack_lookups():
+    client = make_client(create_stub_app())
+
+    location = await client.get_location('120.1.1.1')
+    locations = await client.get_locations(['120.1.1.1', '120.1.1.2'])
+    await client.close()
+
+    assert location.model_dump() == stub_location('120.1.1.1')
+    assert {ip: location.model_dump() for ip, location in locations.items()} == {
+        '120.1.1.1': stub_location('120.1.1.1'),
+        '120.1.1.2': stub_location('120.1.1.2'),
+    }
+
+
+@pytest.mark.asyncio
+async def test_stub_errors():
+    client = make_client(create_stub_app(error_rate=1.0))
+
+    with pytest.raises(IPStackAPIClientError):
+        await client.get_location('120.1.1.1')
+    await client.close()
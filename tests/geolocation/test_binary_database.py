@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from geolocation.binary_database import MappedIPRangeDatabase, ReloadingIPRangeDatabase, write_binary_database
+from geolocation.range_database import (
+    IPRangeDatabase,
+    IPRangeTable,
+    IPV4_KEY_WIDTH,
+    IPV6_KEY_WIDTH,
+    IPRangeDatabaseError,
+)
+
+
+def make_database(latitude: float) -> IPRangeDatabase:
+    return IPRangeDatabase(
+        IPRangeTable.from_ranges(
+            IPV4_KEY_WIDTH, [(0x01000000, 0x010000FF, latitude, 2.5), (0x0A000000, 0x0AFFFFFF, -3.25, 4.5)]
+        ),
+        IPRangeTable.from_ranges(IPV6_KEY_WIDTH, [(0x20010DB8 << 96, (0x20010DB9 << 96) - 1, 5.5, 6.5)]),
+    )
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = str(tmp_path / 'geo.bin')
+    write_binary_database(make_database(1.5), path)
+    return path
+
+
+def test_mapped_database_lookup(database_path):
+    database = MappedIPRangeDatabase(database_path, verify=True)
+
+    assert database.size == 3
+    assert database.lookup('1.0.0.9') == (1.5, 2.5)
+    assert database.lookup('10.20.30.40') == (-3.25, 4.5)
+    assert database.lookup('2001:db8::1') == (5.5, 6.5)
+    assert database.lookup('9.9.9.9') is None
+    database.close()
+
+
+def test_mapped_database_detects_corruption(database_path):
+    with open(database_path, 'r+b') as file:
+        file.seek(-1, os.SEEK_END)
+        file.write(b'\xff')
+
+    with pytest.raises(IPRangeDatabaseError):
+        MappedIPRangeDatabase(database_path, verify=True)
+
+
+def test_reloading_database_picks_up_replaced_file(database_path):
+    database = ReloadingIPRangeDatabase(database_path, check_interval=0)
+    assert database.lookup('1.0.0.9') == (1.5, 2.5)
+
+    write_binary_database(make_database(7.5), database_path)
+
+    assert database.lookup('1.0.0.9') == (7.5, 2.5)
+    database.close()
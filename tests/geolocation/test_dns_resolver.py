@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import dns.resolver
+import pytest
+
+from geolocation.dns_resolver import CachingDNSResolver
+from model.base.ip_locator_exception import IPLocatorResolvingHostnameException
+
+
+class FakeResolver:
+    def __init__(self, records: dict[tuple[str, str], tuple[list[str], int]]) -> None:
+        self.records = records
+        self.queries = []
+
+    async def resolve(self, hostname: str, record_type: str, lifetime: float):
+        self.queries.append((hostname, record_type))
+        await asyncio.sleep(0)
+        if (hostname, record_type) not in self.records:
+            raise dns.resolver.NoAnswer()
+        return FakeAnswer(*self.records[(hostname, record_type)])
+
+
+class FakeAnswer:
+    def __init__(self, addresses: list[str], ttl: int) -> None:
+        self.rrset = SimpleNamespace(ttl=ttl)
+        self._records = [SimpleNamespace(address=address) for address in addresses]
+
+    def __iter__(self):
+        return iter(self._records)
+
+
+@pytest.mark.asyncio
+async def test_resolve_prefers_ipv4_and_caches_for_ttl():
+    resolver = FakeResolver(
+        {('a.example.com', 'A'): (['192.0.2.1'], 60), ('b.example.com', 'AAAA'): (['2001:db8::1'], 60)}
+    )
+    dns_resolver = CachingDNSResolver(resolver, min_ttl=1, max_ttl=30)
+
+    with patch('geolocation.dns_resolver.time.monotonic', return_value=100.0):
+        assert await dns_resolver.resolve('A.example.com.') == '192.0.2.1'
+        assert await dns_resolver.resolve('a.example.com') == '192.0.2.1'
+        assert await dns_resolver.resolve('b.example.com') == '2001:db8::1'
+    # the ttl of 60 seconds is clamped to 30
+    with patch('geolocation.dns_resolver.time.monotonic', return_value=131.0):
+        assert await dns_resolver.resolve('a.example.com') == '192.0.2.1'
+
+    assert resolver.queries == [
+        ('a.example.com', 'A'),
+        ('b.example.com', 'A'),
+        ('b.example.com', 'AAAA'),
+        ('a.example.com', 'A'),
+    ]
+    assert (dns_resolver.stats().hits, dns_resolver.stats().misses) == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_resolve_caches_failures_and_coalesces_queries():
+    resolver = FakeResolver({('a.example.com', 'A'): (['192.0.2.1'], 60)})
+    dns_resolver = CachingDNSResolver(resolver, negative_ttl=30)
+
+    results = await dns_resolver.resolve_many(['a.example.com', 'missing.example.com', '10.0.0.1'])
+    concurrent = await asyncio.gather(
+        *(dns_resolver.resolve('c.example.com') for _ in range(3)), return_exceptions=True
+    )
+    with pytest.raises(IPLocatorResolvingHostnameException):
+        await dns_resolver.resolve('missing.example.com')
+
+    assert results['a.example.com'] == '192.0.2.1'
+    assert isinstance(results['missing.example.com'], IPLocatorResolvingHostnameException)
+    assert results['10.0.0.1'] == '10.0.0.1'
+    assert all(isinstance(result, IPLocatorResolvingHostnameException) for result in concurrent)
+    assert resolver.queries.count(('c.example.com', 'A')) == 1
+    assert resolver.queries.count(('missing.example.com', 'A')) == 1
+    assert dns_resolver.stats().coalesced == 2
+    assert dns_resolver.stats().negative_hits == 1
@@ -0,0 +1,33 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from geolocation.location_provider import OfflineLocationProvider, FallbackLocationProvider
+from geolocation.range_database import IPRangeDatabase, IPRangeTable, IPV4_KEY_WIDTH, IPV6_KEY_WIDTH
+from ipstack_client.models import LocationResponse
+
+
+@pytest.fixture
+def offline_provider():
+    database = IPRangeDatabase(
+        IPRangeTable.from_ranges(IPV4_KEY_WIDTH, [(0x01000000, 0x010000FF, 1.5, 2.5)]),
+        IPRangeTable.from_ranges(IPV6_KEY_WIDTH, []),
+    )
+    return OfflineLocationProvider(database)
+
+
+@pytest.mark.asyncio
+async def test_offline_first_falls_back_for_unknown_hosts(offline_provider, location):
+    fallback = AsyncMock()
+    fallback.get_location.return_value = location
+    fallback.get_locations.side_effect = lambda hosts: {host: location for host in hosts}
+    provider = FallbackLocationProvider(offline_provider, fallback)
+
+    assert await provider.get_location('1.0.0.1') == LocationResponse(latitude=1.5, longitude=2.5)
+    assert await provider.get_location('somehost.com') == location
+    assert await provider.get_locations(['1.0.0.1', '8.8.8.8']) == {
+        '1.0.0.1': LocationResponse(latitude=1.5, longitude=2.5),
+        '8.8.8.8': location,
+    }
+    fallback.get_location.assert_awaited_once_with('somehost.com')
+    fallback.get_locations.assert_awaited_once_with(['8.8.8.8'])
@@ -0,0 +1,60 @@
+import pytest
+
+from geolocation.range_database import IPRangeDatabase, IPRangeDatabaseError
+
+
+@pytest.fixture
+def network_csv(tmp_path):
+    path = tmp_path / 'blocks.csv'
+    path.write_text(
+        'network,geoname_id,latitude,longitude,accuracy_radius\n'
+        '1.0.0.0/24,1,10.5,20.25,100\n'
+        '1.0.2.0/23,2,-30.0,40.0,100\n'
+        '2.0.0.0/8,3,,,100\n'
+        '2001:db8::/32,4,50.0,60.0,100\n'
+    )
+    return str(path)
+
+
+@pytest.fixture
+def start_end_csv(tmp_path):
+    path = tmp_path / 'ranges.csv'
+    path.write_text('start_ip,end_ip,latitude,longitude\n' '16777216,16777471,1.1,2.2\n' '5.5.5.0,5.5.5.9,3.3,4.4\n')
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    'ip, expected_location',
+    [
+        ('1.0.0.0', (10.5, 20.25)),
+        ('1.0.0.255', (10.5, 20.25)),
+        ('1.0.1.1', None),
+        ('1.0.3.255', (-30.0, 40.0)),
+        ('2.1.1.1', None),
+        ('::ffff:1.0.0.7', (10.5, 20.25)),
+        ('2001:db8::1', (50.0, 60.0)),
+        ('2001:db9::1', None),
+        ('not an ip', None),
+    ],
+)
+def test_lookup_network_csv(network_csv, ip, expected_location):
+    database = IPRangeDatabase.from_csv([network_csv])
+
+    assert database.lookup(ip) == expected_location
+
+
+def test_lookup_start_end_csv(start_end_csv):
+    database = IPRangeDatabase.from_csv([start_end_csv])
+
+    assert database.size == 2
+    assert database.lookup('1.0.0.100') == (1.1, 2.2)
+    assert database.lookup('5.5.5.9') == (3.3, 4.4)
+    assert database.lookup('5.5.5.10') is None
+
+
+def test_from_csv_rejects_unknown_layout(tmp_path):
+    path = tmp_path / 'unknown.csv'
+    path.write_text('ip,latitude,longitude\n1.1.1.1,1,1\n')
+
+    with pytest.raises(IPRangeDatabaseError):
+        IPRangeDatabase.from_csv([str(path)])
@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+
+from geolocation.location_provider import LocationProvider
+from geolocation.refresh_scheduler import RefreshScheduler, AccessTracker
+from infrastructure.database.tables import IPLocation, HostnameLocation
+from ipstack_client.cache import CachedLocationClient
+from ipstack_client.models import LocationResponse, IPStackAPIClientError
+from ipstack_client.rate_limiter import BACKGROUND, _priority
+from utils.file_lock import FileLock
+
+REFRESHED = LocationResponse(latitude=10.0, longitude=20.0)
+
+
+@pytest.fixture
+def location_provider():
+    # a provider without caches
+    provider = AsyncMock(spec=LocationProvider)
+    provider.get_locations.side_effect = lambda hosts: {host: REFRESHED for host in hosts}
+    return provider
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / 'refresh.lock')
+
+
+async def store(database, table, key: str, age: timedelta) -> None:
+    await database.insert_many(table, [(key, 1.1, 2.2, datetime.now(timezone.utc) - age)])
+
+
+@pytest.mark.asyncio
+async def test_refreshes_stale_keys_oldest_first(mock_database, location_provider, lock_path):
+    await store(mock_database, IPLocation, '10.0.0.1', timedelta(days=3))
+    await store(mock_database, IPLocation, '10.0.0.2', timedelta(days=2))
+    await store(mock_database, IPLocation, '10.0.0.3', timedelta(minutes=1))
+    scheduler = RefreshScheduler(mock_database, location_provider, max_age=86400, batch_size=1, lock_path=lock_path)
+
+    assert await scheduler.refresh_once()
+
+    location_provider.get_locations.assert_awaited_once_with(['10.0.0.1'])
+    latest = await mock_database.select_latest_by_ip('10.0.0.1')
+    assert (latest.latitude, latest.longitude) == (10.0, 20.0)
+    # the stale location stays readable in the history
+    assert len(await mock_database.select_by_ip('10.0.0.1')) == 2
+    stats = scheduler.stats()
+    assert stats.stale_keys == {'ip_address': 2, 'url_address': 0}
+    assert 2 * 86400 - 60 < stats.lag_seconds['ip_address'] < 2 * 86400 + 60
+    assert stats.refreshed == {'ip_address': 1}
+
+    assert await scheduler.refresh_once()
+    assert not await scheduler.refresh_once()
+    assert scheduler.stats().stale_keys['ip_address'] == 0
+    assert location_provider.get_locations.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_frequency_order_refreshes_most_read_keys_first(mock_database, location_provider, lock_path):
+    await store(mock_database, HostnameLocation, 'old.example.com', timedelta(days=3))
+    await store(mock_database, HostnameLocation, 'read.example.com', timedelta(days=2))
+    scheduler = RefreshScheduler(
+        mock_database, location_provider, max_age=86400, batch_size=1, order='frequency', lock_path=lock_path
+    )
+    for _ in range(3):
+        scheduler.record_access(HostnameLocation, 'read.example.com')
+
+    await scheduler.refresh_once()
+    await scheduler.refresh_once()
+
+    calls = [call.args[0] for call in location_provider.get_locations.await_args_list]
+    assert calls == [['read.example.com'], ['old.example.com']]
+    assert (await mock_database.select_latest_by_hostname('read.example.com')).latitude == 10.0
+
+
+@pytest.mark.asyncio
+async def test_failed_keys_are_skipped_until_retried(mock_database, location_provider, lock_path):
+    await store(mock_database, IPLocation, '10.0.0.1', timedelta(days=3))
+    await store(mock_database, IPLocation, '10.0.0.2', timedelta(days=2))
+    location_provider.get_locations.side_effect = lambda hosts: {
+        host: IPStackAPIClientError('invalid') if host == '10.0.0.1' else REFRESHED for host in hosts
+    }
+    scheduler = RefreshScheduler(
+        mock_database, location_provider, max_age=86400, batch_size=1, retry_failed_after=0.05, lock_path=lock_path
+    )
+
+    await scheduler.refresh_once()
+    await scheduler.refresh_once()
+    await asyncio.sleep(0.05)
+    await scheduler.refresh_once()
+
+    calls = [call.args[0] for call in location_provider.get_locations.await_args_list]
+    assert calls == [['10.0.0.1'], ['10.0.0.2'], ['10.0.0.1']]
+    assert scheduler.stats().failed == {'ip_address': 2}
+
+
+@pytest.mark.asyncio
+async def test_refresh_goes_past_the_cache_and_updates_it(mock_database, location_provider, lock_path):
+    cached_provider = CachedLocationClient(location_provider)
+    location_provider.get_locations.side_effect = lambda hosts: {
+        host: LocationResponse(latitude=1.1, longitude=2.2) for host in hosts
+    }
+    await cached_provider.get_locations(['10.0.0.1'])
+    location_provider.get_locations.side_effect = lambda hosts: {host: REFRESHED for host in hosts}
+    await store(mock_database, IPLocation, '10.0.0.1', timedelta(days=2))
+    scheduler = RefreshScheduler(mock_database, cached_provider, max_age=86400, lock_path=lock_path)
+
+    await scheduler.refresh_once()
+
+    assert location_provider.get_locations.await_count == 2
+    assert (await mock_database.select_latest_by_ip('10.0.0.1')).latitude == REFRESHED.latitude
+    assert await cached_provider.get_location('10.0.0.1') == REFRESHED
+
+
+@pytest.mark.asyncio
+async def test_lookups_run_at_background_priority(mock_database, location_provider, lock_path):
+    await store(mock_database, IPLocation, '10.0.0.1', timedelta(days=3))
+    priorities = []
+
+    async def get_locations(hosts):
+        priorities.append(_priority.get())
+        return {host: REFRESHED for host in hosts}
+
+    location_provider.get_locations.side_effect = get_locations
+    scheduler = RefreshScheduler(mock_database, location_provider, max_age=86400, lock_path=lock_path)
+
+    await scheduler.refresh_once()
+
+    assert priorities == [BACKGROUND]
+
+
+@pytest.mark.asyncio
+async def test_only_the_lock_holder_refreshes(mock_database, location_provider, lock_path):
+    await store(mock_database, IPLocation, '10.0.0.1', timedelta(days=3))
+    other_worker = FileLock(lock_path)
+    assert await other_worker.acquire(blocking=False)
+    scheduler = RefreshScheduler(mock_database, location_provider, max_age=86400, interval=0.01, lock_path=lock_path)
+
+    await scheduler.start()
+    await asyncio.sleep(0.05)
+    assert not scheduler.stats().leader
+    location_provider.get_locations.assert_not_awaited()
+
+    other_worker.release()
+    await asyncio.sleep(0.1)
+    await scheduler.stop()
+    assert location_provider.get_locations.await_count >= 1
+
+
+def test_access_tracker_normalizes_ips_and_forgets_the_least_read_keys():
+    tracker = AccessTracker(max_keys=2)
+
+    tracker.record(IPLocation, '::ffff:10.0.0.1')
+    for ip in ['10.0.0.1', '10.0.0.2', '10.0.0.2', '10.0.0.2', '10.0.0.3']:
+        tracker.record(IPLocation, ip)
+
+    assert tracker.hottest(IPLocation) == ['10.0.0.2']
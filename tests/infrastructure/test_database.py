@@ -1,4 +1,10 @@
+from datetime import timedelta, timezone
+from unittest.mock import Mock
+
 import pytest
+from sqlalchemy import inspect, text
+
+from infrastructure.database import connector
 from infrastructure.database.tables import IPLocation
 
 
@@ -57,3 +63,191 @@ async def test_delete_by_id(mock_database, fixed_timestamp_with_timezone):
 
     entities = await mock_database.select_all(IPLocation)
     assert len(entities) == 1
+
+
+@pytest.mark.asyncio
+async def test_select_latest_by_ip(mock_database, fixed_timestamp_with_timezone):
+    for seconds in [0, 20, 10]:
+        await mock_database.insert(
+            IPLocation(
+                ip='127.0.0.1',
+                latitude=seconds,
+                longitude=2.2,
+                timestamp=fixed_timestamp_with_timezone + timedelta(seconds=seconds),
+            )
+        )
+
+    latest = await mock_database.select_latest_by_ip('127.0.0.1')
+    too_old = await mock_database.select_latest_by_ip(
+        '127.0.0.1', since=fixed_timestamp_with_timezone + timedelta(seconds=30)
+    )
+
+    assert latest.latitude == 20
+    assert too_old is None
+
+
+@pytest.mark.asyncio
+async def test_insert_many(mock_database, fixed_timestamp_with_timezone):
+    rows = [
+        {'ip': '127.0.0.1', 'latitude': 1.1, 'longitude': 2.2, 'timestamp': fixed_timestamp_with_timezone},
+        ('127.0.0.2', 3.3, 4.4, fixed_timestamp_with_timezone),
+        ('127.0.0.3', 5.5, 6.6, fixed_timestamp_with_timezone),
+    ]
+
+    db_ids = await mock_database.insert_many(IPLocation, rows, chunk_size=2, return_ids=True)
+
+    assert db_ids == [1, 2, 3]
+    entities = await mock_database.select_all(IPLocation)
+    assert [(entity.id, entity.ip, entity.latitude) for entity in entities] == [
+        (1, '127.0.0.1', 1.1),
+        (2, '127.0.0.2', 3.3),
+        (3, '127.0.0.3', 5.5),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_create_tables_adds_missing_indexes(mock_database):
+    async with mock_database.engine.begin() as connection:
+        await connection.execute(text('DROP INDEX ix_ip_address_ip_timestamp'))
+
+    await mock_database.create_tables()
+
+    async with mock_database.engine.connect() as connection:
+        indexes = await connection.run_sync(lambda sync_connection: inspect(sync_connection).get_indexes('ip_address'))
+    assert 'ix_ip_address_ip_timestamp' in [index['name'] for index in indexes]
+
+
+@pytest.mark.asyncio
+async def test_create_tables_backfills_latest_tables(mock_database, fixed_timestamp_with_timezone):
+    await mock_database.insert_many(
+        IPLocation,
+        [
+            ('127.0.0.1', 1.1, 2.2, fixed_timestamp_with_timezone),
+            ('127.0.0.1', 3.3, 4.4, fixed_timestamp_with_timezone + timedelta(seconds=1)),
+        ],
+    )
+    async with mock_database.engine.begin() as connection:
+        await connection.execute(text('DELETE FROM ip_address_latest'))
+
+    await mock_database.create_tables()
+
+    latest = await mock_database.select_latest_by_ip('127.0.0.1')
+    assert latest.latitude == 3.3
+
+
+@pytest.mark.asyncio
+async def test_stream_locations_in_batches(mock_database, fixed_timestamp):
+    rows = [(f'10.0.0.{i}', float(i), float(i), fixed_timestamp + timedelta(seconds=i)) for i in range(25)]
+    await mock_database.insert_many(IPLocation, rows)
+
+    partitions = [
+        partition
+        async for partition in mock_database.stream_locations(
+            IPLocation, since=fixed_timestamp + timedelta(seconds=5), batch_size=10
+        )
+    ]
+
+    assert [len(partition) for partition in partitions] == [10, 10]
+    assert [tuple(row)[:3] for partition in partitions for row in partition] == [row[:3] for row in rows[5:]]
+
+
+@pytest.mark.asyncio
+async def test_create_tables_adds_and_backfills_geohash_column(mock_database, fixed_timestamp_with_timezone):
+    await mock_database.insert_many(IPLocation, [('127.0.0.1', 57.64911, 10.40744, fixed_timestamp_with_timezone)])
+    async with mock_database.engine.begin() as connection:
+        await connection.execute(text('DROP INDEX ix_ip_address_geohash'))
+        await connection.execute(text('ALTER TABLE ip_address DROP COLUMN geohash'))
+
+    await mock_database.create_tables()
+
+    async with mock_database.engine.connect() as connection:
+        geohashes = (await connection.execute(text('SELECT geohash FROM ip_address'))).scalars().all()
+    assert geohashes == ['u4pruydqq']
+
+
+@pytest.mark.asyncio
+async def test_search_nearby(mock_database, fixed_timestamp_with_timezone):
+    berlin, potsdam, hamburg = (52.52, 13.405), (52.3906, 13.0645), (53.5511, 9.9937)
+    await mock_database.insert_many(
+        IPLocation,
+        [
+            ('10.0.0.1', *potsdam, fixed_timestamp_with_timezone),
+            ('10.0.0.1', *berlin, fixed_timestamp_with_timezone - timedelta(days=2)),
+            ('10.0.0.2', *berlin, fixed_timestamp_with_timezone),
+            ('10.0.0.3', *hamburg, fixed_timestamp_with_timezone),
+        ],
+    )
+
+    nearby = await mock_database.search_nearby(IPLocation, *berlin, 50)
+    recent_nearby = await mock_database.search_nearby(
+        IPLocation, *berlin, 50, since=fixed_timestamp_with_timezone - timedelta(days=1)
+    )
+
+    assert [(key, round(distance)) for key, _, _, _, distance in nearby] == [('10.0.0.1', 0), ('10.0.0.2', 0)]
+    assert [(key, round(distance)) for key, _, _, _, distance in recent_nearby] == [('10.0.0.2', 0), ('10.0.0.1', 27)]
+
+
+@pytest.mark.asyncio
+async def test_ip_spellings_are_stored_normalized(mock_database, fixed_timestamp_with_timezone):
+    await mock_database.insert_many(
+        IPLocation,
+        [
+            ('2001:DB8:0::1', 1.1, 2.2, fixed_timestamp_with_timezone),
+            ('2001:db8::1', 3.3, 4.4, fixed_timestamp_with_timezone + timedelta(seconds=1)),
+        ],
+    )
+
+    results = await mock_database.select_by_ips(['2001:0db8::0001', '2001:db8::1'])
+
+    assert [location.ip for location in await mock_database.select_all(IPLocation)] == ['2001:db8::1'] * 2
+    assert [location.latitude for location in results['2001:0db8::0001']] == [1.1, 3.3]
+    assert results['2001:db8::1'] == results['2001:0db8::0001']
+    assert (await mock_database.select_latest_by_ip('2001:DB8::1')).latitude == 3.3
+
+
+@pytest.mark.asyncio
+async def test_create_tables_backfills_ip_keys(mock_database, fixed_timestamp_with_timezone):
+    async with mock_database.engine.begin() as connection:
+        await connection.execute(text('DROP INDEX ix_ip_address_ip_key_id'))
+        await connection.execute(text('ALTER TABLE ip_address DROP COLUMN ip_key'))
+        await connection.execute(
+            text(
+                "INSERT INTO ip_address (ip, latitude, longitude, timestamp) "
+                "VALUES ('10.0.0.1', 1.1, 2.2, '2022-01-01'), ('::FFFF:10.0.0.2', 3.3, 4.4, '2022-01-01'), "
+                "('not-an-ip', 5.5, 6.6, '2022-01-01')"
+            )
+        )
+        await connection.execute(
+            text("INSERT INTO ip_address_latest VALUES ('::FFFF:10.0.0.2', 3.3, 4.4, '2022-01-01')")
+        )
+
+    await mock_database.create_tables()
+
+    assert [location.ip for location in await mock_database.select_by_cidr('10.0.0.0/24')] == ['10.0.0.1', '10.0.0.2']
+    assert (await mock_database.select_latest_by_ip('10.0.0.2')).latitude == 3.3
+    assert (await mock_database.select_latest_by_ip('10.0.0.1')).latitude == 1.1
+
+
+@pytest.mark.asyncio
+async def test_create_tables_backfills_ip_keys_once(mock_database, fixed_timestamp_with_timezone, monkeypatch):
+    await mock_database.insert_many(IPLocation, [('not-an-ip', 1.1, 2.2, fixed_timestamp_with_timezone)])
+    backfill_ip_keys = Mock()
+    monkeypatch.setattr(connector, 'backfill_ip_keys', backfill_ip_keys)
+
+    await mock_database.create_tables()
+
+    backfill_ip_keys.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_timestamps_are_stored_and_loaded_in_utc(mock_database, fixed_timestamp_with_timezone):
+    local_timestamp = fixed_timestamp_with_timezone.astimezone(timezone(timedelta(hours=2)))
+    await mock_database.insert_many(IPLocation, [('127.0.0.1', 1.1, 2.2, local_timestamp)])
+
+    stored = await mock_database.select_all(IPLocation)
+    selected = await mock_database.select_by_ip('127.0.0.1', since=local_timestamp)
+
+    assert stored[0].timestamp == fixed_timestamp_with_timezone
+    assert stored[0].timestamp.tzinfo == timezone.utc
+    assert stored[0].to_dict()['timestamp'] == fixed_timestamp_with_timezone
+    assert len(selected) == 1
@@ -0,0 +1,111 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from infrastructure.database.ingest_buffer import IngestBuffer
+from infrastructure.database.tables import IPLocation, HostnameLocation
+from model.base.ip_locator_exception import IPLocatorIngestBufferFullException
+from utils.metrics import REGISTRY, render_metrics
+
+
+@pytest.fixture(autouse=True)
+def cleared_metrics():
+    REGISTRY.clear()
+    yield
+    REGISTRY.clear()
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_flushes_on_stop(mock_database, fixed_timestamp_with_timezone):
+    ingest_buffer = IngestBuffer(mock_database, batch_size=2, flush_interval=10)
+    await ingest_buffer.start()
+
+    for i in range(3):
+        await ingest_buffer.put(
+            IPLocation(ip=f'127.0.0.{i}', latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
+        )
+    await ingest_buffer.put(
+        HostnameLocation(hostname='somehost.com', latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
+    )
+    await ingest_buffer.stop()
+
+    assert len(await mock_database.select_all(IPLocation)) == 3
+    assert len(await mock_database.select_all(HostnameLocation)) == 1
+    stats = ingest_buffer.stats()
+    assert (stats.flushes, stats.flushed_rows, stats.queue_depth) == (2, 4, 0)
+    lines = render_metrics(REGISTRY.metrics()).splitlines()
+    assert 'ip_locator_ingest_buffer_rows_total{outcome="flushed"} 4' in lines
+    assert 'ip_locator_ingest_buffer_flush_duration_seconds_count 2' in lines
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('resolved_ips', [('133.1.1.0', None), (None, '133.1.1.0')])
+async def test_ingest_buffer_flushes_hostnames_with_and_without_resolved_ip(
+    mock_database, fixed_timestamp_with_timezone, resolved_ips
+):
+    ingest_buffer = IngestBuffer(mock_database, batch_size=2, flush_interval=10)
+    await ingest_buffer.start()
+
+    for i, resolved_ip in enumerate(resolved_ips):
+        await ingest_buffer.put(
+            HostnameLocation(
+                hostname=f'host{i}.com',
+                latitude=1.1,
+                longitude=2.2,
+                timestamp=fixed_timestamp_with_timezone,
+                resolved_ip=resolved_ip,
+            )
+        )
+    await ingest_buffer.stop()
+
+    stored = await mock_database.select_all(HostnameLocation)
+    assert tuple(row.resolved_ip for row in sorted(stored, key=lambda row: row.hostname)) == resolved_ips
+    assert (ingest_buffer.stats().flushed_rows, ingest_buffer.stats().failed_rows) == (2, 0)
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_applies_backpressure(fixed_timestamp_with_timezone):
+    flush_started = asyncio.Event()
+    release_flush = asyncio.Event()
+
+    async def insert_many(*args, **kwargs):
+        flush_started.set()
+        await release_flush.wait()
+
+    database = AsyncMock()
+    database.insert_many.side_effect = insert_many
+    ingest_buffer = IngestBuffer(database, max_size=1, batch_size=1, put_timeout=0.01)
+    await ingest_buffer.start()
+    entity = IPLocation(ip='127.0.0.1', latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
+
+    await ingest_buffer.put(entity)
+    await flush_started.wait()
+    await ingest_buffer.put(entity)
+    with pytest.raises(IPLocatorIngestBufferFullException):
+        await ingest_buffer.put(entity)
+
+    release_flush.set()
+    await ingest_buffer.stop()
+    assert database.insert_many.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_ingest_buffer_stop_drops_what_is_not_stored_in_time(fixed_timestamp_with_timezone):
+    async def insert_many(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    database = AsyncMock()
+    database.insert_many.side_effect = insert_many
+    ingest_buffer = IngestBuffer(database, batch_size=2, flush_interval=0, stop_timeout=0.05)
+    await ingest_buffer.start()
+    entity = IPLocation(ip='127.0.0.1', latitude=1.1, longitude=2.2, timestamp=fixed_timestamp_with_timezone)
+
+    for _ in range(3):
+        await ingest_buffer.put(entity)
+    await asyncio.wait_for(ingest_buffer.stop(), 1)
+
+    stats = ingest_buffer.stats()
+    assert (stats.flushed_rows, stats.dropped_rows, stats.queue_depth) == (0, 3, 0)
+    lines = render_metrics(REGISTRY.metrics()).splitlines()
+    assert 'ip_locator_ingest_buffer_rows_total{outcome="dropped"} 3' in lines
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import text
+
+from infrastructure.database.connector import DatabaseConnector
+from infrastructure.database.profiles import DatabaseProfile, DATABASE_PROFILES
+
+
+def test_profile_from_environment(monkeypatch):
+    monkeypatch.setenv('DATABASE_PROFILE', 'throughput')
+    monkeypatch.setenv('SQLITE_SYNCHRONOUS', 'FULL')
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '7')
+    monkeypatch.setenv('DATABASE_POOL_PRE_PING', 'false')
+
+    profile = DatabaseProfile.from_environment()
+
+    assert profile.journal_mode == 'WAL'
+    assert profile.synchronous == 'FULL'
+    assert profile.pool_size == 7
+    assert profile.pool_pre_ping is False
+
+
+def test_unknown_profile(monkeypatch):
+    monkeypatch.setenv('DATABASE_PROFILE', 'fastest')
+
+    with pytest.raises(EnvironmentError):
+        DatabaseProfile.from_environment()
+
+
+def test_postgresql_connect_args():
+    connect_args = DATABASE_PROFILES['throughput'].postgresql_connect_args()
+
+    assert connect_args == {'prepared_statement_cache_size': 500, 'server_settings': {'statement_timeout': '30000'}}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_profile_is_applied(tmp_sqlite_uri):
+    database = DatabaseConnector(tmp_sqlite_uri, DATABASE_PROFILES['throughput'])
+    try:
+        await database.warm_up()
+        warm_status = database.pool_status()
+        async with database.engine.connect() as connection:
+            journal_mode = (await connection.execute(text('PRAGMA journal_mode'))).scalar()
+            busy_timeout = (await connection.execute(text('PRAGMA busy_timeout'))).scalar()
+            busy_status = database.pool_status()
+    finally:
+        await database.engine.dispose()
+
+    assert journal_mode == 'wal'
+    assert busy_timeout == 5000
+    assert warm_status['checked_in'] == 5
+    assert busy_status['checked_out'] == 1
+    assert busy_status['saturation'] == 0.025
+
+
+@pytest.mark.asyncio
+async def test_pool_status_without_configured_max_overflow(tmp_sqlite_uri):
+    database = DatabaseConnector(tmp_sqlite_uri, DatabaseProfile(pool_size=2))
+    try:
+        async with database.engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+            status = database.pool_status()
+    finally:
+        await database.engine.dispose()
+
+    assert (status['size'], status['max_overflow'], status['checked_out']) == (2, 10, 1)
+    assert status['saturation'] == round(1 / 12, 3)
+
+
+def test_invalid_sqlite_pragma(tmp_sqlite_uri):
+    with pytest.raises(ValueError):
+        DatabaseConnector(tmp_sqlite_uri, DatabaseProfile(journal_mode='WAL; DROP TABLE ip_address'))
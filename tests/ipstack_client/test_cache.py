@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ipstack_client.cache import CachedLocationClient
+from ipstack_client.models import (
+    LocationResponse,
+    IPStackAPIClientError,
+    IPStackAPIClientTransientError,
+    IPStackCircuitOpenError,
+    IPStackRateLimitError,
+    IPStackQuotaExceededError,
+)
+
+
+@pytest.fixture
+def upstream_client(location):
+    client = AsyncMock()
+    client.get_location.return_value = location
+    return client
+
+
+@pytest.mark.asyncio
+async def test_get_location_is_cached(upstream_client, location):
+    cached_client = CachedLocationClient(upstream_client)
+
+    assert await cached_client.get_location('120.1.1.1') == location
+    assert await cached_client.get_location('120.1.1.1') == location
+
+    assert upstream_client.get_location.await_count == 1
+    stats = cached_client.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_get_location_expires(upstream_client):
+    cached_client = CachedLocationClient(upstream_client, ttl=0.01)
+
+    await cached_client.get_location('120.1.1.1')
+    await asyncio.sleep(0.02)
+    await cached_client.get_location('120.1.1.1')
+
+    assert upstream_client.get_location.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_location_evicts_least_recently_used(upstream_client):
+    cached_client = CachedLocationClient(upstream_client, max_size=2)
+
+    for host in ['1.1.1.1', '2.2.2.2', '1.1.1.1', '3.3.3.3', '1.1.1.1']:
+        await cached_client.get_location(host)
+
+    assert upstream_client.get_location.await_count == 3
+    assert cached_client.stats().evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_get_location_caches_errors(upstream_client):
+    upstream_client.get_location.side_effect = IPStackAPIClientError('Validation Error: invalid host')
+    cached_client = CachedLocationClient(upstream_client)
+
+    for _ in range(2):
+        with pytest.raises(IPStackAPIClientError):
+            await cached_client.get_location('120.1.1.1')
+
+    assert upstream_client.get_location.await_count == 1
+    assert cached_client.stats().negative_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_get_location_coalesces_concurrent_lookups():
+    upstream_calls = 0
+
+    async def get_location(host):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.01)
+        return LocationResponse(latitude=1.1, longitude=2.2)
+
+    upstream_client = AsyncMock()
+    upstream_client.get_location.side_effect = get_location
+    cached_client = CachedLocationClient(upstream_client)
+
+    locations = await asyncio.gather(*[cached_client.get_location('120.1.1.1') for _ in range(10)])
+
+    assert upstream_calls == 1
+    assert len(set(location.latitude for location in locations)) == 1
+    assert cached_client.stats().coalesced == 9
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'error',
+    [
+        IPStackAPIClientTransientError('Request Error: 503'),
+        IPStackCircuitOpenError('Request Error: ipstack circuit is open'),
+        IPStackRateLimitError('Request Error: no request slot'),
+        IPStackQuotaExceededError('Request Error: monthly quota used up'),
+    ],
+)
+async def test_transient_and_local_errors_are_not_cached(upstream_client, location, error):
+    upstream_client.get_location.side_effect = [error, location]
+    upstream_client.get_locations.side_effect = [{'120.1.1.2': error}, {'120.1.1.2': location}]
+    cached_client = CachedLocationClient(upstream_client)
+
+    with pytest.raises(type(error)):
+        await cached_client.get_location('120.1.1.1')
+    assert isinstance((await cached_client.get_locations(['120.1.1.2']))['120.1.1.2'], type(error))
+
+    assert await cached_client.get_location('120.1.1.1') == location
+    assert await cached_client.get_locations(['120.1.1.2']) == {'120.1.1.2': location}
+    assert cached_client.stats().negative_hits == 0
+
+
+@pytest.mark.asyncio
+async def test_get_locations_only_fetches_missing_hosts(location):
+    upstream_client = AsyncMock()
+    upstream_client.get_locations.side_effect = lambda hosts: {host: location for host in hosts}
+    cached_client = CachedLocationClient(upstream_client)
+
+    await cached_client.get_locations(['1.1.1.1', '2.2.2.2'])
+    locations = await cached_client.get_locations(['2.2.2.2', '3.3.3.3'])
+
+    assert locations == {'2.2.2.2': location, '3.3.3.3': location}
+    assert upstream_client.get_locations.await_args_list[1].args == (['3.3.3.3'],)
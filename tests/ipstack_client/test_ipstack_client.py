@@ -0,0 +1,72 @@
+import httpx
+import pytest
+
+from ipstack_client.ipstack_client import IPStackAPIClient, IPStackAPIClientError, LocationResponse
+
+
+def make_client(handler):
+    return IPStackAPIClient(baseurl='http://ipstack.test', access_key='secret', transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_get_location():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, json={'latitude': 1.1, 'longitude': 2.2})
+
+    client = make_client(handler)
+
+    location = await client.get_location('120.1.1.1')
+
+    assert location == LocationResponse(latitude=1.1, longitude=2.2)
+    assert requests[0].url.path == '/120.1.1.1'
+    assert requests[0].url.params['access_key'] == 'secret'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_get_location_http_error():
+    client = make_client(lambda request: httpx.Response(503))
+
+    with pytest.raises(IPStackAPIClientError):
+        await client.get_location('120.1.1.1')
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_get_location_invalid_response():
+    client = make_client(lambda request: httpx.Response(200, json={'success': False}))
+
+    with pytest.raises(IPStackAPIClientError):
+        await client.get_location('120.1.1.1')
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_get_locations_uses_bulk_endpoint():
+    paths = []
+
+    def handler(request: httpx.Request):
+        paths.append(request.url.path)
+        if ',' in request.url.path:
+            return httpx.Response(
+                200,
+                json=[
+                    {'ip': '1.1.1.1', 'latitude': 1.0, 'longitude': 1.0},
+                    {'ip': '2.2.2.2', 'latitude': None, 'longitude': None},
+                ],
+            )
+        return httpx.Response(200, json={'latitude': 3.0, 'longitude': 3.0})
+
+    client = make_client(handler)
+
+    locations = await client.get_locations(['1.1.1.1', '2.2.2.2', '3.3.3.3', 'somehost.com'])
+
+    assert locations['1.1.1.1'] == LocationResponse(latitude=1.0, longitude=1.0)
+    assert isinstance(locations['2.2.2.2'], IPStackAPIClientError)
+    assert isinstance(locations['3.3.3.3'], IPStackAPIClientError)
+    assert locations['somehost.com'] == LocationResponse(latitude=3.0, longitude=3.0)
+    assert sorted(paths) == ['/1.1.1.1,2.2.2.2,3.3.3.3', '/somehost.com']
+    await client.close()
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+from freezegun import freeze_time
+
+from benchmarks.ipstack_stub import create_stub_app
+from ipstack_client.ipstack_client import IPStackAPIClient
+from ipstack_client.models import IPStackRateLimitError, IPStackQuotaExceededError
+from ipstack_client.rate_limiter import RateLimiter, lookup_priority, INTERACTIVE, BULK
+
+
+@pytest.mark.asyncio
+async def test_requests_within_burst_are_not_queued():
+    rate_limiter = RateLimiter(rate=1, burst=3)
+
+    for _ in range(3):
+        await asyncio.wait_for(rate_limiter.acquire(), 0.01)
+
+    assert rate_limiter.stats().queued == 0
+
+
+@pytest.mark.asyncio
+async def test_requests_beyond_rate_wait():
+    rate_limiter = RateLimiter(rate=100, burst=1)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    await asyncio.gather(*(rate_limiter.acquire() for _ in range(6)))
+
+    assert loop.time() - start >= 0.045
+    stats = rate_limiter.stats()
+    assert (stats.granted, stats.queued) == (6, 5)
+
+
+@pytest.mark.asyncio
+async def test_interactive_requests_go_first():
+    rate_limiter = RateLimiter(rate=200, burst=1)
+    await rate_limiter.acquire()
+    order = []
+
+    async def acquire(name: str, priority: int):
+        with lookup_priority(priority):
+            await rate_limiter.acquire()
+        order.append(name)
+
+    bulk = [asyncio.create_task(acquire(f'bulk {i}', BULK)) for i in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(acquire('interactive', INTERACTIVE))
+    await asyncio.gather(*bulk, interactive)
+
+    assert order == ['interactive', 'bulk 0', 'bulk 1', 'bulk 2']
+
+
+@pytest.mark.asyncio
+async def test_waiting_is_limited():
+    rate_limiter = RateLimiter(rate=1, burst=1, max_waits={INTERACTIVE: 0.01})
+    await rate_limiter.acquire()
+
+    with pytest.raises(IPStackRateLimitError):
+        await rate_limiter.acquire()
+
+    stats = rate_limiter.stats()
+    assert stats.timed_out == 1
+    assert stats.max_wait_seconds['interactive'] >= 0.01
+    # a request that was not sent does not count against the quota
+    assert stats.monthly_used == 1
+
+
+@pytest.mark.asyncio
+async def test_monthly_quota():
+    rate_limiter = RateLimiter(rate=1000, monthly_quota=10)
+
+    with freeze_time(datetime(2024, 1, 31, 23, 59, tzinfo=timezone.utc)):
+        await rate_limiter.acquire(lookups=8)
+        with pytest.raises(IPStackQuotaExceededError):
+            await rate_limiter.acquire(lookups=3)
+        assert rate_limiter.stats().monthly_remaining == 2
+
+    with freeze_time(datetime(2024, 2, 1, tzinfo=timezone.utc)):
+        await rate_limiter.acquire(lookups=3)
+        assert rate_limiter.stats().monthly_remaining == 7
+
+
+@pytest.mark.asyncio
+async def test_monthly_quota_is_kept_in_the_database(mock_database):
+    month = datetime.now(timezone.utc).strftime('%Y-%m')
+    rate_limiter = RateLimiter(rate=1000, monthly_quota=10, quota_store=mock_database, quota_lease=4)
+
+    await rate_limiter.acquire(lookups=3)
+    assert await mock_database.select_quota_used(month) == 4
+    assert rate_limiter.stats().monthly_used == 3
+
+    # a restarted worker, or another one, goes on from the count in the database
+    restarted = RateLimiter(rate=1000, monthly_quota=10, quota_store=mock_database, quota_lease=4)
+    await restarted.acquire(lookups=5)
+    assert await mock_database.select_quota_used(month) == 9
+    with pytest.raises(IPStackQuotaExceededError):
+        await restarted.acquire(lookups=2)
+    # the last lookup of the month is leased on its own
+    await restarted.acquire()
+    assert await mock_database.select_quota_used(month) == 10
+    assert restarted.stats().monthly_remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_client_counts_bulk_lookups():
+    rate_limiter = RateLimiter(rate=1000, monthly_quota=100)
+    client = IPStackAPIClient(
+        baseurl='http://stub',
+        access_key='key',
+        transport=httpx.ASGITransport(app=create_stub_app()),
+        bulk_chunk_size=10,
+        rate_limiter=rate_limiter,
+    )
+
+    await client.get_locations([f'120.1.1.{i}' for i in range(25)])
+    await client.close()
+
+    stats = rate_limiter.stats()
+    assert (stats.granted, stats.monthly_used) == (3, 25)
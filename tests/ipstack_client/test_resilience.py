@@ -0,0 +1,234 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from benchmarks.ipstack_stub import create_stub_app
+from ipstack_client.ipstack_client import IPStackAPIClient
+from ipstack_client.models import (
+    IPStackAPIClientError,
+    IPStackAPIClientTransientError,
+    IPStackCircuitOpenError,
+    IPStackRateLimitError,
+    LocationResponse,
+)
+from ipstack_client.rate_limiter import RateLimiter, INTERACTIVE, BULK
+from ipstack_client.resilience import ResilientLocationClient, RetryBudget, CircuitBreaker
+
+
+def stub_client(**stub_settings) -> IPStackAPIClient:
+    return IPStackAPIClient(
+        baseurl='http://stub', access_key='key', transport=httpx.ASGITransport(app=create_stub_app(**stub_settings))
+    )
+
+
+@pytest.fixture
+def flaky_client(location):
+    client = AsyncMock()
+    client.get_location.side_effect = [IPStackAPIClientTransientError('503'), location]
+    return client
+
+
+@pytest.mark.asyncio
+async def test_transient_error_is_retried(flaky_client, location):
+    client = ResilientLocationClient(flaky_client, backoff=0.001)
+
+    assert await client.get_location('120.1.1.1') == location
+    assert flaky_client.get_location.await_count == 2
+    assert client.stats().retries == 1
+
+
+@pytest.mark.asyncio
+async def test_definite_error_is_not_retried():
+    upstream_client = AsyncMock()
+    upstream_client.get_location.side_effect = IPStackAPIClientError('invalid access key')
+    client = ResilientLocationClient(upstream_client, backoff=0.001)
+
+    with pytest.raises(IPStackAPIClientError):
+        await client.get_location('120.1.1.1')
+    assert upstream_client.get_location.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_are_limited_by_budget():
+    upstream_client = AsyncMock()
+    upstream_client.get_location.side_effect = IPStackAPIClientTransientError('503')
+    client = ResilientLocationClient(
+        upstream_client, backoff=0.001, retry_budget_ratio=0.0, retry_budget_reserve=2, failure_threshold=100
+    )
+
+    for _ in range(3):
+        with pytest.raises(IPStackAPIClientTransientError):
+            await client.get_location('120.1.1.1')
+
+    # the first lookup retries twice and uses up the reserve, the others are not retried
+    assert upstream_client.get_location.await_count == 5
+    assert client.stats().retries_denied == 2
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, reserve=1)
+
+    assert budget.withdraw(3) == 1
+    budget.deposit()
+    assert budget.withdraw() == 0
+    budget.deposit()
+    assert budget.withdraw() == 1
+
+
+@pytest.mark.asyncio
+async def test_attempt_timeout_against_slow_stub():
+    client = ResilientLocationClient(
+        stub_client(latency=1.0), attempt_timeout=0.05, total_timeout=0.2, backoff=0.001, failure_threshold=100
+    )
+
+    with pytest.raises(IPStackAPIClientTransientError):
+        await client.get_location('120.1.1.1')
+    await client.close()
+
+    stats = client.stats()
+    assert stats.timeouts == 3
+    assert stats.retries == 2
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_fails_fast():
+    upstream_client = AsyncMock()
+    upstream_client.get_location.side_effect = IPStackAPIClientTransientError('503')
+    client = ResilientLocationClient(upstream_client, max_attempts=1, failure_threshold=2, open_seconds=60)
+
+    for _ in range(2):
+        with pytest.raises(IPStackAPIClientTransientError):
+            await client.get_location('120.1.1.1')
+    with pytest.raises(IPStackCircuitOpenError):
+        await client.get_location('120.1.1.1')
+
+    assert upstream_client.get_location.await_count == 2
+    assert client.stats().circuit_state == 'open'
+    assert client.stats().rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=0.01)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    await asyncio.sleep(0.02)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+@pytest.mark.asyncio
+async def test_slow_attempt_is_hedged(location):
+    delays = [0.001] * 20 + [1.0, 0.001]
+
+    async def get_location(host):
+        await asyncio.sleep(delays.pop(0))
+        return location
+
+    upstream_client = AsyncMock()
+    upstream_client.get_location.side_effect = get_location
+    client = ResilientLocationClient(upstream_client, hedge_percentile=0.5, min_hedge_delay=0.005)
+    for _ in range(20):
+        await client.get_location('120.1.1.1')
+
+    assert await asyncio.wait_for(client.get_location('120.1.1.1'), 0.5) == location
+    assert (client.stats().hedges, client.stats().hedges_won) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_bulk_lookup_retries_failed_hosts():
+    upstream_client = AsyncMock()
+    location = LocationResponse(latitude=1.1, longitude=2.2)
+    upstream_client.get_locations.side_effect = [
+        {'1.1.1.1': location, '2.2.2.2': IPStackAPIClientTransientError('503')},
+        {'2.2.2.2': location},
+    ]
+    client = ResilientLocationClient(upstream_client, backoff=0.001)
+
+    results = await client.get_locations(['1.1.1.1', '2.2.2.2'])
+
+    assert results == {'1.1.1.1': location, '2.2.2.2': location}
+    assert upstream_client.get_locations.await_args_list[1].args == (['2.2.2.2'],)
+
+
+@pytest.mark.asyncio
+async def test_bulk_lookup_deadlines_apply_per_chunk():
+    upstream_client = IPStackAPIClient(
+        baseurl='http://stub',
+        access_key='key',
+        transport=httpx.ASGITransport(app=create_stub_app(latency=0.05)),
+        bulk_chunk_size=5,
+        bulk_concurrency=1,
+    )
+    # 8 chunks of 0.05 seconds each take twice the total timeout
+    client = ResilientLocationClient(
+        upstream_client, attempt_timeout=0.2, total_timeout=0.2, bulk_chunk_size=5, bulk_concurrency=1
+    )
+    hosts = [f'121.1.1.{i}' for i in range(40)]
+
+    results = await client.get_locations(hosts)
+
+    assert all(isinstance(results[host], LocationResponse) for host in hosts)
+    assert client.stats().timeouts == 0
+
+
+@pytest.mark.asyncio
+async def test_stub_errors_are_retried():
+    client = ResilientLocationClient(
+        stub_client(error_rate=0.5, seed=1),
+        backoff=0.001,
+        max_attempts=10,
+        retry_budget_reserve=100,
+        failure_threshold=100,
+    )
+
+    locations = [await client.get_location(f'120.1.1.{i}') for i in range(10)]
+    await client.close()
+
+    assert all(isinstance(location, LocationResponse) for location in locations)
+    assert client.stats().retries > 0
+
+
+def rate_limited_stub_client(max_wait: float) -> IPStackAPIClient:
+    return IPStackAPIClient(
+        baseurl='http://stub',
+        access_key='key',
+        transport=httpx.ASGITransport(app=create_stub_app()),
+        rate_limiter=RateLimiter(20.0, burst=1, max_waits={INTERACTIVE: max_wait, BULK: max_wait}),
+    )
+
+
+@pytest.mark.asyncio
+async def test_waiting_for_the_rate_limiter_does_not_count_against_deadlines():
+    client = ResilientLocationClient(
+        rate_limited_stub_client(max_wait=1.0), attempt_timeout=0.05, total_timeout=0.1, failure_threshold=1
+    )
+
+    # the last of the lookups waits about 0.2 seconds for its turn, longer than both deadlines
+    results = await asyncio.gather(*[client.get_location(f'120.1.1.{i}') for i in range(5)])
+    bulk_results = await client.get_locations([f'120.1.2.{i}' for i in range(5)])
+
+    assert all(isinstance(result, LocationResponse) for result in [*results, *bulk_results.values()])
+    stats = client.stats()
+    assert (stats.timeouts, stats.circuit_state) == (0, 'closed')
+
+
+@pytest.mark.asyncio
+async def test_saturated_rate_limiter_leaves_the_circuit_closed():
+    client = ResilientLocationClient(
+        rate_limited_stub_client(max_wait=0.05), attempt_timeout=1.0, failure_threshold=1, backoff=0.001
+    )
+
+    results = await asyncio.gather(*[client.get_location(f'120.1.1.{i}') for i in range(10)], return_exceptions=True)
+
+    assert any(isinstance(result, IPStackRateLimitError) for result in results)
+    assert all(isinstance(result, (LocationResponse, IPStackRateLimitError)) for result in results)
+    stats = client.stats()
+    assert (stats.timeouts, stats.circuit_opened, stats.circuit_state) == (0, 0, 'closed')
+    assert (await client.get_location('120.1.1.1')).latitude is not None
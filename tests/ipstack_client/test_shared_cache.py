@@ -0,0 +1,118 @@
+import asyncio
+import subprocess
+import sys
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ipstack_client.cache import CachedLocationClient
+from ipstack_client.models import LocationResponse, IPStackAPIClientError
+from ipstack_client.shared_cache import SharedLocationCache, SharedCacheLocationClient
+
+
+@pytest.fixture
+def shared_cache_path(tmp_path):
+    return str(tmp_path / 'shared_cache.db')
+
+
+def upstream_client(location):
+    client = AsyncMock()
+    client.get_location.return_value = location
+    client.get_locations.side_effect = lambda hosts: {host: location for host in hosts}
+    return client
+
+
+@pytest.mark.asyncio
+async def test_lookup_of_one_worker_is_a_hit_for_another(shared_cache_path, location):
+    first_upstream, second_upstream = upstream_client(location), upstream_client(location)
+    first_worker = CachedLocationClient(
+        SharedCacheLocationClient(first_upstream, SharedLocationCache(shared_cache_path))
+    )
+    second_worker = CachedLocationClient(
+        SharedCacheLocationClient(second_upstream, SharedLocationCache(shared_cache_path))
+    )
+
+    assert await first_worker.get_location('120.1.1.1') == location
+    assert await second_worker.get_location('120.1.1.1') == location
+
+    assert first_upstream.get_location.await_count == 1
+    second_upstream.get_location.assert_not_awaited()
+    assert second_worker.client.stats().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_written_by_another_process_are_read(shared_cache_path):
+    writer = (
+        'import asyncio\n'
+        'import sys\n'
+        'from ipstack_client.models import LocationResponse\n'
+        'from ipstack_client.shared_cache import SharedLocationCache\n'
+        'cache = SharedLocationCache(sys.argv[1])\n'
+        'asyncio.run(cache.put_many({"120.1.1.1": LocationResponse(latitude=1.5, longitude=2.5)}))\n'
+    )
+    subprocess.run([sys.executable, '-c', writer, shared_cache_path], check=True)
+
+    assert await SharedLocationCache(shared_cache_path).get_many(['120.1.1.1', '120.1.1.2']) == {
+        '120.1.1.1': LocationResponse(latitude=1.5, longitude=2.5)
+    }
+
+
+@pytest.mark.asyncio
+async def test_entries_expire(shared_cache_path, location):
+    cache = SharedLocationCache(shared_cache_path, ttl=0.01)
+
+    await cache.put_many({'120.1.1.1': location})
+    await asyncio.sleep(0.02)
+
+    assert await cache.get_many(['120.1.1.1']) == {}
+    assert (cache.stats().hits, cache.stats().misses) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_pruning_keeps_the_newest_entries(shared_cache_path, location):
+    cache = SharedLocationCache(shared_cache_path, max_entries=2, prune_interval=1)
+
+    for host in ['1.1.1.1', '2.2.2.2', '3.3.3.3']:
+        await cache.put_many({host: location})
+
+    # the pruning runs in the background, reads queue behind it
+    assert set(await cache.get_many(['1.1.1.1', '2.2.2.2', '3.3.3.3'])) == {'2.2.2.2', '3.3.3.3'}
+    stats = cache.stats()
+    assert (stats.size, stats.evictions) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_size_is_counted_across_processes_and_rewrites(shared_cache_path, location):
+    first, second = SharedLocationCache(shared_cache_path), SharedLocationCache(shared_cache_path)
+
+    await first.put_many({'1.1.1.1': location, '2.2.2.2': location})
+    await second.put_many({'2.2.2.2': location, '3.3.3.3': location})
+
+    assert second.stats().size == 3
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_get_locations_only_fetches_missing_hosts_and_shares_no_errors(shared_cache_path, location):
+    cache = SharedLocationCache(shared_cache_path)
+    await cache.put_many({'1.1.1.1': location})
+    upstream = AsyncMock()
+    upstream.get_locations.return_value = {'2.2.2.2': location, '3.3.3.3': IPStackAPIClientError('invalid')}
+    client = SharedCacheLocationClient(upstream, cache)
+
+    results = await client.get_locations(['1.1.1.1', '2.2.2.2', '3.3.3.3'])
+
+    upstream.get_locations.assert_awaited_once_with(['2.2.2.2', '3.3.3.3'])
+    assert results['1.1.1.1'] == results['2.2.2.2'] == location
+    assert isinstance(results['3.3.3.3'], IPStackAPIClientError)
+    assert set(await cache.get_many(['2.2.2.2', '3.3.3.3'])) == {'2.2.2.2'}
+
+
+@pytest.mark.asyncio
+async def test_unreadable_cache_falls_through_to_upstream(tmp_path, location):
+    upstream = upstream_client(location)
+    client = SharedCacheLocationClient(upstream, SharedLocationCache(str(tmp_path / 'missing' / 'shared_cache.db')))
+
+    assert await client.get_location('120.1.1.1') == location
+    assert client.stats().write_errors == 1
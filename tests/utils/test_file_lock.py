@@ -0,0 +1,25 @@
+import pytest
+
+from utils.file_lock import FileLock
+
+
+@pytest.mark.asyncio
+async def test_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / 'test.lock')
+    first, second = FileLock(path), FileLock(path)
+
+    assert await first.acquire(blocking=False)
+    assert not await second.acquire(blocking=False)
+    first.release()
+    assert await second.acquire(blocking=False)
+    second.release()
+
+
+@pytest.mark.asyncio
+async def test_context_manager_releases_the_lock(tmp_path):
+    path = str(tmp_path / 'test.lock')
+
+    async with FileLock(path) as lock:
+        assert lock.locked
+    assert not lock.locked
+    assert await FileLock(path).acquire(blocking=False)
@@ -0,0 +1,56 @@
+import asyncio
+import fcntl
+import os
+import tempfile
+
+
+def default_lock_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f'ip_locator.{name}.lock')
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by the processes of one host.
+
+    The lock is released when it is released explicitly or when the process holding it exits, so a crashed worker
+    never leaves it behind.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._file = None
+
+    @property
+    def locked(self) -> bool:
+        return self._file is not None
+
+    async def acquire(self, blocking: bool = True) -> bool:
+        """Takes the lock, waiting for it in a thread when `blocking`, otherwise returns False if it is taken."""
+        if self._file is not None:
+            return True
+        file = open(self._path, 'a')
+        try:
+            if blocking:
+                await asyncio.to_thread(fcntl.flock, file.fileno(), fcntl.LOCK_EX)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+        except BaseException:
+            file.close()
+            raise
+        self._file = file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    async def __aenter__(self) -> 'FileLock':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
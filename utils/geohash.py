@@ -0,0 +1,88 @@
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# ~5 m cells, fine enough to serve as the prefix of any coarser cell used by proximity searches
+GEOHASH_PRECISION = 9
+MAX_COVERING_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_LATITUDE_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    return _encode_cell(*_cell_index(latitude, longitude, precision), precision)
+
+
+def geohash_cell_size(precision: int) -> tuple[float, float]:
+    """Returns the height and width in degrees of the cells of `precision` characters."""
+    bits = 5 * precision
+    return 180 / (1 << (bits // 2)), 360 / (1 << ((bits + 1) // 2))
+
+
+def geohash_cells_covering(latitude: float, longitude: float, radius_km: float) -> list[str]:
+    """Returns geohash cells covering the circle of `radius_km` around a point.
+
+    The finest precision whose cells over the bounding box of the circle number at most `MAX_COVERING_CELLS`
+    is used, every stored geohash inside the circle starts with one of the returned cells.
+    """
+    latitude_delta = radius_km / KM_PER_LATITUDE_DEGREE
+    south, north = max(latitude - latitude_delta, -90.0), min(latitude + latitude_delta, 90.0)
+    widest = max(abs(south), abs(north))
+    if widest >= 90 or radius_km >= math.pi * EARTH_RADIUS_KM * math.cos(math.radians(widest)) / 2:
+        west, east = -180.0, 180.0
+    else:
+        longitude_delta = latitude_delta / math.cos(math.radians(widest))
+        west, east = longitude - longitude_delta, longitude + longitude_delta
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = range(_latitude_index(south, height), _latitude_index(north, height) + 1)
+        columns = range(math.floor((west + 180) / width), math.floor((east + 180) / width) + 1)
+        if len(rows) * len(columns) <= MAX_COVERING_CELLS or precision == 1:
+            break
+
+    # columns past the antimeridian wrap around
+    longitude_cells = round(360 / width)
+    return list(
+        dict.fromkeys(_encode_cell(row, column % longitude_cells, precision) for row in rows for column in columns)
+    )
+
+
+def geohash_prefix_range(prefix: str) -> tuple[str, str]:
+    """Returns the `[low, high)` string range of every geohash starting with `prefix`."""
+    return prefix, prefix + '~'
+
+
+def haversine_km(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude)
+    )
+    a = (
+        math.sin((other_latitude - latitude) / 2) ** 2
+        + math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _latitude_index(latitude: float, height: float) -> int:
+    # the north pole belongs to the northernmost row
+    return min(math.floor((latitude + 90) / height), round(180 / height) - 1)
+
+
+def _cell_index(latitude: float, longitude: float, precision: int) -> tuple[int, int]:
+    height, width = geohash_cell_size(precision)
+    return _latitude_index(latitude, height), math.floor((longitude + 180) / width) % round(360 / width)
+
+
+def _encode_cell(row: int, column: int, precision: int) -> str:
+    """Interleaves the longitude `column` and latitude `row` bits of a cell, longitude first, into a geohash."""
+    bits = 5 * precision
+    longitude_bits, latitude_bits = (bits + 1) // 2, bits // 2
+    value = 0
+    for i in range(bits):
+        if i % 2 == 0:
+            longitude_bits -= 1
+            value = (value << 1) | ((column >> longitude_bits) & 1)
+        else:
+            latitude_bits -= 1
+            value = (value << 1) | ((row >> latitude_bits) & 1)
+    return ''.join(GEOHASH_ALPHABET[(value >> shift) & 31] for shift in range(bits - 5, -1, -5))
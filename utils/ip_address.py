@@ -0,0 +1,40 @@
+import ipaddress
+
+IP_KEY_WIDTH = 16
+IPV4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+
+
+def parse_ip(value: str) -> ipaddress.IPv4Address | ipaddress.IPv6Address | None:
+    """Parses an IP address, IPv4-mapped IPv6 addresses as IPv4. Returns None for anything else."""
+    try:
+        address = ipaddress.ip_address(value.strip())
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+def normalize_ip(value: str) -> str:
+    """Returns the canonical spelling of an IP address, strings that are no IP address are returned unchanged."""
+    address = parse_ip(value)
+    return value if address is None else str(address)
+
+
+def address_to_key(address: ipaddress.IPv4Address | ipaddress.IPv6Address) -> bytes:
+    # IPv4 addresses are mapped into the IPv6 space, so keys of both families have the same width and order
+    if address.version == 4:
+        return IPV4_MAPPED_PREFIX + address.packed
+    return address.packed
+
+
+def ip_to_key(value: str) -> bytes | None:
+    """Returns the 16 byte big-endian key of an IP address, keys compare as bytes like the addresses do."""
+    address = parse_ip(value)
+    return None if address is None else address_to_key(address)
+
+
+def cidr_to_key_range(cidr: str) -> tuple[bytes, bytes]:
+    """Returns the first and last key of the addresses of a network. Raises ValueError for an invalid network."""
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    return address_to_key(network.network_address), address_to_key(network.broadcast_address)
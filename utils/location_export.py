@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import AsyncIterator, Sequence
+
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def encode_ndjson(rows: Sequence[tuple], key_field: str) -> bytes:
+    return ''.join(
+        json.dumps(
+            {
+                key_field: key,
+                'latitude': latitude,
+                'longitude': longitude,
+                'timestamp': timestamp.isoformat(),
+            }
+        )
+        + '\n'
+        for key, latitude, longitude, timestamp in rows
+    ).encode()
+
+
+def encode_csv(rows: Sequence[tuple], key_field: str, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow((key_field, 'latitude', 'longitude', 'timestamp'))
+    writer.writerows((key, latitude, longitude, timestamp.isoformat()) for key, latitude, longitude, timestamp in rows)
+    return buffer.getvalue().encode()
+
+
+async def encode_locations(
+    partitions: AsyncIterator[Sequence[tuple]], key_field: str, export_format: str, compress: bool = False
+) -> AsyncIterator[bytes]:
+    """Encodes batches of `(key, latitude, longitude, timestamp)` rows as NDJSON or CSV, batch by batch.
+
+    Timestamps are expected in UTC, as the location tables return them.
+
+    With `compress` the output is a gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def output(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor is not None else chunk
+
+    if export_format == 'csv':
+        yield output(encode_csv([], key_field, header=True))
+    async for rows in partitions:
+        if export_format == 'csv':
+            chunk = encode_csv(rows, key_field)
+        else:
+            chunk = encode_ndjson(rows, key_field)
+        if chunk := output(chunk):
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
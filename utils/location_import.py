@@ -0,0 +1,208 @@
+import asyncio
+import csv
+import ipaddress
+import json
+import zlib
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+
+from loguru import logger
+
+from model.base.ip_locator_exception import IPLocatorImportException
+from utils.utils import to_utc
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+MAX_LINE_LENGTH = 1024 * 1024
+# bytes a gzip stream is decompressed to at once, however well a chunk of it compresses
+MAX_DECOMPRESSED_CHUNK_SIZE = 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+@dataclass
+class LocationImportSummary:
+    imported: int = 0
+    failed: int = 0
+    # (line number, message) of the first MAX_REPORTED_ERRORS failed rows
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    # error that stopped the import, the rows counted before it are stored
+    aborted: str | None = None
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+async def decompress(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Passes a byte stream through, decompressing it on the fly if its magic bytes are those of gzip.
+
+    Decompressed chunks are at most MAX_DECOMPRESSED_CHUNK_SIZE bytes long.
+    """
+    decompressor = None
+    started = False
+    async for chunk in chunks:
+        if not started:
+            if not chunk:
+                continue
+            started = True
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(wbits=31)
+        if decompressor is None:
+            yield chunk
+            continue
+        while True:
+            try:
+                decompressed = decompressor.decompress(chunk, MAX_DECOMPRESSED_CHUNK_SIZE)
+            except zlib.error as error:
+                raise IPLocatorImportException(f'Invalid gzip stream: {error}')
+            chunk = decompressor.unconsumed_tail
+            if decompressed:
+                yield decompressed
+            # a full chunk may leave output behind even once all input is consumed
+            if not chunk and len(decompressed) < MAX_DECOMPRESSED_CHUNK_SIZE:
+                break
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[list[tuple[int, bytes]]]:
+    """Splits a byte stream into numbered lines, yielding the complete lines of every chunk.
+
+    A gzip stream is recognized by its magic bytes and decompressed on the fly.
+    """
+    pending = b''
+    line_number = 0
+    async for chunk in decompress(chunks):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        if len(pending) > MAX_LINE_LENGTH:
+            raise IPLocatorImportException(
+                f'Line {line_number + len(lines) + 1} is longer than {MAX_LINE_LENGTH} bytes'
+            )
+        if lines:
+            yield list(enumerate(lines, start=line_number + 1))
+            line_number += len(lines)
+    if pending:
+        yield [(line_number + 1, pending)]
+
+
+class LocationRowParser:
+    """Validates rows of a location table given as NDJSON objects or CSV records.
+
+    Valid rows are returned as `(key, latitude, longitude, timestamp)` tuples ordered like `row_fields` of the
+    location tables, with IPs normalized and timestamps converted to UTC.
+    """
+
+    def __init__(self, key_field: str, import_format: str) -> None:
+        self.key_field = key_field
+        self.import_format = import_format
+        self.fields = (key_field, 'latitude', 'longitude', 'timestamp')
+        self._csv_indexes = None
+
+    def parse(self, line: bytes) -> tuple | None:
+        """Returns the row of `line`, or None for a blank line or the CSV header. Raises ValueError if invalid."""
+        text = line.decode().strip()
+        if not text:
+            return None
+        if self.import_format == 'csv':
+            record = next(csv.reader([text]))
+            if self._csv_indexes is None:
+                self._read_header(record)
+                return None
+            if len(record) != len(self._csv_header):
+                raise ValueError(f'expected {len(self._csv_header)} columns, found {len(record)}')
+            values = [record[index] for index in self._csv_indexes]
+        else:
+            document = json.loads(text)
+            if not isinstance(document, dict):
+                raise ValueError('expected a JSON object')
+            missing = [name for name in self.fields if document.get(name) is None]
+            if missing:
+                raise ValueError(f'missing {", ".join(missing)}')
+            values = [document[name] for name in self.fields]
+        return self._validate(*values)
+
+    def _read_header(self, record: list[str]) -> None:
+        header = [name.strip() for name in record]
+        missing = [name for name in self.fields if name not in header]
+        if missing:
+            raise IPLocatorImportException(f'CSV header is missing {", ".join(missing)}')
+        self._csv_header = header
+        self._csv_indexes = [header.index(name) for name in self.fields]
+
+    def _validate(self, key, latitude, longitude, timestamp) -> tuple:
+        if not isinstance(key, str) or not key.strip():
+            raise ValueError(f'{self.key_field} must be a non-empty string')
+        key = key.strip()
+        if self.key_field == 'ip':
+            key = str(ipaddress.ip_address(key))
+        latitude = float(latitude)
+        longitude = float(longitude)
+        if not -90 <= latitude <= 90:
+            raise ValueError(f'latitude {latitude} out of range')
+        if not -180 <= longitude <= 180:
+            raise ValueError(f'longitude {longitude} out of range')
+        if not isinstance(timestamp, str):
+            raise ValueError('timestamp must be an ISO 8601 string')
+        return key, latitude, longitude, to_utc(datetime.fromisoformat(timestamp))
+
+
+async def import_locations(
+    database, table, chunks: AsyncIterator[bytes], import_format: str, batch_size: int = 5000
+) -> LocationImportSummary:
+    """Stores the locations of an NDJSON or CSV byte stream in `table`, `batch_size` rows per transaction.
+
+    Parsing the next batch overlaps with inserting the previous one, at most one batch is waiting to be stored.
+    Invalid rows and rows of failed batches are counted in the summary, the rest of the stream is still imported.
+    An error of the stream itself, such as a broken gzip stream or an overlong line, stops the import and is
+    recorded as `aborted` in the summary, the batches stored until then stay stored.
+    """
+    parser = LocationRowParser(table.key_field, import_format)
+    summary = LocationImportSummary()
+    pending_insert: asyncio.Task | None = None
+
+    async def insert(batch: list[tuple], first_line: int) -> None:
+        try:
+            await database.insert_many(table, batch, chunk_size=batch_size)
+            summary.imported += len(batch)
+        except Exception as error:
+            logger.error(f'Error while importing {len(batch)} {table.__tablename__} rows to database: {error}')
+            summary.failed += len(batch)
+            if len(summary.errors) < MAX_REPORTED_ERRORS:
+                summary.errors.append((first_line, f'Error while inserting {len(batch)} rows in database'))
+
+    async def flush(batch: list[tuple], first_line: int) -> None:
+        nonlocal pending_insert
+        if pending_insert is not None:
+            await pending_insert
+        pending_insert = asyncio.create_task(insert(batch, first_line))
+
+    batch = []
+    first_line = 0
+    try:
+        async for lines in iter_lines(chunks):
+            for line_number, line in lines:
+                try:
+                    row = parser.parse(line)
+                except (ValueError, TypeError, csv.Error) as error:
+                    summary.add_error(line_number, str(error))
+                    continue
+                if row is None:
+                    continue
+                if not batch:
+                    first_line = line_number
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    await flush(batch, first_line)
+                    batch = []
+        if batch:
+            await flush(batch, first_line)
+    except IPLocatorImportException as error:
+        summary.aborted = str(error)
+    finally:
+        if pending_insert is not None:
+            await pending_insert
+    return summary
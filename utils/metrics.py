@@ -0,0 +1,211 @@
+import math
+import time
+from bisect import bisect_left
+from collections.abc import Iterable
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ASGI scope of the request being handled, the router stores the matched route in it
+_request_scope: ContextVar[dict | None] = ContextVar('request_scope', default=None)
+
+
+class Metric:
+    """Samples of one metric family, keyed by the values of its labels.
+
+    Metrics are updated from the event loop thread without locking, an update is a few dictionary operations.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def samples(self) -> Iterable[tuple[str, dict[str, str], float]]:
+        for label_values, value in self._values.items():
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) - amount
+
+
+class Histogram(Metric):
+    """Counts observations per bucket, buckets are rendered cumulatively as Prometheus expects."""
+
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: count of every bucket and of +Inf, followed by the sum of all observations
+        self._histograms: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        histogram = self._histograms.get(label_values)
+        if histogram is None:
+            histogram = self._histograms[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def samples(self) -> Iterable[tuple[str, dict[str, str], float]]:
+        for label_values, histogram in self._histograms.items():
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), histogram):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': format_value(bound)}, cumulative
+            yield f'{self.name}_sum', labels, histogram[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+    def clear(self) -> None:
+        self._histograms.clear()
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def metrics(self) -> list[Metric]:
+        return list(self._metrics.values())
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def escape_label_value(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_metrics(metrics: Iterable[Metric]) -> str:
+    """Renders metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ','.join(f'{label}="{escape_label_value(value)}"' for label, value in labels.items())
+                lines.append(f'{name}{{{label_text}}} {format_value(value)}')
+            else:
+                lines.append(f'{name} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def set_request_scope(scope: dict | None):
+    return _request_scope.set(scope)
+
+
+def reset_request_scope(token) -> None:
+    _request_scope.reset(token)
+
+
+def current_route() -> str:
+    """Returns the path template of the route handling the current request, empty outside of requests."""
+    scope = _request_scope.get()
+    if scope is None:
+        return ''
+    route = scope.get('route')
+    return route.path if route is not None else 'unmatched'
+
+
+class stage:
+    """Times the enclosed block as `name` stage of the current route.
+
+    Usable around awaits, the block is timed from entering to leaving it, including the time spent waiting.
+    """
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> 'stage':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception) -> None:
+        STAGE_DURATION.observe(time.perf_counter() - self.start, current_route(), self.name)
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS_IN_FLIGHT = REGISTRY.gauge('ip_locator_requests_in_flight', 'HTTP requests being handled')
+REQUESTS_IN_FLIGHT.set(0)
+REQUESTS = REGISTRY.counter('ip_locator_requests_total', 'Handled HTTP requests', ('method', 'route', 'status'))
+REQUEST_DURATION = REGISTRY.histogram(
+    'ip_locator_request_duration_seconds', 'Time from receiving a request to sending its response', ('method', 'route')
+)
+STAGE_DURATION = REGISTRY.histogram(
+    'ip_locator_stage_duration_seconds', 'Time spent in a stage of handling a request', ('route', 'stage')
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'ip_locator_upstream_requests_total',
+    'Requests to upstream services by outcome, an HTTP status or the kind of error',
+    ('upstream', 'endpoint', 'outcome'),
+)
+UPSTREAM_DURATION = REGISTRY.histogram(
+    'ip_locator_upstream_request_duration_seconds',
+    'Duration of requests to upstream services',
+    ('upstream', 'endpoint'),
+)
+DATABASE_POOL_CHECKOUT_DURATION = REGISTRY.histogram(
+    'ip_locator_database_pool_checkout_seconds', 'Time waited for a database connection from the pool'
+)
@@ -1,11 +1,39 @@
+import os
 import urllib
+from datetime import datetime, timezone
 
 from model.base.ip_locator_exception import IPLocatorResolvingHostnameException
+from utils.metrics import stage
 
 
 def get_hostname_of_url(url: str):
     try:
-        hostname = urllib.parse.urlsplit(url).hostname
+        with stage('hostname'):
+            hostname = urllib.parse.urlsplit(url).hostname
     except Exception as error:
         raise IPLocatorResolvingHostnameException(f'Error resolving hostname: {error}')
     return hostname
+
+
+def get_int_environment_variable(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return default if value is None or value == '' else int(value)
+
+
+def get_float_environment_variable(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return default if value is None or value == '' else float(value)
+
+
+def get_bool_environment_variable(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def to_utc(timestamp: datetime) -> datetime:
+    """Converts `timestamp` to UTC, naive timestamps are taken as UTC already."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)